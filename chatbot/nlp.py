@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import spacy
-import sqlite3
+import threading
 import datefinder
 import datetime
 from datetime import timedelta
@@ -11,6 +11,7 @@ from fuzzywuzzy import fuzz
 from fuzzywuzzy import process
 from spellchecker import SpellChecker
 import re
+from data import stations
 
 __author__ = "Sam Humphreys"
 __credits__ = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
@@ -18,6 +19,93 @@ __maintainer__ = "Sam Humphreys"
 __email__ = "s.humphreys@uea.ac.uk"
 __status__ = "Prototype"  # "Development" "Prototype" "Production"
 
+book_ticket = ["book", "ticket", "travel", "go"]  # maybe get from db
+greetings = ["hi", "hello", "hey"]
+get_help = ["help", "assistance"]
+delays = ["delay", "late", "behind schedule"]
+cancellation = ["cancel", "cancellation"]
+changes = ["change", "alter"]
+confirm_yes = ["correct", "yes", "yep", "y"]
+confirm_no = ["incorrect", "no", "wrong", "nothing", "that is all"]
+reset = ["reset", "re do", "start again", "start over", "restart"]
+
+
+class Lexicon:
+    """Station lists and the phrase matchers compiled from them. Built in one go and never modified afterwards, so a
+    parse that picked up a Lexicon keeps a consistent view of it even while NlpContext.reload() swaps in a new one."""
+    def __init__(self, nlp):
+        directory = stations.get_directory()
+        self.station_names = directory.names
+        self.station_crs = directory.crs_codes
+        self.station_pairs = dict(zip(directory.names, directory.crs_codes))
+        self.station_locations = directory.counties
+        self.crs_pairs = directory.crs_to_name
+
+        self.known_words = self.station_crs + self.station_names
+        self.spell_checker = build_spell_checker(self.known_words)
+
+        # build patterns. Callbacks are not attached here since they need the state of a single parse, instead
+        # parse_user_input() dispatches on the match ids itself.
+        self.phrase_matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        self.phrase_matcher2 = PhraseMatcher(nlp.vocab, attr="LOWER")
+        self.phrase_matcher2.add("change", None, *[nlp.make_doc(text) for text in changes])
+        self.phrase_matcher2.add("cancel", None, *[nlp.make_doc(text) for text in cancellation])
+        self.phrase_matcher2.add("ticket", None, *[nlp.make_doc(text) for text in book_ticket])
+        self.phrase_matcher2.add("help", None, *[nlp.make_doc(text) for text in get_help])
+        self.phrase_matcher2.add("delay", None, *[nlp.make_doc(text) for text in delays])
+        self.phrase_matcher2.add("reset", None, *[nlp.make_doc(text) for text in reset])
+        self.phrase_matcher.add("station_names", None, *[nlp.make_doc(text) for text in self.station_names])
+        self.phrase_matcher.add("station_crs", None, *[nlp.make_doc(text) for text in self.station_crs])
+        self.phrase_matcher2.add("confirm_yes", None, *[nlp.make_doc(text) for text in confirm_yes])
+        self.phrase_matcher2.add("confirm_no", None, *[nlp.make_doc(text) for text in confirm_no])
+        self.phrase_matcher2.add("greeting", None, *[nlp.make_doc(text) for text in greetings])
+
+
+class NlpContext:
+    """Holds the loaded spaCy model and the current Lexicon so they are only built once per process rather than on
+    every message."""
+    def __init__(self, model="en_core_web_sm"):
+        self.nlp = spacy.load(model, disable=["ner"])
+        self._lock = threading.Lock()
+        self.lexicon = Lexicon(self.nlp)
+
+    def reload(self):
+        """Reloads the station directory and rebuilds the lexicon and matchers from it, e.g. after the stations table
+        has been changed. Parses already running carry on with the old lexicon, new parses pick up the new one once it
+        is complete.
+
+        :rtype: Lexicon
+        :return: The newly built lexicon
+        """
+        with self._lock:
+            stations.reload()
+            lexicon = Lexicon(self.nlp)
+            self.lexicon = lexicon
+        return lexicon
+
+
+__context = None
+__context_lock = threading.Lock()
+
+
+def get_context():
+    """Returns the process-wide NlpContext, building it on first use.
+
+    :rtype: NlpContext
+    :return: The shared NLP context
+    """
+    global __context
+    if __context is None:
+        with __context_lock:
+            if __context is None:
+                __context = NlpContext()
+    return __context
+
+
+def reload():
+    """Rebuilds the station lexicon of the shared NlpContext, call this when the stations table changes."""
+    get_context().reload()
+
 
 def parse_user_input(user_input):
     # variables
@@ -39,47 +127,12 @@ def parse_user_input(user_input):
         "sanitized_message": "",  # raw message after being sanitized
         "raw_message": ""  # raw message input by user for history etc
     }
-    station_names = []
-    station_crs = []
-    station_pairs = {}
-    station_locations = []
-    book_ticket = ["book", "ticket", "travel", "go"]  # maybe get from db
-    greetings = ["hi", "hello", "hey"]
-    get_help = ["help", "assistance"]
-    delays = ["delay", "late", "behind schedule"]
-    cancellation = ["cancel", "cancellation"]
-    changes = ["change", "alter"]
-    confirm_yes = ["correct", "yes", "yep", "y"]
-    confirm_no = ["incorrect", "no", "wrong", "nothing", "that is all"]
-    reset = ["reset", "re do", "start again", "start over", "restart"]
-
-    # populate lists from db
-    conn = sqlite3.connect(r'..\data\db.sqlite')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name,crs,county FROM stations WHERE NOT crs = 'none'")
-    rows = cursor.fetchall()
-    for row in rows:
-        station_names.append(row[0])
-        station_crs.append(row[1])
-        station_pairs[row[0]] = row[1]
-        if row[2] and row[2] not in station_locations:
-            station_locations.append(row[2])
-
-    nlp = spacy.load("en_core_web_sm", disable=["ner"])
-    phrase_matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
-    phrase_matcher2 = PhraseMatcher(nlp.vocab, attr="LOWER")
-    # build patterns
-    station_names_pattern = [nlp.make_doc(text) for text in station_names]
-    station_crs_pattern = [nlp.make_doc(text) for text in station_crs]
-    intents_cancel_pattern = [nlp.make_doc(text) for text in cancellation]
-    intents_change_pattern = [nlp.make_doc(text) for text in changes]
-    intents_ticket_pattern = [nlp.make_doc(text) for text in book_ticket]
-    intents_help_pattern = [nlp.make_doc(text) for text in get_help]
-    intents_delays_pattern = [nlp.make_doc(text) for text in delays]
-    confirm_yes_pattern = [nlp.make_doc(text) for text in confirm_yes]
-    confirm_no_pattern = [nlp.make_doc(text) for text in confirm_no]
-    is_greeting_pattern = [nlp.make_doc(text) for text in greetings]
-    reset_pattern = [nlp.make_doc(text) for text in reset]
+    context = get_context()
+    nlp = context.nlp
+    lexicon = context.lexicon  # hold on to one lexicon for the whole parse in case of a reload
+    station_names = lexicon.station_names
+    station_pairs = lexicon.station_pairs
+    station_locations = lexicon.station_locations
 
     # add match rules
     def on_match_intent(match_matcher, match_doc, match_id, match_matches):
@@ -137,16 +190,14 @@ def parse_user_input(user_input):
             prev_word = doc[matched_span_start - 1].text
         if matched_span_end < length_of_doc:
             next_word = doc[matched_span_end].text
-        for name, crs in station_pairs.items():
-            if crs == matched_station_crs:
-                matched_station_name = name
-                if processed_input['from_station'] == "" and prev_word == "from" or next_word == "to":
-                    processed_input["from_station"] = matched_station_name
-                    processed_input["from_crs"] = matched_station_crs
-                elif processed_input['to_station'] == "" and prev_word == "to" or next_word == "from":
-                    processed_input["to_station"] = matched_station_name
-                    processed_input["to_crs"] = matched_station_crs
-                break
+        if matched_station_crs in lexicon.crs_pairs:
+            matched_station_name = lexicon.crs_pairs[matched_station_crs]
+            if processed_input['from_station'] == "" and prev_word == "from" or next_word == "to":
+                processed_input["from_station"] = matched_station_name
+                processed_input["from_crs"] = matched_station_crs
+            elif processed_input['to_station'] == "" and prev_word == "to" or next_word == "from":
+                processed_input["to_station"] = matched_station_name
+                processed_input["to_crs"] = matched_station_crs
 
     def on_match_confirm_true(match_matcher, match_doc, match_id, match_matches):
         if processed_input['confirmation'] is not False:
@@ -160,18 +211,26 @@ def parse_user_input(user_input):
         else:
             processed_input['confirmation'] = ""
 
-    # add patterns
-    phrase_matcher2.add("change", on_match_intent, *intents_change_pattern)
-    phrase_matcher2.add("cancel", on_match_intent, *intents_cancel_pattern)
-    phrase_matcher2.add("ticket", on_match_intent, *intents_ticket_pattern)
-    phrase_matcher2.add("help", on_match_intent, *intents_help_pattern)
-    phrase_matcher2.add("delay", on_match_intent, *intents_delays_pattern)
-    phrase_matcher2.add("reset", on_match_reset, *reset_pattern)
-    phrase_matcher.add("station_names", on_match_station_name, *station_names_pattern)
-    phrase_matcher.add("station_crs", on_match_station_crs, *station_crs_pattern)
-    phrase_matcher2.add("confirm_yes", on_match_confirm_true, *confirm_yes_pattern)
-    phrase_matcher2.add("confirm_no", on_match_confirm_false, *confirm_no_pattern)
-    phrase_matcher2.add("greeting", on_match_greeting, *is_greeting_pattern)
+    # map match ids onto the callbacks for this parse
+    callbacks = {
+        "change": on_match_intent,
+        "cancel": on_match_intent,
+        "ticket": on_match_intent,
+        "help": on_match_intent,
+        "delay": on_match_intent,
+        "reset": on_match_reset,
+        "station_names": on_match_station_name,
+        "station_crs": on_match_station_crs,
+        "confirm_yes": on_match_confirm_true,
+        "confirm_no": on_match_confirm_false,
+        "greeting": on_match_greeting
+    }
+
+    def run_matcher(matcher, match_doc):
+        # same calling convention spaCy uses for on_match callbacks
+        matches = matcher(match_doc)
+        for i, match in enumerate(matches):
+            callbacks[nlp.vocab.strings[match[0]]](matcher, match_doc, i, matches)
 
     # find dates
     def match_dates():
@@ -289,12 +348,12 @@ def parse_user_input(user_input):
                 if current_token.i == (len(doc) - 1):    # early exit if entire string matched (prevent repeat)
                     break
 
-    corrected_input = sanitize_input(user_input, station_crs + station_names)
+    corrected_input = sanitize_input(user_input, lexicon.known_words, lexicon.spell_checker)
     doc = nlp(corrected_input)
     lemma_string = get_lemma_string(doc)
     doc2 = nlp(lemma_string)
-    phrase_matcher2(doc2)
-    phrase_matcher(doc)
+    run_matcher(lexicon.phrase_matcher2, doc2)
+    run_matcher(lexicon.phrase_matcher, doc)
     match_dates()
     processed_input['sanitized_message'] = corrected_input
     processed_input['raw_message'] = user_input
@@ -309,14 +368,28 @@ def get_lemma_string(spacy_doc):
     return lemma_string
 
 
-def check_spellings(raw_input, known_words=None):
+def build_spell_checker(known_words=None):
+    """Creates a SpellChecker which also knows the given words (e.g. station names)
+
+    :param list[str] known_words: words to add to the spell checker's dictionary
+    :rtype: SpellChecker
+    :return: spell checker ready for use by check_spellings
+    """
     if known_words is None:
         known_words = []
     spell = SpellChecker(distance=2)
-    known_lower = []
+    spell.word_frequency.load_words([word.lower() for word in known_words])
+    return spell
+
+
+def check_spellings(raw_input, known_words=None, spell=None):
+    if known_words is None:
+        known_words = []
+    if spell is None:
+        spell = build_spell_checker(known_words)
+    known_lower = set()
     for word in known_words:
-        known_lower.append(word.lower())
-    spell.word_frequency.load_words(known_lower)
+        known_lower.add(word.lower())
     corrected_user_input_string = str(raw_input)
     spelling_mistakes = spell.unknown(str(raw_input).split(" "))
     for mistake in spelling_mistakes:
@@ -331,10 +404,10 @@ def remove_punctuation(raw_input):
     return stripped_input
 
 
-def sanitize_input(raw_input, known_words=None):
+def sanitize_input(raw_input, known_words=None, spell=None):
     if known_words is None:
         known_words = []
     sanitized_input = remove_punctuation(raw_input)
     sanitized_input = sanitized_input.lower()
-    sanitized_input = check_spellings(sanitized_input, known_words)
+    sanitized_input = check_spellings(sanitized_input, known_words, spell)
     return sanitized_input
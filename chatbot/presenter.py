@@ -11,12 +11,18 @@ History : 02/01/2021 - v1.0 - Complete basic implementation.
           04/01/2021 - v1.1 - Moved to chatbot directory, renamed to presenter.py
           08/01/2021 - v1.2 - Added voice recognition facility.
           20/01/2021 - v1.3 - Changed implementation to socketio
+          18/10/2026 - v1.4 - Load the NLP context once at startup instead of on every message
+          18/10/2026 - v1.5 - Pass the user's sid through so each user has their own conversation
+          18/10/2026 - v1.6 - Added push_message() for results that arrive after the user's message was handled
+          18/10/2026 - v1.7 - Delay cache configured at startup
+          18/10/2026 - v1.8 - NLP context, network and models loaded in the background at startup, added /ready
 """
 import random
 
 from flask import Flask, render_template, request, jsonify, make_response
 import speech_recognition as sr
-from chatbot.nlp import parse_user_input
+from chatbot.nlp import parse_user_input, get_context
+from chatbot.prewarm import Prewarmer
 from flask_socketio import SocketIO, send, emit
 
 __author__ = "Sam Humphreys"
@@ -27,7 +33,27 @@ __status__ = "Development"  # "Development" "Prototype" "Production"
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = "iamasecretkey"  # I'll pretend I didn't see this.
+app.config['MAX_SESSIONS'] = 500  # conversations kept at once, least recently used is forgotten beyond this
+app.config['SESSION_IDLE_TIMEOUT'] = 1800  # seconds before an unused conversation is forgotten
+app.config['MAX_ENGINES'] = 8  # reasoning engines built, i.e. messages processed at the same time
+app.config['INCREMENTAL_FACTS'] = True  # False to reset the reasoning engine's facts on every message
+app.config['DIALOGUE_BACKEND'] = 'experta'  # 'flow' to run the conversation through model/dialogue_flow.py instead
+app.config['FARE_WORKERS'] = 4  # fare lookups run in the background at once, 0 to look them up while the user waits
+app.config['MAX_PENDING_FARES'] = 32  # fare lookups queued at once, past this they are done while the user waits
+app.config['FARE_CACHE'] = 'memory'  # 'sqlite' to keep cached fares in data/fare_cache.sqlite, 'none' to not cache
+app.config['FARE_CACHE_TTL'] = 900  # seconds a fare is cached for
+app.config['FARE_CACHE_SIZE'] = 512  # fares cached at once, least recently used is dropped beyond this
+app.config['FARE_TIME_BAND'] = 30  # minutes, searches within the same band of the day share a cached fare
+app.config['DELAY_CACHE_SIZE'] = 1024  # delay answers cached at once, least recently used is dropped beyond this
+app.config['DELAY_CACHE_TTL'] = 3600  # seconds a delay answer is cached for, answers are also dropped on retraining
+app.config['SCRAPER_POOL_SIZE'] = 4  # connections kept open to National Rail's site, one per fare worker
+app.config['SCRAPER_TIMEOUT'] = (5, 30)  # seconds to connect and to wait for a reply from National Rail's site
+app.config['SCRAPER_RETRIES'] = 3  # times a request is retried after a connection error or a 5xx response
+app.config['PREWARM'] = True  # False to load the NLP context before starting and everything else on first use
+app.config['PREWARM_NETWORK'] = 'ga_intercity'  # network whose models are loaded at startup
+app.config['PREWARM_MODELS'] = ['KNeighborsClassifier']  # types of model loaded at startup
 socketio = SocketIO(app)
+prewarmer = None  # loads everything the first messages need, started by run()
 
 
 @app.route("/")
@@ -35,6 +61,17 @@ def home():
     return render_template('interface.html')
 
 
+@app.route("/ready")
+def ready():
+    """Readiness check for a load balancer, only ready once everything has been loaded at startup
+
+    :returns: The startup status as JSON, with status code 200 if ready, else 503
+    """
+    status = prewarmer.status() if prewarmer is not None else {"state": "waiting", "current": None, "error": None,
+                                                                 "steps": []}
+    return make_response(jsonify(status), 200 if status["state"] == "ready" else 503)
+
+
 @app.route("/get_audio", methods=['POST'])
 def get_audio():
     """Gets audio data from the client to process into text
@@ -69,6 +106,15 @@ def send_list(message_to_send, list_to_send):
     emit('list', ({"passed_message": message_to_send, "passed_list": list_to_send}))
 
 
+def push_message(sid, bot_response):
+    """Sends a message to a user from outside of their request, e.g. from a background thread
+
+    :param str sid:          Socket.IO sid of the user
+    :param str bot_response: Message to send
+    """
+    socketio.emit('message', bot_response, room=sid)
+
+
 @socketio.on('connect')
 def user_connected():
     # do stuff here if we want a greeting message
@@ -90,7 +136,7 @@ def user_connected():
 def user_disconnected():
     from model.reasoning_engine import refresh_user_knowledge
     print("hello")
-    refresh_user_knowledge()
+    refresh_user_knowledge(request.sid)
 
 
 @socketio.on('message')
@@ -100,10 +146,36 @@ def receive_message(user_input):
     # send to NLP
     nlp_response = parse_user_input(user_input)
     # send to RE
-    process_user_input(nlp_response)
+    process_user_input(nlp_response, request.sid)
 
 
 def run():
+    global prewarmer
+    from model.reasoning_engine import configure_sessions, configure_fare_lookups
+    configure_sessions(app.config['MAX_SESSIONS'], app.config['SESSION_IDLE_TIMEOUT'], app.config['MAX_ENGINES'],
+                       app.config['INCREMENTAL_FACTS'], app.config['DIALOGUE_BACKEND'])
+    configure_fare_lookups(app.config['FARE_WORKERS'], app.config['MAX_PENDING_FARES'])
+    from model.scraper import configure_fare_cache, configure_http_client
+    configure_http_client(app.config['SCRAPER_POOL_SIZE'], app.config['SCRAPER_TIMEOUT'][0],
+                          app.config['SCRAPER_TIMEOUT'][1], app.config['SCRAPER_RETRIES'])
+    configure_fare_cache(app.config['FARE_CACHE'], app.config['FARE_CACHE_TTL'], app.config['FARE_CACHE_SIZE'],
+                         time_band=app.config['FARE_TIME_BAND'])
+    from data.process_data import configure_delay_cache
+    configure_delay_cache(app.config['DELAY_CACHE_SIZE'], app.config['DELAY_CACHE_TTL'])
+    from data import services
+    import model.prediction_model as prediction_model
+    network_name, model_names = app.config['PREWARM_NETWORK'], app.config['PREWARM_MODELS']
+    steps = [("NLP context", get_context)]  # spaCy model, matchers and station lexicon are shared by every message
+    if app.config['PREWARM']:
+        steps += [("network", lambda: services.get_network(network_name)),
+                  ("models", lambda: prediction_model.prewarm(services.get_network(network_name), model_names))]
+    prewarmer = Prewarmer(steps)
+    if app.config['PREWARM']:
+        print("Loading NLP context, network and models in the background, see /ready.")
+        prewarmer.start()
+    else:
+        print("Loading NLP context.")
+        prewarmer.run()
     socketio.run(app)
 
 
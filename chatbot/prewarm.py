@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Loads everything the first messages would otherwise wait for, in the background while the server starts
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : prewarm.py
+Date    : Sunday 18 October 2026
+Desc.   : A Prewarmer runs a list of named steps in turn on a thread of its own, printing each step as it finishes.
+          Its status says which steps are done, so the /ready route can tell a load balancer to wait until the last
+          step is.
+History : 18/10/2026 - v1.0 - Create project file, Prewarmer.
+"""
+import time
+import threading
+
+__author__ = "Sam Humphreys"
+__credits__ = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Sam Humphreys"
+__email__ = "s.humphreys@uea.ac.uk"
+__status__ = "Development"  # "Development" "Prototype" "Production"
+
+
+class Prewarmer:
+    """Runs named loading steps in order, once. The state is "waiting" until started, "loading" while the steps run,
+    then "ready" once every step is done, or "failed" if one raised, in which case the steps after it are not run."""
+    def __init__(self, steps):
+        """
+        :param list[tuple[str, function]] steps: Name of each step and a function taking no arguments to run for it
+        """
+        self.steps = list(steps)
+        self.state = "waiting"
+        self.current = None
+        self.error = None
+        self._seconds = {}  # step name: seconds it took, for the steps done so far
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Runs the steps on a daemon thread, so a slow step never holds up the server starting or stopping."""
+        with self._lock:
+            if self._thread is not None or self.state != "waiting":
+                return
+            self._thread = threading.Thread(target=self.run, name="prewarm", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        """Runs the steps on this thread, returning once they are done or one has failed."""
+        with self._lock:
+            if self.state != "waiting":  # already run, or running on another thread
+                return
+            self.state = "loading"
+        start = time.perf_counter()
+        try:
+            for i, (name, step) in enumerate(self.steps):
+                with self._lock:
+                    self.current = name
+                step_start = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:
+                    print("Prewarm step", name, "failed:", e)
+                    with self._lock:
+                        self.state = "failed"
+                        self.error = name + ": " + str(e)
+                    return
+                seconds = time.perf_counter() - step_start
+                with self._lock:
+                    self._seconds[name] = seconds
+                print("Prewarmed %s in %.1fs (%d of %d)" % (name, seconds, i + 1, len(self.steps)))
+            with self._lock:
+                self.state = "ready"
+                self.current = None
+            print("Prewarm finished in %.1fs." % (time.perf_counter() - start))
+        finally:
+            self._finished.set()
+
+    def is_ready(self):
+        return self.state == "ready"
+
+    def wait(self, timeout=None):
+        """Blocks until the steps are done or one has failed.
+
+        :param float timeout: Most seconds to wait, None to wait as long as it takes
+        :rtype: bool
+        :return: True if every step is done
+        """
+        self._finished.wait(timeout)
+        return self.is_ready()
+
+    def status(self):
+        """
+        :rtype: dict
+        :return: The state, the step being run, the error of a failed step, and for each step whether it is done and
+                 the seconds it took
+        """
+        with self._lock:
+            return {"state": self.state, "current": self.current, "error": self.error,
+                    "steps": [{"name": name, "done": name in self._seconds, "seconds": self._seconds.get(name)}
+                              for name, _ in self.steps]}
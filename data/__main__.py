@@ -6,24 +6,26 @@ import data.process_data
 import argparse
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument("table", help="name of the table to insert scraped data into")
-parser.add_argument("--darwin", help="scrape from DARWIN data (a51 or rdg files)", action="store_true")
-parser.add_argument("--hsp", help="scrape from HSP data (hsp files)", action="store_true")
-
-
-args = parser.parse_args()
-table = args.table
-
-if args.darwin:
-    print("Attempting to load DARWIN data from scraped folder and insert into", table, "table on database db")
-    data.process_data.raw(table, "DARWIN")
-elif args.hsp:
-    print("Attempting to load HSP data from scraped folder and insert into", table, "table on database db")
-    data.process_data.raw(table, "HSP")
-else:
-    print("Data source --darwin or --hsp must be specified.")
-
-
-
-
+if __name__ == "__main__":  # worker processes import this module again on platforms which spawn them
+    parser = argparse.ArgumentParser()
+    parser.add_argument("table", help="name of the table to insert scraped data into")
+    parser.add_argument("--darwin", help="scrape from DARWIN data (a51 or rdg files)", action="store_true")
+    parser.add_argument("--hsp", help="scrape from HSP data (hsp files)", action="store_true")
+    parser.add_argument("--rows", help="transform one row at a time instead of a column at a time", action="store_true")
+    parser.add_argument("--workers", help="number of processes to read files in (default 1)", type=int, default=1)
+    parser.add_argument("--bulk", help="load in WAL mode, indexing the table once every file is written",
+                        action="store_true")
+
+    args = parser.parse_args()
+    table = args.table
+
+    if args.darwin:
+        print("Attempting to load DARWIN data from scraped folder and insert into", table, "table on database db")
+        data.process_data.raw(table, "DARWIN", columnar=not args.rows, workers=args.workers,
+                              bulk=args.bulk)
+    elif args.hsp:
+        print("Attempting to load HSP data from scraped folder and insert into", table, "table on database db")
+        data.process_data.raw(table, "HSP", columnar=not args.rows, workers=args.workers,
+                              bulk=args.bulk)
+    else:
+        print("Data source --darwin or --hsp must be specified.")
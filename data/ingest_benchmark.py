@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compares how many CSV rows per second process_data can turn into records, one row at a time or as columns
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : ingest_benchmark.py
+Date    : Sunday 18 October 2026
+Desc.   : Reads a DARWIN CSV the way process_data.raw() does, then times transform_rows() and transform_columns() on
+          it and checks both give the same records. The records are then written to scratch databases with the
+          default and bulk load settings, timing the inserts and the queries the model trainers make afterwards.
+          Nothing is written to the db. Run with python -m data.ingest_benchmark [file] from the project root.
+History : 18/10/2026 - v1.0 - Create project file.
+          18/10/2026 - v1.1 - Reads the file through the streaming DARWIN reader.
+          18/10/2026 - v1.2 - Added compare_writes().
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+
+import data.process_data as process
+from data import services
+
+__author__     = "Martin Siddons"
+__credits__    = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Martin Siddons"
+__email__      = "m.siddons@uea.ac.uk"
+__status__     = "Prototype"  # "Development" "Prototype" "Production"
+
+
+def compare(file, network, repeats=3):
+    """
+    :param str file:                 DARWIN CSV to read
+    :param services.Network network: Network the rows' stations are on
+    :param int repeats:              Number of times to time each transform, the fastest time is kept
+    :rtype: tuple[int, float, float, bool, list]
+    :return: Rows read, rows per second for transform_rows() and transform_columns(), whether they agree, and the
+             records
+    """
+    runs = process.__read_darwin_runs(file, network.get_all_stations())
+    csv_data = [row for run in runs for row in run] + [[None, None]]  # the whole file as one chunk
+    results = {}
+    for transform in [process.transform_rows, process.transform_columns]:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            records = transform(csv_data, network)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[transform.__name__] = (len(csv_data) - 1) / best, records
+    rows_speed, rows_records = results["transform_rows"]
+    columns_speed, columns_records = results["transform_columns"]
+    return len(csv_data) - 1, rows_speed, columns_speed, rows_records == columns_records, columns_records
+
+
+def compare_writes(records, files=20):
+    """Writes the records once for each of a number of files, first as raw() did before the bulk profile, one
+    connection per file with the default settings and no index, then as raw(bulk=True) does.
+
+    :param list records: Records as returned by process_data.transform_columns()
+    :param int files:    Number of times to write the records, each time as a different file
+    :rtype: dict
+    :return: For "default" and "bulk", records written per second, including building the index for "bulk", and the
+             mean seconds taken by the query the model trainers make for each pair of stations
+    """
+    write_to_db = process.__write_to_db
+    routes = sorted({(record[0], record[1]) for record in records})
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for profile in ["default", "bulk"]:
+            path = os.path.join(folder, profile + ".sqlite")
+            start = time.perf_counter()
+            conn = None
+            if profile == "bulk":
+                conn = sqlite3.connect(path)
+                process.__bulk_profile(conn)
+            for n in range(files):
+                file_conn = conn if conn is not None else sqlite3.connect(path)
+                write_to_db("dataset", [records], ("%064x" % n, "file%d.csv" % n), file_conn)
+                if conn is None:
+                    file_conn.close()
+            if conn is not None:
+                process.create_index("dataset", conn)
+                conn.close()
+            write_speed = len(records) * files / (time.perf_counter() - start)
+
+            conn = sqlite3.connect(path)
+            start = time.perf_counter()
+            for tpl_from, tpl_to in routes:
+                conn.execute(""" SELECT * FROM dataset WHERE tpl_from=? AND tpl_to=? AND delay_change<=5 
+                                 AND delay_change>=-5 """, (tpl_from, tpl_to)).fetchall()
+            query_time = (time.perf_counter() - start) / len(routes)
+            conn.close()
+            results[profile] = write_speed, query_time
+    return results
+
+
+if __name__ == "__main__":
+    default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraped", "processed", "scraped0.csv")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", default=default, help="DARWIN CSV to read")
+    parser.add_argument("--network", default="ga_intercity", help="name of the network the file's stations are on")
+    args = parser.parse_args()
+
+    rows, rows_speed, columns_speed, same, records = compare(args.file, services.get_network(args.network))
+    print(rows, "rows")
+    print("rows    %8.0f rows/s" % rows_speed)
+    print("columns %8.0f rows/s" % columns_speed)
+    print("speed up: %.1fx" % (columns_speed / rows_speed))
+    print("same records: " + str(same))
+
+    writes = compare_writes(records)
+    for profile, (write_speed, query_time) in writes.items():
+        print("%-7s %8.0f records/s written, %6.1f ms per training query" % (profile, write_speed, query_time * 1000))
@@ -9,16 +9,36 @@ Date    : Tuesday 05 January 2021
 History : 05/01/2020 - v1.0 - Create project file
           12/01/2020 - v1.2 - Completed all functions to load DARWIN data from CSV and save to db
           20/01/2020 - v1.3 - Wrote function to handle HSP data from scraper
+          18/10/2026 - v1.4 - HSP CRS codes are resolved through the station directory
+          18/10/2026 - v1.5 - CRS to TIPLOC map loaded once per run, unknown CRS codes and rows/s reported per file
+          18/10/2026 - v1.6 - Added transform_columns(), raw() transforms each file as numpy columns by default
+          18/10/2026 - v1.7 - raw() can transform files in a pool of processes, each file moved once it is committed
+          18/10/2026 - v1.8 - Each file written in one transaction and recorded in the ingest_manifest table, files
+                              already ingested are skipped
+          18/10/2026 - v1.9 - Files read a train at a time by generators, transformed and written in chunks
+          18/10/2026 - v2.0 - Added bulk load profile and create_index(), tables indexed for the model trainers
+          18/10/2026 - v2.1 - user_to_query predicts the whole journey with one call to the model
+          18/10/2026 - v2.2 - Added a cache of user_to_query's answers, cleared when models are stored
+          18/10/2026 - v2.3 - Delay cache cleared when get_network hands out a network loaded again
+          18/10/2026 - v2.4 - Delay cache cleared when the delay tables are written again
 
 """
 import os
 import glob
 import csv
+import time
+import hashlib
+import pickle
+from collections import Counter
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
-from data import services
+from data import services, stations
 import re
 import sqlite3
+import numpy as np
 import model.prediction_model as model
+from model.cache import MemoryCache
 
 __author__     = "Martin Siddons"
 __credits__    = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
@@ -26,6 +46,9 @@ __maintainer__ = "Martin Siddons"
 __email__      = "m.siddons@uea.ac.uk"
 __status__     = "Development"  # "Development" "Prototype" "Production"
 
+delay_cache = MemoryCache(max_size=1024, ttl=3600)  # answers of user_to_query(), None to not cache
+__delay_cache_source = None  # network and time the delay tables were written, of the cached answers
+
 """
 DARWIN data key columns to transform:
 rid:     Train RTTI ID(Real-Time Trains Information Identifier), the date (YYYYMMDD) and a unique ID for that journey
@@ -42,126 +65,430 @@ dep_at:  Actual Time of Departure, the time the train actually departed the stat
 """
 
 
-def raw(table, data_source):
+def raw(table, data_source, columnar=True, workers=1, chunk_rows=50000, bulk=False):
     r"""Pull data from csv files, process for model and save to given table in given db
 
-    Files are taken from \data\scraped and processed, then after writing are moved to \data\scraped\processed.
+    Files are taken from \data\scraped and processed, then each is moved to \data\scraped\processed once its records
+    have been committed. A file's records are written in one transaction along with a row in the ingest_manifest
+    table, so a file is either in the table completely or not at all, and a file whose contents are already recorded
+    against the table is skipped. Running this again after a failure only reads the files not yet written.
+    Files are read a train at a time and transformed and written in chunks of whole trains, so memory use does not
+    grow with the size of a file. With more than one worker, files are read and transformed in separate processes,
+    which save their records to a .records file beside the CSV for this process to write to the db.
+    The (tpl_from, tpl_to, delay_change) index the model trainers search by is built once every file is written. For
+    a bulk load, the index is dropped first so that inserts do not have to keep it up to date, and every file is
+    written over one connection with the db in WAL mode.
     :
     :param str data_source: Either "DARWIN" (a51/rdg) or "HSP" depending on data source.
     :param str table:       Table in DB to insert data into (will be created if it doesn't already exist)
+    :param bool columnar:   True to transform each file with transform_columns(), False for transform_rows()
+    :param int workers:     Number of processes to read and transform files in, 1 to do everything in this process
+    :param int chunk_rows:  Rows to transform and write at a time
+    :param bool bulk:       True to load with the bulk profile described above
     :raises sqlite3.Error:  If script can not connect to db
     """
+    if data_source not in ("DARWIN", "HSP"):
+        print(data_source, "is not a valid data source. Currently reading only HSP and DARWIN formatted data.")
+        return
+    if workers < 1 or chunk_rows < 1:
+        raise ValueError("workers and chunk_rows must be at least 1")
     network = services.get_network("ga_intercity")
-    valid_tpl = network.get_all_stations()  # only get data for stations in the network
-    os.chdir(r".\data\scraped")
-    for file in glob.glob("*.csv"):
-        if data_source == "DARWIN":
-            csv_data = __read_darwin_from_csv(file, valid_tpl)
-        elif data_source == "HSP":
-            csv_data = __read_hsp_from_csv(file, valid_tpl)
+    crs_to_tpl = stations.get_directory().crs_to_tpl if data_source == "HSP" else None  # once for every file
+    scraped = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraped")
+    for spill in glob.glob(os.path.join(scraped, "*.records")):  # left by a run which was stopped part way
+        os.remove(spill)
+    files = sorted(glob.glob(os.path.join(scraped, "*.csv")))
+    ingested = ingested_hashes(table)
+
+    conn = None
+    if bulk:
+        conn = __connect_to_db(bulk=True)
+        conn.execute(""" DROP INDEX IF EXISTS {}_route """.format(table))
+    try:
+        if workers == 1:
+            __init_worker(network, crs_to_tpl)
+            for file in files:
+                digest = file_hash(file)
+                chunks = None if digest in ingested else __record_chunks(file, data_source, columnar, chunk_rows)
+                __write_file(table, file, digest, chunks, 0, conn)
         else:
-            print(data_source, "is not a valid data source. Currently reading only HSP and DARWIN formatted data.")
+            __load_in_pool(table, files, data_source, columnar, workers, chunk_rows, ingested, network, crs_to_tpl,
+                           conn)
+    finally:
+        start = time.perf_counter()
+        if create_index(table, conn):
+            print("indexed", table, "in {:.1f}s".format(time.perf_counter() - start))
+        if conn is not None:
+            conn.close()
+
+
+def __load_in_pool(table, files, data_source, columnar, workers, chunk_rows, ingested, network, crs_to_tpl, conn):
+    # files are read and transformed by the pool while this process writes each one as it is finished
+    with ProcessPoolExecutor(max_workers=workers, initializer=__init_worker, initargs=(network, crs_to_tpl)) as pool:
+        pending = set()
+        files = iter(files)
+        while True:
+            # keep a few files ahead of the writer, so finished files do not pile up on disk waiting to be written
+            for file in files:
+                pending.add(pool.submit(__spill_file, file, data_source, columnar, chunk_rows, ingested))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file, digest, spill, elapsed = future.result()
+                try:
+                    __write_file(table, file, digest, __read_spill(spill) if spill else None, elapsed, conn)
+                finally:
+                    if spill:
+                        os.remove(spill)
+
+
+__worker_network = None     # network the files are transformed for, set in each worker by __init_worker
+__worker_crs_to_tpl = None  # CRS code: TIPLOC code for HSP files
+
+
+def __init_worker(network, crs_to_tpl):
+    global __worker_network, __worker_crs_to_tpl
+    __worker_network = network
+    __worker_crs_to_tpl = crs_to_tpl
+
+
+def __record_chunks(file, data_source, columnar, chunk_rows):
+    """Reads and transforms one file a chunk at a time.
+
+    :param str file:        Path of the CSV to read
+    :param str data_source: Either "DARWIN" or "HSP"
+    :param bool columnar:   True to use transform_columns(), False for transform_rows()
+    :param int chunk_rows:  Rows to transform at a time
+
+    :rtype: Iterator[list[list[str, str, int, int, int, int, int, int]]]
+    :return: Records of the file, a chunk at a time
+    """
+    valid_tpl = __worker_network.get_all_stations()  # only get data for stations in the network
+    if data_source == "DARWIN":
+        runs = __read_darwin_runs(file, valid_tpl)
+    else:
+        runs = __read_hsp_runs(file, valid_tpl, __worker_crs_to_tpl)
+    # could add weather data here
+
+    transform = transform_columns if columnar else transform_rows
+    for csv_data in __chunk_runs(runs, chunk_rows):
+        yield transform(csv_data, __worker_network)
+
+
+def __spill_file(file, data_source, columnar, chunk_rows, ingested):
+    """Reads and transforms one file into a .records file beside it, run in a worker process when raw() has more than
+    one worker.
+
+    :param str file:        Path of the CSV to read
+    :param str data_source: Either "DARWIN" or "HSP"
+    :param bool columnar:   True to use transform_columns(), False for transform_rows()
+    :param int chunk_rows:  Rows to transform at a time
+    :param set ingested:    Hashes of files already written to the table
+
+    :rtype: tuple[str, str, str, float]
+    :return: The file, a hash of its contents, the .records file or None if it has already been written, and the
+             seconds taken
+    """
+    start = time.perf_counter()
+    digest = file_hash(file)
+    if digest in ingested:
+        return file, digest, None, time.perf_counter() - start
+    spill = file + ".records"
+    with open(spill, "wb") as spill_file:
+        for records in __record_chunks(file, data_source, columnar, chunk_rows):
+            pickle.dump(records, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+    return file, digest, spill, time.perf_counter() - start
+
+
+def __read_spill(spill):
+    # chunks of records in the order __spill_file saved them
+    with open(spill, "rb") as spill_file:
+        while True:
+            try:
+                yield pickle.load(spill_file)
+            except EOFError:
+                return
+
+
+def __write_file(table, file, digest, chunks, elapsed, conn=None):
+    # write a file's records then move it into processed, leaving it to be read again if the write failed
+    name = os.path.basename(file)
+    start = time.perf_counter()
+    written = None
+    if chunks is not None:
+        written = __write_to_db(table, chunks, (digest, name), conn)
+        if written is None:
+            print("could not write entries from file", name, "- left in place")
             return
-        # could add weather data here
-
-        train_data = []
-        prev_delay = 0  # track what the delay was at the last station
-        for i in range(0, len(csv_data)-1):  # skip the final row since it is None
-            entry = csv_data[i]
-            source, date, delay = entry_to_query(entry)
-            delay_change = delay - prev_delay
-
-            next_entry = csv_data[i + 1]
-            if entry[0] != next_entry[0]:  # if we're on the last station (rid code change) process with no destination
-                prev_delay = 0  # ready for the next rid
-                stn_from   = stn_to = network.get_station(source)
-            else:
-                # print(entry[0])
-                prev_delay = delay
-                dest       = next_entry[1]
-                path       = network.find_path(source, dest)
-                stn_from   = path[0]
-                stn_to     = path[1]
-
-            processed_entry = query_to_input(stn_from, stn_to, date)
-            processed_entry.append(delay)
-            processed_entry.append(delay_change)
-            # Might want to look for cancelled trains then add missing stops here, then process rid in one go.
-            train_data.append(processed_entry)
-
-        os.chdir(r"..")
-        written = __write_to_db(table, train_data)
-        os.chdir(r".\scraped")
-        print("processed", written, "entries in file", file)
-
-    # move all the files into \processed\ as a batch. This breaks if done on each iteration of previous loop instead.
-    for file in glob.glob("*.csv"):
-        path = os.path.dirname(os.path.abspath(__file__))
-        os.replace(r"{}\scraped\{}".format(path, file), r"{}\scraped\processed\{}".format(path, file))
-
-
-def __read_darwin_from_csv(file, valid_tpl):
-    """Reads the provided DARWIN data CSV file and removes unneeded columns and rows.
+    os.replace(file, os.path.join(os.path.dirname(file), "processed", name))
+    if written is None or written < 0:  # the manifest already held the file
+        print("skipped file", name, "- already written to", table)
+        return
+    elapsed += time.perf_counter() - start
+    print("processed", written, "entries in file", name,
+          "({:.0f} rows/s)".format(written / elapsed if elapsed > 0 else 0))
+
+
+def file_hash(file):
+    """
+    :param str file: Path of the file to hash
+    :rtype: str
+    :return: SHA-256 of the file's contents in hex, which identifies the file in the ingest_manifest table
+    """
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ingested_hashes(table):
+    """
+    :param str table: Table the files were written to
+    :rtype: set[str]
+    :return: Hashes of the files whose records have been committed to the table
+    """
+    conn = __connect_to_db()
+    try:
+        __create_manifest(conn)
+        rows = conn.execute(""" SELECT hash FROM ingest_manifest WHERE table_name=? AND status='committed' """,
+                            (table,)).fetchall()
+    except sqlite3.Error as e:
+        print(e)
+        return set()
+    finally:
+        conn.close()
+    return {row[0] for row in rows}
+
+
+def __create_manifest(conn):
+    # one row per file written to each table, status is 'committed' once its records are in, else 'failed'
+    conn.execute(""" CREATE TABLE IF NOT EXISTS ingest_manifest (hash text, table_name text, file text, 
+    rows integer, status text, ingested_at text, PRIMARY KEY (hash, table_name));""")
+
+
+def transform_rows(csv_data, network):
+    """Turns rows read from a CSV into records for the db, one row at a time.
+
+    :param list[list[str]] csv_data: Rows of whole runs of trains, followed by a [None, None] row
+    :param services.Network network: Network the rows' stations are on
+
+    :rtype: list[list[str, str, int, int, int, int, int, int]]
+    :return: Records of form [source, destination, day_of_week, weekday, off_peak, hour_of_day, delay, delay_change]
+    """
+    train_data = []
+    prev_delay = 0  # track what the delay was at the last station
+    for i in range(0, len(csv_data)-1):  # skip the final row since it is None
+        entry = csv_data[i]
+        source, date, delay = entry_to_query(entry)
+        delay_change = delay - prev_delay
+
+        next_entry = csv_data[i + 1]
+        if entry[0] != next_entry[0]:  # if we're on the last station (rid code change) process with no destination
+            prev_delay = 0  # ready for the next rid
+            stn_from   = stn_to = network.get_station(source)
+        else:
+            # print(entry[0])
+            prev_delay = delay
+            dest       = next_entry[1]
+            path       = network.find_path(source, dest)
+            stn_from   = path[0]
+            stn_to     = path[1]
+
+        processed_entry = query_to_input(stn_from, stn_to, date)
+        processed_entry.append(delay)
+        processed_entry.append(delay_change)
+        # Might want to look for cancelled trains then add missing stops here, then process rid in one go.
+        train_data.append(processed_entry)
+    return train_data
+
+
+def transform_columns(csv_data, network):
+    """Turns rows read from a CSV into records for the db, giving the same records as transform_rows() but working on
+    whole columns at once. Rids, times and pairs of stations repeat a lot, so each distinct value is parsed once in
+    the same way entry_to_query() and query_to_input() parse it, and the results are spread back over the rows.
+
+    :param list[list[str]] csv_data: Rows of whole runs of trains, followed by a [None, None] row
+    :param services.Network network: Network the rows' stations are on
+
+    :rtype: list[list[str, str, int, int, int, int, int, int]]
+    :return: Records of form [source, destination, day_of_week, weekday, off_peak, hour_of_day, delay, delay_change]
+    """
+    if len(csv_data) < 2:  # only the None row
+        return []
+    table = np.array(csv_data[:-1], dtype=str)
+    rid, tpl = table[:, 0], table[:, 1]
+    rows = np.arange(len(table))
+
+    # day of the week from the date in the rid
+    rids, rid_index = np.unique(rid, return_inverse=True)
+    day_of_week = np.array([__rid_date(r).isoweekday() for r in rids], dtype=np.int64)[rid_index]
+    weekday = (day_of_week <= 5).astype(np.int64)
+
+    # arrival, else passing, else departure columns, as in entry_to_query()
+    offset = np.where(table[:, 2] != "", 0, np.where(table[:, 3] != "", 1, 2))
+    work = table[rows, 2 + offset]
+    est = table[rows, 5 + offset]
+    act = table[rows, 8 + offset]
+
+    works, work_index = np.unique(work, return_inverse=True)
+    work_times = [__work_time(w) for w in works]
+    work_mins = np.array([t.hour * 60 + t.minute for t in work_times], dtype=np.int64)[work_index]
+    hour_of_day = work_mins // 60
+    peak_time = np.array([t.strftime("%H%M") for t in work_times], dtype=str)[work_index]
+
+    # delay against the actual time, else the estimated time, else 30 minutes for a cancelled train
+    seen = np.where(act != "", act, est)
+    has_time = seen != ""
+    seens, seen_index = np.unique(seen[has_time], return_inverse=True)
+    seen_mins = np.zeros(len(table), dtype=np.int64)
+    seen_mins[has_time] = np.array([__clock_minutes(t) for t in seens], dtype=np.int64)[seen_index]
+    delay = np.where(has_time, __find_delays(seen_mins, work_mins), 30)
+    delay = np.clip(delay, -30, 30)
+
+    # the delay carries on from the previous row of the same rid
+    last_stop = np.ones(len(table), dtype=bool)
+    last_stop[:-1] = rid[:-1] != rid[1:]
+    prev_delay = np.zeros(len(table), dtype=np.int64)
+    prev_delay[1:] = np.where(last_stop[:-1], 0, delay[:-1])
+    delay_change = delay - prev_delay
+
+    # next hop towards the next row's station, or the station itself on the last stop of a rid
+    dest = np.full(len(table), "", dtype=tpl.dtype)
+    dest[:-1] = tpl[1:]
+    dest[last_stop] = ""
+    pairs, pair_index = np.unique(np.char.add(np.char.add(tpl, "|"), dest), return_inverse=True)
+    source_ids, dest_ids = [], []
+    off_peak = np.ones(len(table), dtype=np.int64)
+    order = np.argsort(pair_index, kind="stable")
+    starts = np.searchsorted(pair_index[order], np.arange(len(pairs) + 1))
+    for k, pair in enumerate(pairs):
+        source, next_stop = pair.split("|")
+        if next_stop == "":
+            stn_from = stn_to = network.get_station(source)
+        else:
+            path     = network.find_path(source, next_stop)
+            stn_from = path[0]
+            stn_to   = path[1]
+        source_ids.append(stn_from.get_id())
+        dest_ids.append(stn_to.get_id())
+
+        members = order[starts[k]:starts[k + 1]]
+        members = members[weekday[members] == 1]
+        if stn_from == stn_to or len(members) == 0:
+            continue
+        times = peak_time[members]
+        in_peak = np.zeros(len(members), dtype=bool)
+        for start, end in stn_from.get_peak(stn_to):
+            in_peak |= (start <= times) & (times <= end)
+        off_peak[members[in_peak]] = 0
+
+    source_col = np.array(source_ids, dtype=object)[pair_index]
+    dest_col = np.array(dest_ids, dtype=object)[pair_index]
+    return [list(record) for record in zip(source_col.tolist(), dest_col.tolist(), day_of_week.tolist(),
+                                           weekday.tolist(), off_peak.tolist(), hour_of_day.tolist(),
+                                           delay.tolist(), delay_change.tolist())]
+
+
+def __read_darwin_runs(file, valid_tpl):
+    """Reads the provided DARWIN data CSV file a row at a time and removes unneeded columns and rows.
 
     :param str file: Name of file to be processed
 
-    :rtype: list[list[str]]
-    :return: list of lists matching the processed rows and columns of the given CSV, with unneeded info removed
+    :rtype: Iterator[list[list[str]]]
+    :return: the processed rows and columns of the given CSV with unneeded info removed, as lists of consecutive rows
+             with the same rid
     """
-    data = []
     with open(file) as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            if row[1] not in valid_tpl:  # skip every entry that isn't for a station listed in valid_tpl
-                continue
-            # delete columns pta, ptd, arr_wet, arr_atRemoved, pass_wet, pass_atRemoved, dep_wet, dep_atRemoved,
-            # cr_code, lr_code
-            del_cols = [20, 19, 15, 14, 12, 11, 9, 8, 3, 2]  # reversed, else index will go out of bounds
-            for index in del_cols:
-                del row[index]
-            data.append(row)
-        data.append([None, None])  # add an extra row to ensure there is no issues indexing
-    return data
-
-
-def __read_hsp_from_csv(file, valid_tpl):
-    """Reads the provided HSP data CSV file and formats it to the same design as DARWIN.
+        yield from __group_by_rid(__darwin_rows(csv.reader(csv_file, delimiter=','), valid_tpl))
 
-    :param str file: Name of file to be processed
 
-    :rtype: list[list[str]]
-    :return: list of lists matching the processed rows and columns of the given CSV, with darwin info added
+def __darwin_rows(csv_reader, valid_tpl):
+    for row in csv_reader:
+        if row[1] not in valid_tpl:  # skip every entry that isn't for a station listed in valid_tpl
+            continue
+        # delete columns pta, ptd, arr_wet, arr_atRemoved, pass_wet, pass_atRemoved, dep_wet, dep_atRemoved,
+        # cr_code, lr_code
+        del_cols = [20, 19, 15, 14, 12, 11, 9, 8, 3, 2]  # reversed, else index will go out of bounds
+        for index in del_cols:
+            del row[index]
+        yield row
+
+
+def __read_hsp_runs(file, valid_tpl, crs_to_tpl):
+    """Reads the provided HSP data CSV file a row at a time and formats it to the same design as DARWIN. Rows whose
+    CRS code has no TIPLOC are skipped and reported once the file has been read.
+
+    :param str file:        Name of file to be processed
+    :param valid_tpl:       TIPLOC codes of the stations to keep rows for
+    :param dict crs_to_tpl: CRS code: TIPLOC code, as in stations.StationDirectory
+
+    :rtype: Iterator[list[list[str]]]
+    :return: the processed rows and columns of the given CSV with darwin info added, as lists of consecutive rows with
+             the same rid
     """
-    data = []
+    unknown = Counter()  # CRS code: rows skipped for it
     with open(file) as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            # transform crs to tpl
-            crs = row[1]
-            conn = __connect_to_db()
-            cur = conn.cursor()
-            cur.execute(""" SELECT tpl FROM stations WHERE crs=? """, (crs,))
-            tpl = cur.fetchone()
-            if tpl is None:
-                continue
-
-            row[1] = tpl[0]
-            if row[1] is None or row[1] not in valid_tpl:  # skip every entry that isn't for a station in the tpl list
-                continue
-            # format time to DARWIN time format (insert colons)
-            for i in range(2, 6):
-                if row[i] != "":
-                    row[i] = row[i][:2] + ":" + row[i][2:]
-
-            # format the file to match DARWIN format
-            temp = row[2]; row[2] = row[3]; row[3] = temp  # swap ptd and pta
-            row.insert(3, "")  # pad ptd out one place to match DARWIN wtd position
-            row.insert(5, ""); row.insert(5, ""); row.insert(5, "")  # pad out dep_at and arr_at
-            row.insert(9, "")  # pad out arr_at
-            temp = row[8]; row[8] = row[10]; row[10] = temp  # swap dep_at and arr_at
-            data.append(row)
-        data.append([None, None])  # add an extra row to ensure there is no issues indexing
-    return data
+        yield from __group_by_rid(__hsp_rows(csv.reader(csv_file, delimiter=','), valid_tpl, crs_to_tpl, unknown))
+    if unknown:
+        print("skipped", sum(unknown.values()), "rows with unknown CRS codes in file", file + ":",
+              ", ".join("{} ({})".format(crs, count) for crs, count in unknown.most_common()))
+
+
+def __hsp_rows(csv_reader, valid_tpl, crs_to_tpl, unknown):
+    for row in csv_reader:
+        if row[0] == "rid":  # header row
+            continue
+        # transform crs to tpl
+        tpl = crs_to_tpl.get(row[1])
+        if tpl is None:
+            unknown[row[1]] += 1
+            continue
+        row[1] = tpl
+        if row[1] not in valid_tpl:  # skip every entry that isn't for a station in the tpl list
+            continue
+        # format time to DARWIN time format (insert colons)
+        for i in range(2, 6):
+            if row[i] != "":
+                row[i] = row[i][:2] + ":" + row[i][2:]
+
+        # format the file to match DARWIN format
+        temp = row[2]; row[2] = row[3]; row[3] = temp  # swap ptd and pta
+        row.insert(3, "")  # pad ptd out one place to match DARWIN wtd position
+        row.insert(5, ""); row.insert(5, ""); row.insert(5, "")  # pad out dep_at and arr_at
+        row.insert(9, "")  # pad out arr_at
+        temp = row[8]; row[8] = row[10]; row[10] = temp  # swap dep_at and arr_at
+        yield row
+
+
+def __group_by_rid(rows):
+    # consecutive rows with the same rid are one run of a train
+    for rid, run in groupby(rows, key=lambda row: row[0]):
+        yield list(run)
+
+
+def __chunk_runs(runs, chunk_rows):
+    """Gathers runs of trains into chunks the transforms can take, never splitting a run between chunks.
+
+    :param runs:           Lists of rows with the same rid
+    :param int chunk_rows: Rows to gather before a chunk is given out, a run longer than this is a chunk of its own
+
+    :rtype: Iterator[list[list[str]]]
+    :return: Rows of whole runs followed by the [None, None] row transform_rows() and transform_columns() expect
+    """
+    chunk = []
+    for run in runs:
+        chunk.extend(run)
+        if len(chunk) >= chunk_rows:
+            chunk.append([None, None])  # add an extra row to ensure there is no issues indexing
+            yield chunk
+            chunk = []
+    if chunk:
+        chunk.append([None, None])
+        yield chunk
 
 
 def __read_weather_data():  # TBA.
@@ -191,14 +518,63 @@ def user_to_query(source, destination, delay):
         processed_entry = query_to_input(stn_from, stn_to, now)
         train_data.append(processed_entry)
 
-    total_delay = int(delay)
+    # the models only see the entries and the delay, so answers are shared by every query giving the same ones. The
+    # entries change with the day of the week, the hour and whether the train is in a peak period
+    key = None
+    if delay_cache is not None:
+        __check_delay_cache(network)
+        key = (network.get_name(), int(delay), tuple(tuple(entry) for entry in train_data))
+        cached = delay_cache.get(key)
+        if cached is not None:
+            return cached
 
-    for train in train_data:
-        total_delay += model.use_model(train, total_delay, network)
+    total_delay = int(delay)
+    total_delay += sum(model.use_journey_models(train_data, total_delay, network))
 
+    if key is not None:
+        delay_cache.set(key, total_delay)
     return total_delay
 
 
+def configure_delay_cache(max_size=1024, ttl=3600):
+    """Replaces the cache of user_to_query()'s answers, dropping any answers already cached.
+
+    :param int max_size: Most answers to cache, the least recently used is dropped past this. 0 to not cache
+    :param int ttl:      Seconds an answer is cached for, None to keep answers until they are dropped for space
+    :raises ValueError:  If max_size is negative
+    """
+    global delay_cache
+    if max_size < 0:
+        raise ValueError("max_size must not be negative")
+    delay_cache = MemoryCache(max_size=max_size, ttl=ttl) if max_size else None
+
+
+def delay_cache_stats():
+    """
+    :rtype: dict or None
+    :return: Number of answers cached, hits, misses, answers dropped for space and the share of lookups which were
+             hits, or None if answers are not cached
+    """
+    if delay_cache is None:
+        return None
+    stats = delay_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def __check_delay_cache(network):
+    """Clears the delay cache if the network has been stored since its answers were worked out, storing a network
+    stores its new models, and services.get_network() hands out a newly loaded network after it. It is also cleared
+    when the delay tables the answers were looked up from are written again."""
+    global __delay_cache_source
+    modified = model.tables.modified(network.get_name(), "KNeighborsClassifier") if model.tables is not None else None
+    if __delay_cache_source is None or network is not __delay_cache_source[0] \
+            or modified != __delay_cache_source[1]:
+        delay_cache.clear()
+        __delay_cache_source = (network, modified)
+
+
 def entry_to_query(entry):
     """Takes a line (entry) from the processed CSV file and forms a query (data matching one station input from user)
 
@@ -268,38 +644,106 @@ def query_to_input(source, destination, dt):
     return [source.get_id(), destination.get_id(), day_of_week, weekday, off_peak, hour_of_day]
 
 
-def __write_to_db(table, data):
-    """Takes a list of records and adds them to the given table of database db
+def __write_to_db(table, chunks, source=None, conn=None):
+    """Takes chunks of records and adds them to the given table of database db in one transaction
 
-    :param str table: Name of the table to insert records into - if this doesn't exist, it will be created
-    :param data:      A list of records to be added to the database
-    :type data:       list[list[str, str, int, int, int, int, int, int]]
+    :param str table:   Name of the table to insert records into - if this doesn't exist, it will be created
+    :param chunks:      Lists of records to be added to the database, which may be read as they are written
+    :type chunks:       Iterable[list[list[str, str, int, int, int, int, int, int]]]
+    :param source:      (hash, name) of the file the records came from, to record in the ingest_manifest table in the
+                        same transaction. Nothing is written if the manifest already holds the file for this table
+    :type source:       tuple[str, str]
+    :param conn:        Connection to write over, left open, or None to open one for this write only
+    :type conn:         sqlite3.Connection
 
-    :rtype:  int
-    :return: Number of records added to db
+    :rtype:  int or None
+    :return: Number of records added to db, -1 if the file was already written, or None if they could not be written
     :raises  sqlite3.Error: If db value is invalid
     """
-    conn = __connect_to_db()
+    own_conn = conn is None
+    if own_conn:
+        conn = __connect_to_db()
     cur = conn.cursor()
 
     # create table if it doesn't exist
     try:
         cur.execute(""" CREATE TABLE IF NOT EXISTS {} (tpl_from text, tpl_to text, day_of_week integer, 
         weekday integer, off_peak integer, hour_of_day integer, delay integer, delay_change integer );""".format(table))
+        if source is not None:
+            __create_manifest(conn)
+            cur.execute(""" BEGIN IMMEDIATE """)  # hold the write lock from the manifest check to the commit
+            cur.execute(""" SELECT 1 FROM ingest_manifest WHERE hash=? AND table_name=? AND status='committed' """,
+                        (source[0], table))
+            if cur.fetchone() is not None:
+                return -1
 
         # insert into table
-        cur.executemany(""" INSERT INTO {} VALUES(?,?,?,?,?,?,?,?) """.format(table), data)
+        written = 0
+        for data in chunks:
+            cur.executemany(""" INSERT INTO {} VALUES(?,?,?,?,?,?,?,?) """.format(table), data)
+            written += cur.rowcount
+        if source is not None:
+            cur.execute(""" INSERT OR REPLACE INTO ingest_manifest VALUES(?,?,?,?,'committed',?) """,
+                        (source[0], table, source[1], written, datetime.now().isoformat(timespec="seconds")))
         conn.commit()
-        conn.close()
     except sqlite3.Error as e:
         print(e)
-        return 0
+        conn.rollback()
+        if source is not None:
+            __record_failure(conn, table, source)
+        return None
+    finally:
+        if conn.in_transaction:  # nothing is kept unless it was all committed
+            conn.rollback()
+        if own_conn:
+            conn.close()
+
+    return written
+
+
+def create_index(table, conn=None):
+    """Builds the index the model trainers search the table by, if the table exists and the index does not.
+
+    :param str table: Table of records written by raw()
+    :param conn:      Connection to use, left open, or None to open one
+    :type conn:       sqlite3.Connection
+
+    :rtype:   bool
+    :returns: True if the index was built, False if it already existed or could not be built
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = __connect_to_db()
+    try:
+        exists = conn.execute(""" SELECT name FROM sqlite_master WHERE name IN (?, ?) """,
+                              (table, table + "_route")).fetchall()
+        if [(table,)] != exists:  # no table to index, or the index is already there
+            return False
+        with conn:
+            conn.execute(""" CREATE INDEX {0}_route ON {0} (tpl_from, tpl_to, delay_change) """.format(table))
+            conn.execute(""" ANALYZE {} """.format(table))
+    except sqlite3.Error as e:
+        print(e)
+        return False
+    finally:
+        if own_conn:
+            conn.close()
+    return True
+
 
-    return cur.rowcount
+def __record_failure(conn, table, source):
+    # note the failed attempt in the manifest, this is only for reporting so a file already committed is left alone
+    try:
+        with conn:
+            conn.execute(""" INSERT OR IGNORE INTO ingest_manifest VALUES(?,?,?,0,'failed',?) """,
+                         (source[0], table, source[1], datetime.now().isoformat(timespec="seconds")))
+    except sqlite3.Error as e:
+        print(e)
 
 
 def drop_table(table):
-    """Warning: This will drop the given table from database db without prompt.
+    """Warning: This will drop the given table from database db without prompt. The table's files are removed from the
+    ingest_manifest table too, so they are written again if they are put back in the scraped folder.
 
     :param str table: Table to delete from db
 
@@ -311,6 +755,8 @@ def drop_table(table):
     cur = conn.cursor()
     try:
         cur.execute(""" DROP TABLE {} """.format(table))
+        __create_manifest(conn)
+        cur.execute(""" DELETE FROM ingest_manifest WHERE table_name=? """, (table,))
         conn.commit()
         conn.close()
     except sqlite3.Error as e:
@@ -319,9 +765,10 @@ def drop_table(table):
     return True
 
 
-def __connect_to_db():
+def __connect_to_db(bulk=False):
     """Opens and returns a connection to database db or exception if the connection failed
 
+    :param bool bulk: True to set the connection up for writing large amounts of records, see __bulk_profile()
     :return: connection to db
     :raises  sqlite3.Error: if connection to db fails
     """
@@ -330,11 +777,62 @@ def __connect_to_db():
         base_dir = os.path.dirname(os.path.abspath(__file__))
         db_path = os.path.join(base_dir, "db.sqlite")
         conn = sqlite3.connect(db_path)
+        if bulk:
+            __bulk_profile(conn)
     except sqlite3.Error as e:
         print(e)
     return conn
 
 
+def __bulk_profile(conn):
+    """Sets a connection up for bulk loads. WAL mode lets the models read the db while it is being written, and with
+    it synchronous=NORMAL only syncs to disk at checkpoints. A crash can lose the last few commits but never leaves a
+    file half written, as each file's records are committed along with its row in the manifest.
+
+    :param sqlite3.Connection conn: Connection to set up
+    """
+    conn.execute(""" PRAGMA journal_mode=WAL """)
+    conn.execute(""" PRAGMA synchronous=NORMAL """)
+    conn.execute(""" PRAGMA cache_size=-262144 """)  # 256MB of pages, in KiB
+    conn.execute(""" PRAGMA temp_store=MEMORY """)   # sort in memory when building the index
+
+
+def __rid_date(rid):
+    # date a rid ran on, as in entry_to_query()
+    date_str = re.findall(r"\b[0-9]{8}", str(rid))
+    return datetime.strptime(date_str[0], "%Y%m%d")
+
+
+def __work_time(work_time):
+    # timetabled time with any seconds removed, as in entry_to_query()
+    work_time = work_time.split(":")
+    return datetime.strptime("".join(work_time[:2]), "%H%M")
+
+
+def __clock_minutes(time_str):
+    # minutes past midnight of an actual or estimated time, as read by __find_delay()
+    time = datetime.strptime(time_str, "%H:%M")
+    return time.hour * 60 + time.minute
+
+
+def __find_delays(actual, expected):
+    """Works out __find_delay() for whole columns of times.
+
+    :param np.ndarray actual:   Minutes past midnight the train got to each station
+    :param np.ndarray expected: Minutes past midnight the train should have got to each station
+
+    :rtype: np.ndarray
+    :return: train delays in minutes
+    """
+    day_end = 23 * 60 + 59
+    train_end = train_start = 4 * 60
+    # train came in after midnight when it was expected before midnight
+    actual_next_day = (actual <= train_end) & (train_start <= expected) & (expected <= day_end)
+    # train was expected after midnight but came in before midnight
+    expected_next_day = ~actual_next_day & (expected <= train_end) & (train_start <= actual) & (actual <= day_end)
+    return (actual + 1440 * actual_next_day) - (expected + 1440 * expected_next_day)
+
+
 def __find_delay(actual, expected):
     """Helper function to find the difference between actual and expected arrival/passing times.
 
@@ -11,10 +11,21 @@ Date    : Friday 08 January 2021
 History : 05/01/2020 - v1.0 - Create project file
           11/01/2020 - v1.1 - Finalised Network and Station objects, and intercity function, fully tested.
           18/01/2020 - v1.2 - Moved network creation code out and replaced intercity function with a fetch from the db.
+          18/10/2026 - v1.3 - find_path answered from shortest path tables built once per network.
+          18/10/2026 - v1.4 - Models stored as versioned rows of their own and loaded the first time they are used.
+          18/10/2026 - v1.5 - Added models_version().
+          18/10/2026 - v1.6 - get_network hands out networks loaded once per process, checking a version column.
+                              Removed models_version(), a network is loaded again whenever its models are stored.
+          18/10/2026 - v1.7 - Networks keep the version they were loaded or stored as, see Network.get_version().
+          18/10/2026 - v1.8 - Added save_network().
 """
+import time
 import pickle
 import sqlite3
 import os.path
+import functools
+import threading
+from collections import deque
 import sklearn.neighbors as skl
 
 __author__     = "Martin Siddons"
@@ -23,13 +34,35 @@ __maintainer__ = "Martin Siddons"
 __email__      = "m.siddons@uea.ac.uk"
 __status__     = "Prototype"  # "Development" "Prototype" "Production"
 
+__networks = {}  # name: (version column of the networks table when it was loaded, Network)
+__networks_lock = threading.Lock()
+
 
 class Station:
-    """Defines a station and relationships between stations (graph vertex)"""
+    """Defines a station and relationships between stations (graph vertex). Models are kept in the models table rather
+    than pickled with the station, and are fetched the first time get_model() asks for them."""
     def __init__(self, station):
         self.id          = station
         self.connected   = {}
         # above is: {Station: {int:peak, KNeighboursClassifier:model, BayesClassifier:model, ANNClassifier:model}}
+        self._new_models = set()  # (Station, model name) of models added since the network was last stored
+        self._loader     = None   # function(tpl_from, tpl_to, model name) fetching a model from the models table
+
+    def __getstate__(self):
+        # models already in the models table are left out, so loading a network doesn't load every model with it
+        state = self.__dict__.copy()
+        state["connected"] = {destination: {key: value for key, value in entry.items()
+                                            if key == "peak" or (destination, key) in self._new_models}
+                              for destination, entry in self.connected.items()}
+        state["_loader"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "_new_models" not in state:  # pickled with its models, they move to the models table on the next store
+            self._new_models = {(destination, key) for destination, entry in self.connected.items()
+                                for key in entry if key != "peak"}
+        self._loader = None
 
     # def __str__(self):
     #     return str(self.id) + ' links to: ' + str([x.id for x in self.connected])
@@ -50,6 +83,7 @@ class Station:
         """ Takes a model of delays between this station and the destination and stores it in the 'connected' dict """
         name = type(model_scaler[0]).__name__  # get the object's class name
         self.connected[destination][name] = model_scaler
+        self._new_models.add((destination, name))
 
     def edit_destination(self, destination, peak):
         if destination in self.connected:
@@ -82,24 +116,60 @@ class Station:
         :param str model_name: Name of the model matching stored key in network
 
         :return: Model which matches the requested model"""
+        if model_name not in self.connected[destination] and self._loader is not None:
+            model_scaler = self._loader(self.id, destination.get_id(), model_name)
+            if model_scaler is not None:
+                self.connected[destination][model_name] = model_scaler
         return self.connected[destination][model_name]
 
 
 class Network:
-    """Rail network modelled as a Graph data structure"""
+    """Rail network modelled as a Graph data structure. Paths between stations are looked up from tables built the
+    first time they are needed, which are dropped whenever a station or rail is added through the Network."""
     def __init__(self, name):
         self.name = name
         self._rail_line = {}
+        self._parents = None  # {Station source: {Station reached: Station before it on the path from source}}
+        self._version = None  # version column of the network's row when it was last loaded or stored
 
     def __iter__(self):
         return iter(self._rail_line.values())
 
+    def __getstate__(self):
+        # the path tables are rebuilt after loading rather than stored in the db with the network
+        state = self.__dict__.copy()
+        state["_parents"] = None
+        state["_version"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._parents = None  # networks pickled before the tables existed have no such attribute
+        self._version = None
+
     def get_name(self):
         return self.name
 
+    def get_version(self):
+        """
+        :rtype: int or None
+        :return: Version column of the network's row when this network was loaded or last stored, None if it has
+                 been neither
+        """
+        return self._version
+
+    def set_model_loader(self, loader):
+        """Sets the function every Station calls to fetch a model it does not hold yet.
+
+        :param loader: function(tpl_from, tpl_to, model name) returning [model, scaler], or None if there is none
+        """
+        for station in self._rail_line.values():
+            station._loader = loader
+
     def add_station(self, station):
         new_rail = Station(station)
         self._rail_line[station] = new_rail
+        self._parents = None
         return new_rail
 
     def get_station(self, station):
@@ -127,6 +197,7 @@ class Network:
             self.add_station(to)
 
         self._rail_line[frm].add_destination(self._rail_line[to], peak)
+        self._parents = None
 
     def get_all_stations(self):
         """
@@ -136,7 +207,7 @@ class Network:
         return list(self._rail_line.keys())
 
     def find_path(self, source, destination):
-        """Find any path between source and destination stations
+        """Find the path with fewest stops between source and destination stations
 
         :param str source: Source station tpl (TIPLOC) code
         :param str destination: Destination station tpl code
@@ -148,17 +219,43 @@ class Network:
         destination_station = self.get_station(destination)
         if source_station is None or destination_station is None:
             raise ValueError("Given stations are not found on this train network")
-        path  = []
-        queue = [[source_station]]
+        parents = self.build_paths()[source_station]
+        if destination_station not in parents:
+            return None
+        path = [destination_station]
+        while path[-1] is not source_station:
+            path.append(parents[path[-1]])
+        path.reverse()
+        return path
+
+    def build_paths(self):
+        """Builds the path tables if they are not already built. After changing a Station's connections directly with
+        Station.add_destination(), which the Network can not see, call clear_paths() first.
+
+        :rtype: dict
+        :return: {Station source: {Station reached: Station before it on the path from source}}
+        """
+        if self._parents is None:
+            self._parents = {station: self.__bfs(station) for station in self._rail_line.values()}
+        return self._parents
+
+    def clear_paths(self):
+        """Drops the path tables, they are rebuilt on the next find_path()."""
+        self._parents = None
+
+    @staticmethod
+    def __bfs(source):
+        # breadth first from source, visiting connections in the order they were added so that where two paths have
+        # the same number of stops the one found is the same as searching every path in turn would find
+        parents = {source: None}
+        queue = deque([source])
         while queue:
-            path = queue.pop(0)
-            last_station = path[-1]
-            if last_station == destination_station:
-                return path
-            for station in last_station.connected.keys():
-                new_path = list(path)
-                new_path.append(station)
-                queue.append(new_path)
+            station = queue.popleft()
+            for next_station in station.connected.keys():
+                if next_station not in parents:
+                    parents[next_station] = station
+                    queue.append(next_station)
+        return parents
 
     def __find_path_rec(self, source, destination, path):
         # recursive call to find target. Separated from find_path to allow for validation. Returns list[Station]
@@ -230,7 +327,8 @@ def build_train_network(net_name, stations, peaks_from, peaks_to):
 
 
 def store_network(network, conn, appending=True):
-    """function to pickle and save the given network object.
+    """function to pickle and save the given network object. Models added to the network since it was last stored are
+    saved to the models table as a new version, and are not pickled with the network.
 
     :param Network network:
     :param sqlite3.Connection conn: sqlite3 Connection
@@ -238,30 +336,197 @@ def store_network(network, conn, appending=True):
     :return: True if successful else false
     """
     cursor = conn.cursor()
-    serial_n = pickle.dumps(network)  # serialise the network in order to store it
-    if appending:
-        cursor.execute(""" UPDATE networks SET object=? WHERE name=? """, (serial_n, network.get_name()))
-    else:
-        cursor.execute(""" INSERT INTO networks VALUES(?,?) """, (network.get_name(), serial_n))
-    conn.commit()
+    __create_models_table(conn)
+    __add_version_column(conn)
+    new_models = [(station, destination, model_name) for station in network
+                  for destination, model_name in station._new_models]
+    for station, destination, model_name in new_models:
+        cursor.execute(""" SELECT COALESCE(MAX(version), 0) + 1 FROM models WHERE network=? AND tpl_from=? AND
+                           tpl_to=? AND model_name=? """,
+                       (network.get_name(), station.get_id(), destination.get_id(), model_name))
+        version = cursor.fetchone()[0]
+        cursor.execute(""" INSERT INTO models VALUES(?,?,?,?,?,?,?) """,
+                       (network.get_name(), station.get_id(), destination.get_id(), model_name, version,
+                        pickle.dumps(station.connected[destination][model_name]), time.time()))
+    for station, destination, model_name in new_models:
+        station._new_models.discard((destination, model_name))  # saved above, so not pickled with the network
+
+    try:
+        serial_n = pickle.dumps(network)  # serialise the network in order to store it
+        if appending:
+            cursor.execute(""" UPDATE networks SET object=?, version=version+1 WHERE name=? """,
+                           (serial_n, network.get_name()))
+        else:
+            cursor.execute(""" INSERT INTO networks (name, object, version) VALUES(?,?,1) """,
+                           (network.get_name(), serial_n))
+        version = __network_version(conn, network.get_name())
+        conn.commit()
+    except sqlite3.Error:
+        for station, destination, model_name in new_models:
+            station._new_models.add((destination, model_name))  # nothing was saved, try them again next time
+        raise
+    network._version = version
     return True
 
 
+def save_network(network):
+    """Stores a network already on the networks table, along with any models added to it since it was last stored.
+
+    :param Network network:
+    :rtype: bool
+    :return: True if successful
+    :raises sqlite3.Error: if the network could not be stored
+    """
+    conn = __connect_to_db()
+    try:
+        return store_network(network, conn)
+    finally:
+        conn.close()
+
+
+def load_model(network_name, tpl_from, tpl_to, model_name, version=None, conn=None):
+    """Fetches a model from the models table
+
+    :param str network_name: Name of the network the model was stored with
+    :param str tpl_from:     TPL code of the station the train is leaving from
+    :param str tpl_to:       TPL code of the station the train is next calling at
+    :param str model_name:   Class name of the model, e.g. "KNeighborsClassifier"
+    :param int version:      Version of the model to fetch, None for the latest
+    :param sqlite3.Connection conn: Connection to use, None to open one to database db
+    :rtype: list or None
+    :return: [model, scaler] as given to Station.add_model(), or None if there is no such model
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = __connect_to_db()
+    try:
+        query = """ SELECT object FROM models WHERE network=? AND tpl_from=? AND tpl_to=? AND model_name=? """
+        values = [network_name, tpl_from, tpl_to, model_name]
+        if version is not None:
+            query += """ AND version=? """
+            values.append(version)
+        row = conn.execute(query + """ ORDER BY version DESC LIMIT 1 """, values).fetchone()
+    except sqlite3.Error as e:  # no models table in a db written before models were stored apart
+        print(e)
+        return None
+    finally:
+        if own_conn:
+            conn.close()
+    if row is None:
+        return None
+    return pickle.loads(row[0])
+
+
 def get_network(name):
-    """Retrieves the given network from the network table of the database
+    """Retrieves the given network from the network table of the database. Each network is loaded once per process
+    and the same object handed out after that, until the network is stored again. The network should be treated as
+    read only, a training job changing it should call refresh_network() for its own copy.
 
     :param str name: Name of network to retrieve, as listed in networks table
     :rtype:  Network
     :return: A Network object representing the Greater Anglia network
     """
     conn = __connect_to_db()
+    try:
+        version = __network_version(conn, name)
+        with __networks_lock:
+            cached = __networks.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return __load_network(conn, name, version)
+    finally:
+        conn.close()
+
+
+def refresh_network(name):
+    """Loads the given network from the database again, whether or not it has been stored since it was last loaded.
+    The network handed out is not the one get_network() hands out, so it can be changed and stored without affecting
+    anyone else using the network, and get_network() hands out a new one once it is stored.
+
+    :param str name: Name of network to retrieve, as listed in networks table
+    :rtype:  Network
+    :return: A newly loaded Network object
+    """
+    conn = __connect_to_db()
+    try:
+        return __unpickle_network(conn, name)
+    finally:
+        conn.close()
+
+
+def clear_networks():
+    """Forgets every loaded network, each is loaded again the next time get_network() asks for it."""
+    with __networks_lock:
+        __networks.clear()
+
+
+def __load_network(conn, name, version):
+    """Loads a network and keeps it to be handed out by get_network()
+
+    :param sqlite3.Connection conn: sqlite3 Connection
+    :param str name:    Name of network to retrieve
+    :param int version: Version column of the network's row, read before the network
+    :rtype: Network
+    """
+    retrieved_n = __unpickle_network(conn, name)
+    with __networks_lock:
+        __networks[name] = (version, retrieved_n)
+    return retrieved_n
+
+
+def __unpickle_network(conn, name):
+    """
+    :param sqlite3.Connection conn: sqlite3 Connection
+    :param str name: Name of network to retrieve
+    :rtype: Network
+    :return: The network, with its path tables built and its models fetched from the models table when first used
+    """
     cur = conn.cursor()
     cur.execute(""" SELECT object FROM networks WHERE name=? """, (name,))
     data = cur.fetchone()
     retrieved_n = pickle.loads(data[0])
+    retrieved_n._version = __network_version(conn, name)
+    retrieved_n.build_paths()
+    retrieved_n.set_model_loader(functools.partial(load_model, name))
     return retrieved_n
 
 
+def __network_version(conn, name):
+    """
+    :param sqlite3.Connection conn: sqlite3 Connection
+    :param str name: Name of the network
+    :rtype: int or None
+    :return: Version column of the network's row, 0 if the table has no version column yet, or None if the network is
+             not in the table
+    """
+    try:
+        row = conn.execute(""" SELECT version FROM networks WHERE name=? """, (name,)).fetchone()
+    except sqlite3.OperationalError:  # networks stored before the column was added
+        return 0
+    return row[0] if row is not None else None
+
+
+def __add_version_column(conn):
+    """Adds the version column to the networks table if it does not have one, each store of a network adds one to it
+
+    :param sqlite3.Connection conn: sqlite3 Connection
+    """
+    columns = [row[1] for row in conn.execute(""" PRAGMA table_info(networks) """)]
+    if columns and "version" not in columns:
+        conn.execute(""" ALTER TABLE networks ADD COLUMN version integer NOT NULL DEFAULT 0 """)
+
+
+def __create_models_table(conn):
+    """Creates the models table if it does not exist yet, each row holding one version of the model and scaler for a
+    pair of stations
+
+    :param sqlite3.Connection conn: sqlite3 Connection
+    """
+    conn.execute(""" CREATE TABLE IF NOT EXISTS models (network text, tpl_from text, tpl_to text, model_name text,
+                     version integer, object blob, created_at real,
+                     PRIMARY KEY (network, tpl_from, tpl_to, model_name, version)) """)
+
+
 def __connect_to_db():
     """Opens and returns a connection to database db or exception if the connection failed
 
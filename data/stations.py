@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Functions for looking up station names, CRS and TIPLOC codes without querying the db for every lookup
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : stations.py
+Date    : Sunday 18 October 2026
+History : 18/10/2026 - v1.0 - Create project file, load the stations table once into a StationDirectory.
+"""
+import sqlite3
+import os.path
+import threading
+
+__author__     = "Martin Siddons"
+__credits__    = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Martin Siddons"
+__email__      = "m.siddons@uea.ac.uk"
+__status__     = "Prototype"  # "Development" "Prototype" "Production"
+
+
+class StationDirectory:
+    """In-memory copy of the stations table, indexed for the lookups the chatbot makes on each message. Where the
+    table holds more than one row for a name or code, the first row wins, matching what fetchone() used to return."""
+    def __init__(self, rows):
+        """
+        :param rows: rows of (name, crs, tpl, county, served_2019) in table order
+        :type rows:  list[tuple[str, str, str, str, int]]
+        """
+        self.names          = []  # names of stations with a CRS code, in table order
+        self.crs_codes      = []  # CRS codes matching self.names
+        self.counties       = []  # unique counties of stations with a CRS code, in table order
+        self.name_to_crs    = {}
+        self.crs_to_name    = {}
+        self.name_to_tpl    = {}
+        self.crs_to_tpl     = {}
+        self.county_to_stations = {}  # county: list of station names, busiest first
+
+        ranked = {}  # county: list of (served_2019, station name)
+        for name, crs, tpl, county, served_2019 in rows:
+            self.name_to_crs.setdefault(name, crs)
+            self.name_to_tpl.setdefault(name, tpl)
+            if crs is not None:
+                self.crs_to_tpl.setdefault(crs, tpl)
+            if county:
+                ranked.setdefault(county, []).append((served_2019, name))
+            if crs is None or crs == "none":
+                continue
+            self.names.append(name)
+            self.crs_codes.append(crs)
+            self.crs_to_name.setdefault(crs, name)
+            if county and county not in self.counties:
+                self.counties.append(county)
+
+        # rank stations in each county by passenger numbers, stations without figures go last
+        for county, stations in ranked.items():
+            stations.sort(key=lambda s: (s[0] is None, -(s[0] or 0)))
+            self.county_to_stations[county] = [name for served_2019, name in stations]
+
+    def get_crs(self, name):
+        """
+        :param str name: Full name of the station (e.g. Norwich)
+        :rtype: str or None
+        :return: CRS code of the station (e.g. NRW), or None if not found
+        """
+        return self.name_to_crs.get(name)
+
+    def get_name(self, crs):
+        """
+        :param str crs: CRS code of the station (e.g. NRW)
+        :rtype: str or None
+        :return: Full name of the station, or None if not found
+        """
+        return self.crs_to_name.get(crs)
+
+    def get_tpl(self, name):
+        """
+        :param str name: Full name of the station (e.g. Norwich)
+        :rtype: str or None
+        :return: TIPLOC code of the station (e.g. NRCH), or None if not found
+        """
+        return self.name_to_tpl.get(name)
+
+    def get_tpl_from_crs(self, crs):
+        """
+        :param str crs: CRS code of the station (e.g. NRW)
+        :rtype: str or None
+        :return: TIPLOC code of the station (e.g. NRCH), or None if not found
+        """
+        return self.crs_to_tpl.get(crs)
+
+    def get_county_stations(self, county, limit=5):
+        """
+        :param str county: County to list stations for (e.g. Norfolk)
+        :param int limit:  Maximum number of stations to return
+        :rtype: list[str]
+        :return: Names of the busiest stations in the county, busiest first
+        """
+        return self.county_to_stations.get(county, [])[:limit]
+
+
+__directory = None
+__directory_lock = threading.Lock()
+
+
+def get_directory():
+    """Returns the shared StationDirectory, loading it from the db on first use.
+
+    :rtype: StationDirectory
+    :return: Directory of every station in the stations table
+    """
+    global __directory
+    if __directory is None:
+        with __directory_lock:
+            if __directory is None:
+                __directory = __load_directory()
+    return __directory
+
+
+def reload():
+    """Reloads the shared StationDirectory from the db, call this when the stations table changes.
+
+    :rtype: StationDirectory
+    :return: The newly loaded directory
+    """
+    global __directory
+    with __directory_lock:
+        __directory = __load_directory()
+    return __directory
+
+
+def __load_directory():
+    # read the whole stations table in one query and build the directory from it
+    conn = __connect_to_db()
+    cur = conn.cursor()
+    cur.execute(""" SELECT name, crs, tpl, county, served_2019 FROM stations ORDER BY rowid """)
+    rows = cur.fetchall()
+    conn.close()
+    return StationDirectory(rows)
+
+
+def __connect_to_db():
+    """Opens and returns a connection to database db or exception if the connection failed
+
+    :return: connection to db
+    :raises  sqlite3.Error: if connection to db fails
+    """
+    conn = None
+    try:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        db_path = os.path.join(base_dir, "db.sqlite")
+        conn = sqlite3.connect(db_path)
+    except sqlite3.Error as e:
+        print(e)
+    return conn
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Small caches with a time to live and a cap on their size, for results which are slow to fetch
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : cache.py
+Date    : Sunday 18 October 2026
+Desc.   : MemoryCache keeps entries in this process only, SqliteCache keeps them in a local sqlite file so they
+          survive a restart. Both drop entries once they are older than ttl seconds, and drop the least recently used
+          entry once max_size entries are held.
+History : 18/10/2026 - v1.0 - Create project file, MemoryCache and SqliteCache.
+"""
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+__author__     = "Martin Siddons"
+__credits__    = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Martin Siddons"
+__email__      = "m.siddons@uea.ac.uk"
+__status__     = "Prototype"  # "Development" "Prototype" "Production"
+
+
+class MemoryCache:
+    """Cache held in a dict in this process"""
+    def __init__(self, max_size=1024, ttl=900):
+        """
+        :param int max_size: Most entries to hold, the least recently used entry is dropped past this
+        :param ttl:          Seconds an entry is kept for, None to keep entries until they are dropped for space
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key: (expiry time, value), least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        :param key:     Hashable key the value was stored under
+        :param default: Returned if the key is not held or has expired
+        :return: The value stored under the key, or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        :param key:   Hashable key to store the value under
+        :param value: Value to store
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drops every entry, the hit and miss counts are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        :rtype: dict
+        :return: Number of entries held, hits, misses and entries dropped for space
+        """
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class SqliteCache:
+    """Cache held in a table of a sqlite file. Keys are stored by their repr() and values are pickled, so only use
+    this for keys made of str, int, float and tuple, and for values from a trusted source."""
+    def __init__(self, path, max_size=1024, ttl=900, table="cache"):
+        """
+        :param str path:     Path of the sqlite file, created if it does not exist
+        :param int max_size: Most entries to hold, the least recently used entry is dropped past this
+        :param ttl:          Seconds an entry is kept for, None to keep entries until they are dropped for space
+        :param str table:    Name of the table to keep entries in, so one file can hold more than one cache
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)  # every use is under self._lock
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS " + table +
+                               " (key TEXT PRIMARY KEY, value BLOB, expires REAL, used REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS " + table + "_used ON " + table + " (used)")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM " + self.table).fetchone()[0]
+
+    def get(self, key, default=None):
+        """
+        :param key:     Key the value was stored under
+        :param default: Returned if the key is not held or has expired
+        :return: The value stored under the key, or default
+        """
+        now = time.time()  # wall clock, entries have to outlive this process
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT value, expires FROM " + self.table + " WHERE key = ?",
+                                         (repr(key),)).fetchone()
+                if row is not None and (row[1] is None or row[1] > now):
+                    with self._conn:
+                        self._conn.execute("UPDATE " + self.table + " SET used = ? WHERE key = ?", (now, repr(key)))
+                    self.hits += 1
+                    return pickle.loads(row[0])
+                if row is not None:
+                    with self._conn:
+                        self._conn.execute("DELETE FROM " + self.table + " WHERE key = ?", (repr(key),))
+            except sqlite3.Error as e:
+                print(e)
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        :param key:   Key to store the value under
+        :param value: Value to store, must be picklable
+        """
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute("INSERT OR REPLACE INTO " + self.table +
+                                       " (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                                       (repr(key), pickle.dumps(value), expires, now))
+                    over = self._conn.execute("SELECT COUNT(*) FROM " + self.table).fetchone()[0] - self.max_size
+                    if over > 0:
+                        self._conn.execute("DELETE FROM " + self.table + " WHERE key IN (SELECT key FROM " +
+                                           self.table + " ORDER BY used LIMIT ?)", (over,))
+                        self.evictions += over
+            except sqlite3.Error as e:
+                print(e)
+
+    def clear(self):
+        """Drops every entry, the hit and miss counts are kept."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM " + self.table)
+
+    def stats(self):
+        """
+        :rtype: dict
+        :return: Number of entries held, hits, misses and entries dropped for space
+        """
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
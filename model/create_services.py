@@ -8,8 +8,19 @@ File    : create_services.py
 Date    : Monday 18 January 2021
 History : 18/01/2021 - v1.0 - Create project file, build_ga_intercity()
           20/01/2021 - v1.1 - Create build_model(), build_all_station_models()
+          18/10/2026 - v1.2 - build_all_station_models() trains every segment in a process pool and stores the
+                              network once.
+          18/10/2026 - v1.3 - Added build_delay_tables(), run after the models are trained.
+          18/10/2026 - v1.4 - Models trained on a newly loaded copy of the network.
+          18/10/2026 - v1.5 - Delay tables saved with the version of the network they were compiled from.
+          18/10/2026 - v1.6 - A segment failing to train for any reason no longer loses the models of the others.
+          18/10/2026 - v1.7 - Workers train from the dataset as exported by build_all_station_models() only.
 
 """
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import data.services as services
 import prediction_model as model
 
@@ -56,26 +67,109 @@ def build_ga_intercity():
 
 
 def build_model():
-    n = services.get_network("ga_intercity")
+    n = services.refresh_network("ga_intercity")
     model.ann_model_trainer("DISS", "STWMRKT", n)
     # model.knn_model_trainer("DISS", "STWMRKT", n)
 
 
-def build_all_station_models():
-    n = services.get_network("ga_intercity")
-    path = n.find_path("NRCH", "LIVST")
-    # path = n.find_path("LIVST", "NRCH")
-    path.append(path[-1])
+def build_all_station_models(network_name="ga_intercity", fitters=None, workers=None):
+    """ Trains a model of each type for every segment of the network, in both directions, in a pool of processes.
+    The models are added to the network as they come back, and the network is stored on the db once at the end,
+    with the models trained so far if training fails or is stopped part way.
+
+    :param str network_name: Name of the network in the networks table
+    :param list fitters:     prediction_model functions fitting one type of model, each taking the TPL codes of
+                             the two stations and returning [model, scaler]. Defaults to the ANN, KNN and Bayes models
+    :param int workers:      Number of processes to train in, defaults to the number of CPUs
 
-    for i in range(len(path)-1):
-        stn_from = path[i].get_id()
-        stn_to   = path[i+1].get_id()
-        model.ann_model_trainer(stn_from, stn_to, n)
-        # model.knn_model_trainer(stn_from, stn_to, n)
+    :rtype: dict
+    :return: {(tpl_from, tpl_to, model name): seconds taken to train} for each model trained
+    """
+    if fitters is None:
+        fitters = [model.ann_model_fit, model.knn_model_fit, model.bayes_model_fit]
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1")
+    n = services.refresh_network(network_name)  # a copy of its own, the network is only changed here
+
+    # every rail on the network, including the final station's rail to itself as used at the end of a path
+    segments = [(stn_from.get_id(), stn_to.get_id()) for stn_from in n for stn_to in stn_from.get_connections()]
+    # bring the exported dataset up to date once here. The fit functions only load from the export, so the workers
+    # never count or read the dataset table, nor write the export while another process may be writing it
+    if model.segments is not None and model.segments.refresh() is None:
+        print("could not export the dataset, the models are trained from the dataset table")
+
+    start = time.perf_counter()
+    timings = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = {pool.submit(_fit_segment, fit, stn_from, stn_to): (fit.__name__, stn_from, stn_to)
+                       for stn_from, stn_to in segments for fit in fitters}
+            for future in as_completed(futures):
+                fit_name, stn_from, stn_to = futures[future]
+                try:
+                    model_scaler, elapsed = future.result()
+                except Exception as e:  # e.g. no rows in the dataset between the two stations, or the worker died
+                    print("could not train", fit_name, "from", stn_from, "to", stn_to + ":", e)
+                    continue
+                n.get_station(stn_from).add_model(n.get_station(stn_to), model_scaler)
+                name = type(model_scaler[0]).__name__
+                timings[(stn_from, stn_to, name)] = elapsed
+                print("trained %s from %s to %s in %.1fs" % (name, stn_from, stn_to, elapsed))
+    finally:
+        if timings:  # keep whatever was trained, even if training was stopped part way
+            services.save_network(n)
+        print("trained %d models in %.1fs, %.1fs of training in total" %
+              (len(timings), time.perf_counter() - start, sum(timings.values())))
+
+    # the tables of the models just trained no longer match them
+    build_delay_tables(network_name, sorted({name for _, _, name in timings} & {"KNeighborsClassifier",
+                                                                               "MLPClassifier"}))
+    return timings
+
+
+def build_delay_tables(network_name="ga_intercity", model_names=("KNeighborsClassifier", "MLPClassifier")):
+    """ Compiles each segment's models into delay tables, checks every entry of the tables against the models and
+    saves them for prediction_model to look predictions up from. Tables which disagree with their model anywhere are
+    not saved.
+
+    :param str network_name: Name of the network in the networks table
+    :param model_names:      Class names of the models to compile
+
+    :rtype: dict
+    :return: {model name: number of inputs where a table disagreed with its model, which should be 0}
+    """
+    if model.tables is None:
+        raise ValueError("prediction_model.tables is not set")
+    n = services.get_network(network_name)
+    results = {}
+    for model_name in model_names:
+        start = time.perf_counter()
+        compiled = model.compile_delay_tables(n, model_name)
+        compile_time = time.perf_counter() - start
+        disagreements = model.verify_delay_tables(n, model_name, compiled)
+        for segment, count in disagreements.items():
+            if count:
+                print(model_name, "table from", segment[0], "to", segment[1], "disagrees with its model on", count,
+                      "inputs, it is not saved")
+                del compiled[segment]
+        model.tables.save(network_name, model_name, compiled, n.get_version())
+        results[model_name] = sum(disagreements.values())
+        print("compiled %d %s tables in %.1fs, %d disagreements with the models" %
+              (len(compiled), model_name, compile_time, results[model_name]))
+    return results
+
+
+def _fit_segment(fit, stn_from, stn_to):
+    # run in a worker process, returning the fitted model and scaler and the seconds taken to fit them. fit reads the
+    # segment as the parent last exported it, the export is never brought up to date from a worker
+    start = time.perf_counter()
+    model_scaler = fit(stn_from, stn_to)
+    return model_scaler, time.perf_counter() - start
 
 
 if __name__ == "__main__":
     # build_ga_intercity()
     # build_model()
     # build_all_station_models()
+    # build_delay_tables()
     pass
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tables of every change in delay a segment's model can predict, so a prediction is looked up rather than computed
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : delay_tables.py
+Date    : Sunday 18 October 2026
+Desc.   : The models only ever see a day of the week, whether it is a weekday, whether the train is off peak, an hour
+          of the day and a delay of -30 to 30 minutes. A table holds the model's prediction for every one of those
+          inputs, indexed [day_of_week - 1, off_peak, hour_of_day, delay + 30] (weekday follows from day_of_week).
+          The tables of one network and type of model are kept together in a .npz file, written by
+          create_services.build_delay_tables() and read by prediction_model. Each file records the version of the
+          network its tables were compiled from, and is not used with any other version.
+History : 18/10/2026 - v1.0 - Create project file, DelayTables.
+          18/10/2026 - v1.1 - Tables kept with the network version they were compiled from, added discard() and
+                              modified().
+"""
+import os
+import threading
+
+import numpy as np
+
+__author__     = "Martin Siddons"
+__credits__    = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Martin Siddons"
+__email__      = "m.siddons@uea.ac.uk"
+__status__     = "Prototype"  # "Development" "Prototype" "Production"
+
+MAX_DELAY = 30  # the dataset's delays are clipped to this many minutes either way
+SHAPE = (7, 2, 24, 2 * MAX_DELAY + 1)  # day_of_week, off_peak, hour_of_day, delay
+VERSION_KEY = "version"  # array of a file holding the version of the network its tables were compiled from
+
+
+def grid_rows():
+    """
+    :rtype: np.ndarray
+    :return: Every input a table covers as rows of (day_of_week, weekday, off_peak, hour_of_day, delay), in the order
+             which np.reshape(predictions, SHAPE) puts them back into a table
+    """
+    day, off_peak, hour, delay = np.indices(SHAPE).reshape(4, -1)
+    return np.column_stack([day + 1, (day < 5).astype(int), off_peak, hour, delay - MAX_DELAY]).astype(float)
+
+
+class DelayTables:
+    """Folder of .npz files, one for each network and type of model, each holding a table for every segment."""
+    def __init__(self, folder):
+        """
+        :param str folder: Folder to keep the files in, created when a file is first saved
+        """
+        self.folder = folder
+        self._loaded = {}  # (network name, model name): (modified time of the file, version, {segment: table})
+        self._lock = threading.Lock()
+
+    def save(self, network_name, model_name, tables, version):
+        """Replaces the tables of a network and type of model.
+
+        :param str network_name: Name of the network the models belong to
+        :param str model_name:   Class name of the models, e.g. "KNeighborsClassifier"
+        :param dict tables:      {(tpl_from, tpl_to): np.ndarray of SHAPE}
+        :param int version:      Version of the network the models were compiled from, see Network.get_version()
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.__path(network_name, model_name)
+        arrays = {tpl_from + "-" + tpl_to: table for (tpl_from, tpl_to), table in tables.items()}
+        arrays[VERSION_KEY] = np.array(-1 if version is None else version)
+        with open(path + ".tmp", "wb") as tables_file:
+            np.savez(tables_file, **arrays)
+        os.replace(path + ".tmp", path)
+
+    def get(self, network_name, model_name, version):
+        """
+        :param str network_name: Name of the network the models belong to
+        :param str model_name:   Class name of the models
+        :param int version:      Version of the network the caller is predicting with
+        :rtype: dict or None
+        :return: {(tpl_from, tpl_to): table}, read again if the file has changed since it was last read. None if there
+                 is no file or its tables were compiled from another version of the network
+        """
+        loaded = self.__load(network_name, model_name)
+        if loaded is None or version is None or loaded[0] != version:
+            return None
+        return loaded[1]
+
+    def modified(self, network_name, model_name):
+        """
+        :param str network_name: Name of the network the models belong to
+        :param str model_name:   Class name of the models
+        :rtype: float or None
+        :return: Time the file was last written, None if there is no file
+        """
+        try:
+            return os.path.getmtime(self.__path(network_name, model_name))
+        except OSError:
+            return None
+
+    def discard(self, network_name, model_name, segment, version, new_version):
+        """Drops the table of a segment whose model has been replaced, so the tables of the other segments can still
+        be used with the network as stored with the new model. Tables compiled from a version other than the one the
+        network was at before the model was stored are already out of date, and are left as they are.
+
+        :param str network_name: Name of the network the model belongs to
+        :param str model_name:   Class name of the model
+        :param tuple segment:    (tpl_from, tpl_to) of the segment
+        :param int version:      Version of the network before the model was stored
+        :param int new_version:  Version of the network with the model stored
+        """
+        loaded = self.__load(network_name, model_name)
+        if loaded is None or version is None or loaded[0] != version:
+            return
+        tables = {key: table for key, table in loaded[1].items() if key != tuple(segment)}
+        self.save(network_name, model_name, tables, new_version)
+
+    def __load(self, network_name, model_name):
+        """
+        :rtype: tuple or None
+        :return: (version the tables were compiled from, {(tpl_from, tpl_to): table}), None if there is no file
+        """
+        path = self.__path(network_name, model_name)
+        modified = self.modified(network_name, model_name)
+        if modified is None:
+            return None
+        with self._lock:
+            loaded = self._loaded.get((network_name, model_name))
+            if loaded is None or loaded[0] != modified:
+                with np.load(path) as tables_file:
+                    # files saved before the version was kept hold -1, matching no network
+                    version = int(tables_file[VERSION_KEY]) if VERSION_KEY in tables_file.files else -1
+                    tables = {tuple(key.split("-", 1)): tables_file[key] for key in tables_file.files
+                              if key != VERSION_KEY}
+                loaded = modified, version, tables
+                self._loaded[(network_name, model_name)] = loaded
+            return loaded[1:]
+
+    def __path(self, network_name, model_name):
+        return os.path.join(self.folder, network_name + "-" + model_name + ".npz")
+
+
+def lookup(table, entry, delay):
+    """
+    :param np.ndarray table: Table of a segment, as returned in DelayTables.get()
+    :param list entry:       Entry as given by process_data.query_to_input()
+    :param delay:            Minutes the train is delayed by before this segment
+    :return: Change in delay the segment's model predicts, or None if the input is not one the table covers
+    """
+    day_of_week, weekday, off_peak, hour_of_day = entry[2:6]
+    if delay != int(delay) or not -MAX_DELAY <= delay <= MAX_DELAY or weekday != (day_of_week <= 5) \
+            or not (1 <= day_of_week <= 7 and off_peak in (0, 1) and 0 <= hour_of_day <= 23):
+        return None
+    return int(table[day_of_week - 1, off_peak, hour_of_day, int(delay) + MAX_DELAY])
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compares how many messages per second each dialogue backend can process
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : dialogue_benchmark.py
+Date    : Sunday 18 October 2026
+Desc.   : Replays recorded conversations, as they come out of the NLP, through the experta Chatbot and the
+          dialogue_flow FlowChatbot. Fare lookups and delay predictions are replaced with fixed answers so only the
+          reasoning itself is timed. Run with python -m model.dialogue_benchmark from the project root.
+History : 18/10/2026 - v1.0 - Create project file.
+"""
+import datetime
+import random
+import time
+
+import model.reasoning_engine as re
+
+__author__ = "Steven Diep"
+__credits__ = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Steven Diep"
+__email__ = "steven_diep@hotmail.co.uk"
+__status__ = "Prototype"  # "Development" "Prototype" "Production"
+
+
+def nlp_output(**kwargs):
+    """
+    :param kwargs: Keys of the NLP output which differ from an empty message
+    :rtype: dict
+    :return: A message as returned by nlp.parse_user_input()
+    """
+    info = {'intent': '', 'reset': False, 'includes_greeting': False,
+            'from_station': '', 'from_crs': '', 'to_station': '', 'to_crs': '',
+            'outward_date': '', 'outward_time': '', 'return_date': '', 'return_time': '',
+            'confirmation': '', 'no_category': [], 'suggestion': [],
+            'sanitized_message': '', 'raw_message': ''}
+    info.update(kwargs)
+    return info
+
+
+def recorded_transcripts():
+    """
+    :rtype: list[list[dict]]
+    :return: Conversations, each a list of messages as returned by nlp.parse_user_input()
+    """
+    leave = datetime.date.today() + datetime.timedelta(days=7)
+    back = leave + datetime.timedelta(days=2)
+    return [
+        # a return ticket asked for a piece at a time, with one adjustment before it is confirmed
+        [nlp_output(includes_greeting=True, raw_message='hi'),
+         nlp_output(intent='ticket', raw_message='i would like to book a ticket'),
+         nlp_output(from_station='Norwich', from_crs='NRW', raw_message='from norwich'),
+         nlp_output(no_category=['Forest Gate'], raw_message='Forest Gate'),
+         nlp_output(no_category=[leave], raw_message='next week'),
+         nlp_output(no_category=[datetime.time(12, 0)], raw_message='12pm'),
+         nlp_output(confirmation=True, raw_message='yes'),
+         nlp_output(no_category=[back], raw_message='two days later'),
+         nlp_output(no_category=[datetime.time(18, 0)], raw_message='6pm'),
+         nlp_output(confirmation=False, raw_message='no'),
+         nlp_output(raw_message='Departure time'),
+         nlp_output(no_category=[datetime.time(13, 0)], raw_message='1pm'),
+         nlp_output(confirmation=True, raw_message='yes'),
+         nlp_output(confirmation=True, raw_message='yes'),
+         nlp_output(confirmation=False, raw_message='no')],
+        # a single ticket given in one message, then a delay query and some help
+        [nlp_output(intent='ticket', from_station='Norwich', from_crs='NRW', to_station='Forest Gate', to_crs='FOG',
+                    outward_date=leave, outward_time=datetime.time(12, 0),
+                    raw_message='a ticket from norwich to forest gate next week at 12pm'),
+         nlp_output(confirmation=False, raw_message='no'),
+         nlp_output(confirmation=True, raw_message='yes'),
+         nlp_output(confirmation=False, raw_message='no'),
+         nlp_output(intent='delay', raw_message='my train is delayed'),
+         nlp_output(from_station='Norwich', from_crs='NRW', to_station='Forest Gate', to_crs='FOG',
+                    raw_message='norwich to forest gate'),
+         nlp_output(raw_message='10 minutes'),
+         nlp_output(intent='help', raw_message='help'),
+         nlp_output(intent='cancel', raw_message='cancel'),
+         nlp_output(reset=True, raw_message='reset'),
+         nlp_output(raw_message='gibberish')],
+    ]
+
+
+def replay(backend, transcripts, repeats=20):
+    """Replays the transcripts through the given backend, with a new conversation for each run of a transcript.
+
+    :param str backend:      "experta" or "flow", see reasoning_engine.configure_sessions()
+    :param list transcripts: Conversations as returned by recorded_transcripts()
+    :param int repeats:      Number of times to replay every transcript
+    :rtype: tuple[float, list]
+    :return: Messages processed per second, and what the bot sent back for each message of the first replay
+    """
+    sent = []
+    replaced = {name: getattr(re, name) for name in
+                ['send_message', 'send_list', 'single_fare', 'return_fare', 'user_to_query', 'fare_lookups']}
+    re.send_message = lambda message: sent.append(message)
+    re.send_list = lambda message, items: sent.append((message, list(items)))
+    re.single_fare = lambda *args: (12.5, "12:04", "https://example.com/single")
+    re.return_fare = lambda *args: (25.0, "12:04", "18:02", "https://example.com/return")
+    re.user_to_query = lambda *args: 12
+    re.fare_lookups = None  # fares are found straight away, so look them up in place
+    try:
+        re.configure_sessions(backend=backend)
+        replies = []
+        turns = 0
+        start = time.perf_counter()
+        for run in range(repeats):
+            for n, transcript in enumerate(transcripts):
+                sid = "%s-%d-%d" % (backend, run, n)
+                for message in transcript:
+                    random.seed(n)  # so both backends pick the same wording
+                    del sent[:]
+                    re.process_user_input(dict(message), sid)
+                    if run == 0:
+                        replies.append(list(sent))
+                    turns += 1
+                re.refresh_user_knowledge(sid)
+        elapsed = time.perf_counter() - start
+    finally:
+        for name, value in replaced.items():
+            setattr(re, name, value)
+    return turns / elapsed, replies
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+
+    transcripts = recorded_transcripts()
+    results = {}
+    for name in ["experta", "flow"]:
+        with contextlib.redirect_stdout(io.StringIO()):  # process_user_input prints every message
+            results[name] = replay(name, transcripts)
+        print("%-8s %8.0f messages/s" % (name, results[name][0]))
+    print("speed up: %.1fx" % (results["flow"][0] / results["experta"][0]))
+    print("same replies: " + str(results["flow"][1] == results["experta"][1]))
+    re.configure_sessions(backend="experta")
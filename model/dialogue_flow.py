@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A table driven replacement for the experta pattern matching behind the Chatbot's conversation
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : dialogue_flow.py
+Date    : Sunday 18 October 2026
+Desc.   : The Chatbot rules only ever test which slots of a booking have been filled, so the conditions of each rule
+          are read from its @Rule into a table and checked directly against the filled slots. The rule bodies of the
+          Chatbot are reused as they are, so both backends send the same messages.
+History : 18/10/2026 - v1.0 - Create project file, FlowChatbot.
+          18/10/2026 - v1.1 - FLOW read from the Chatbot rules rather than written out by hand.
+"""
+from experta import Fact, Rule, NOT, W, L
+from experta.conditionalelement import ConditionalElement
+from experta.fieldconstraint import ORFC
+from model.reasoning_engine import Chatbot
+
+__author__ = "Steven Diep"
+__credits__ = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Steven Diep"
+__email__ = "steven_diep@hotmail.co.uk"
+__status__ = "Prototype"  # "Development" "Prototype" "Production"
+
+ANY = "any"    # the slot must be filled
+BIND = "bind"  # the slot must be filled, its value is passed to the rule under the same name
+# anything else is a tuple of the values the slot may hold
+
+
+def flow_from_rules(engine_class=Chatbot):
+    """Reads the conditions of each @Rule of the engine into a flow entry, less the begin fact every rule needs. Each
+    entry is the rule, the facts it needs (key: test, all keys on the same fact) and the slots that must be empty.
+
+    :param type engine_class: KnowledgeEngine whose rules to read
+    :rtype: list[tuple]
+    :return: (name, facts needed, slots that must be empty) for each rule, in the order they are declared
+    :raises ValueError: if a rule has a condition the flow can't test
+    """
+    flow = []
+    for name, rule in vars(engine_class).items():
+        if not isinstance(rule, Rule):
+            continue
+        needs, empty = [], []
+        for pattern in rule:
+            if isinstance(pattern, NOT) and len(pattern) == 1 and isinstance(pattern[0], Fact) \
+                    and all(__slot_test(name, key, test) == ANY for key, test in pattern[0].as_dict().items()):
+                empty.extend(pattern[0].as_dict())
+            elif isinstance(pattern, Fact) and pattern.as_dict() != {"action": "begin"}:
+                needs.append({key: __slot_test(name, key, test) for key, test in pattern.as_dict().items()})
+            elif not isinstance(pattern, Fact):
+                raise ValueError("Rule " + name + " has a condition the flow can't test: " + repr(pattern))
+        flow.append((name, needs, empty))
+    return flow
+
+
+def __slot_test(name, key, test):
+    """
+    :param str name: Name of the rule, for the error
+    :param str key:  Key of the fact the test is on
+    :param test:     Value or field constraint of the key in the rule's Fact
+    :return: The test as written in a flow entry, ANY, BIND or a tuple of the values the slot may hold
+    :raises ValueError: if the flow can't test it
+    """
+    if isinstance(test, W):
+        if test.__bind__ is None:
+            return ANY
+        if test.__bind__ == key:
+            return BIND
+    elif isinstance(test, L):
+        return test.value,
+    elif isinstance(test, ORFC) and all(isinstance(value, L) for value in test):
+        return tuple(value.value for value in test)
+    elif not isinstance(test, ConditionalElement):
+        return test,
+    raise ValueError("Rule " + name + " has a test on " + key + " the flow can't check: " + repr(test))
+
+
+FLOW = flow_from_rules()
+
+
+def compile_flow(flow=None):
+    """Pairs each entry of the flow with the body and salience of the Chatbot rule it names, highest salience first.
+
+    :param list flow: Entries as in FLOW
+    :rtype: list[tuple]
+    :return: (name, salience, rule body, facts needed, slots that must be empty) for each rule
+    """
+    compiled = []
+    for name, needs, empty in flow if flow is not None else FLOW:
+        rule = Chatbot.__dict__.get(name)
+        if rule is None:
+            raise ValueError("Chatbot has no rule named " + name)
+        # call the undecorated function, the Rule object remembers whichever engine it was last looked up on
+        compiled.append((name, rule.salience, rule.__wrapped__, needs, empty))
+    compiled.sort(key=lambda entry: -entry[1])
+    return compiled
+
+
+_compiled_flow = compile_flow()
+
+
+class FlowChatbot:
+    """Drop-in replacement for a Chatbot engine. Facts are kept as plain dicts, and on each run the rule with the
+    highest salience whose conditions hold, and which has not already fired on the same facts, is fired next. This is
+    the order experta's depth strategy fires the Chatbot rules in."""
+    refresh_knowledge = Chatbot.refresh_knowledge
+    current_facts = Chatbot.current_facts
+    sid = None
+
+    def __init__(self):
+        self.currentInfo = {}
+        self.dictionary = {}
+        self.facts = {}     # fact id: content
+        self.__slots = {}   # key: ids of the facts holding it, oldest first
+        self.__next_id = 0
+        self.__fired = set()
+        self.__halted = False
+
+    def reset(self):
+        """Replaces the facts with those describing currentInfo. Called from a rule this ends the run, as in experta."""
+        self.facts = {}
+        self.__slots = {}
+        self.__fired = set()
+        self.__halted = True
+        self.declare(*self.current_facts())
+
+    def declare(self, *facts):
+        """
+        :param facts: experta Facts to add, any with the same content as a fact already held are ignored
+        """
+        for fact in facts:
+            content = fact.as_dict()
+            if content in self.facts.values():
+                continue
+            self.facts[self.__next_id] = content
+            for key in content:
+                self.__slots.setdefault(key, []).append(self.__next_id)
+            self.__next_id += 1
+
+    def step(self):
+        """Processes one message, facts are always rebuilt from currentInfo as there is no network to keep."""
+        self.reset()
+        self.run()
+
+    def run(self):
+        """Fires rules until none are left to fire or a rule resets the engine."""
+        self.__halted = False
+        while not self.__halted:
+            activation = self.__next_activation()
+            if activation is None:
+                break
+            name, body, fact_ids, bindings = activation
+            self.__fired.add((name, fact_ids))
+            body(self, **bindings)
+
+    def __next_activation(self):
+        # rules are in salience order so the first one with an unfired match wins, among matches of the same rule the
+        # one on the newest facts goes first
+        best = None
+        for name, salience, body, needs, empty in _compiled_flow:
+            if best is not None and salience < best[0]:
+                break
+            if any(self.__slots.get(slot) for slot in empty):
+                continue
+            for fact_ids, bindings in self.__matches(needs):
+                if (name, fact_ids) in self.__fired:
+                    continue
+                key = (salience, sorted(fact_ids, reverse=True))
+                if best is None or key > best[0:2]:
+                    best = (salience, key[1], (name, body, fact_ids, bindings))
+        return best[2] if best is not None else None
+
+    def __matches(self, needs, index=0, fact_ids=(), bindings=None):
+        # every combination of facts meeting the needs from index on, with the values bound by them
+        if bindings is None:
+            bindings = {}
+        if index == len(needs):
+            yield fact_ids, bindings
+            return
+        need = needs[index]
+        for fact_id in self.__slots.get(next(iter(need)), []):
+            content = self.facts[fact_id]
+            bound = dict(bindings)
+            for key, test in need.items():
+                if key not in content:
+                    break
+                if test == BIND:
+                    bound[key] = content[key]
+                elif test != ANY and content[key] not in test:
+                    break
+            else:
+                yield from self.__matches(needs, index + 1, fact_ids + (fact_id,), bound)
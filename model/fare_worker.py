@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Runs fare lookups in the background so a slow National Rail page does not hold up other users' messages
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : fare_worker.py
+Date    : Sunday 18 October 2026
+Desc.   : Lookups are handed to a small pool of threads and their result is pushed to the user who asked for it. The
+          number of lookups waiting or running is capped, past that the caller is told to do the lookup itself.
+History : 18/10/2026 - v1.0 - Create project file, FareWorker.
+          18/10/2026 - v1.1 - The user is sent the message of a ValueError or NotImplementedError, added on_error.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+__author__ = "Steven Diep"
+__credits__ = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Steven Diep"
+__email__ = "steven_diep@hotmail.co.uk"
+__status__ = "Prototype"  # "Development" "Prototype" "Production"
+
+
+class FareWorker:
+    """A bounded pool of threads for fare lookups. Threads are only started as lookups come in."""
+    def __init__(self, max_workers=4, max_pending=32):
+        """
+        :param int max_workers: Most lookups to run at once
+        :param int max_pending: Most lookups to hold at once, running or waiting for a thread
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fare")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(self, sid, lookup, push, error_message, on_error=None):
+        """Runs lookup on a worker thread and pushes what it returns to the user.
+
+        :param str sid:           Socket.IO sid of the user to send the result to
+        :param lookup:            Function taking no arguments and returning the message to send
+        :param push:              Function taking the sid and a message, which sends the message to that user
+        :param str error_message: Message sent instead if lookup raises anything other than a ValueError or
+                                  NotImplementedError, whose own message is meant for the user and is sent instead
+        :param on_error:          Function taking the sid, called before the error is pushed if lookup raises
+        :rtype: bool
+        :return: True if the lookup was queued, False if too many lookups are already pending
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        try:
+            self._executor.submit(self.__run, sid, lookup, push, error_message, on_error)
+        except RuntimeError:  # shut down
+            self._slots.release()
+            self.rejected += 1
+            return False
+        return True
+
+    def shutdown(self, wait=True):
+        """
+        :param bool wait: True to wait for lookups already queued to finish
+        """
+        self._executor.shutdown(wait=wait)
+
+    def __run(self, sid, lookup, push, error_message, on_error):
+        try:
+            try:
+                message = lookup()
+            except Exception as e:
+                print(e)
+                self.failed += 1
+                message = str(e) if isinstance(e, (ValueError, NotImplementedError)) else error_message
+                if on_error is not None:
+                    on_error(sid)
+            push(sid, message)
+        except Exception as e:  # the user has most likely gone, nothing more can be done
+            print(e)
+        finally:
+            self._slots.release()
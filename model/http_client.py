@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Shared HTTP client for the scraper, reusing connections between requests
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : http_client.py
+Date    : Sunday 18 October 2026
+Desc.   : Wraps a requests.Session whose connections are kept alive and pooled per host. Every request has a connect
+          and read timeout, and requests answered with a 5xx error are retried with a growing delay between attempts.
+History : 18/10/2026 - v1.0 - Create project file, HttpClient.
+          18/10/2026 - v1.1 - Added RateLimiter.
+"""
+import time
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+__author__     = "Martin Siddons"
+__credits__    = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Martin Siddons"
+__email__      = "m.siddons@uea.ac.uk"
+__status__     = "Prototype"  # "Development" "Prototype" "Production"
+
+
+class HttpClient:
+    """A requests.Session with pooled keep-alive connections, timeouts and retries, which records how long each
+    request took."""
+    def __init__(self, pool_size=8, connect_timeout=5, read_timeout=30, retries=3, backoff=0.5, hosts=10):
+        """
+        :param int pool_size:         Most connections kept open to one host, callers wait for a free one past this
+        :param float connect_timeout: Seconds to wait for a connection to be made
+        :param float read_timeout:    Seconds to wait between bytes of the response
+        :param int retries:           Times a request is retried after a connection error or 5xx response
+        :param float backoff:         Seconds before the first retry, doubling after each further retry
+        :param int hosts:             Most hosts to keep a pool of connections for
+        """
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                      status_forcelist=(500, 502, 503, 504), allowed_methods=frozenset(["GET", "POST"]),
+                      raise_on_status=False)  # once out of retries, hand back the last error page as requests would
+        self._adapter = HTTPAdapter(pool_connections=hosts, pool_maxsize=pool_size, pool_block=True,
+                                    max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)  # seconds taken by the most recent requests
+        self.requests = 0
+        self.errors = 0
+        self.retried = 0
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    def get(self, url, **kwargs):
+        """
+        :param str url: URL to fetch
+        :param kwargs:  Passed on to requests, e.g. headers. timeout defaults to the client's timeouts
+        :rtype: requests.Response
+        :raises requests.RequestException: if no response was had after every retry
+        """
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """
+        :param str url: URL to post to
+        :param kwargs:  Passed on to requests, e.g. headers, auth, json. timeout defaults to the client's timeouts
+        :rtype: requests.Response
+        :raises requests.RequestException: if no response was had after every retry
+        """
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            response = self._session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.in_flight -= 1
+                self._latencies.append(elapsed)
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            with self._lock:
+                self.retried += len(retries.history)
+        return response
+
+    def metrics(self):
+        """
+        :rtype: dict
+        :return: Counts of requests, errors and retries, latency figures in seconds over the most recent requests,
+                 and for each host the connections opened, requests made and connections sitting idle in its pool
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result = {"requests": self.requests, "errors": self.errors, "retried": self.retried,
+                      "in_flight": self.in_flight, "most_in_flight": self.most_in_flight}
+        if latencies:
+            result["latency_mean"] = sum(latencies) / len(latencies)
+            result["latency_p50"] = latencies[len(latencies) // 2]
+            result["latency_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            result["latency_max"] = latencies[-1]
+        pools = {}
+        manager = self._adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:  # dropped since the keys were read
+                continue
+            pools[pool.scheme + "://" + pool.host] = {"connections": pool.num_connections,
+                                                      "requests": pool.num_requests,
+                                                      "idle": _idle_connections(pool)}
+        result["pools"] = pools
+        return result
+
+    def close(self):
+        self._session.close()
+
+
+class RateLimiter:
+    """Spaces calls to wait() out so no more than per_second of them return each second, across all threads."""
+    def __init__(self, per_second):
+        """
+        :param float per_second: Most calls to let through a second, 0 or None for no limit
+        """
+        self.interval = 1.0 / per_second if per_second else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the caller may go ahead."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _idle_connections(pool):
+    # the pool's queue is filled with None for each connection not yet opened, only count the open ones
+    if pool.pool is None:
+        return 0
+    return sum(1 for conn in list(pool.pool.queue) if conn is not None)
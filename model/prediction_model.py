@@ -12,6 +12,14 @@ History : 03/01/2020 - v1.0 - Create project file
           20/01/2020 - v1.1 - Added use_model function.
           01/02/2020 - v1.2 - Added bayes model generator.
           04/02/2020 - v1.3 - Added ANN model generator.
+          18/10/2026 - v1.4 - Trainers read their pair of stations from the exported segments when there are any.
+          18/10/2026 - v1.5 - Split fitting each model out of its trainer, for create_services to run in parallel.
+          18/10/2026 - v1.6 - Added use_journey_models function.
+          18/10/2026 - v1.7 - Predictions looked up from compiled delay tables where they cover the input.
+          18/10/2026 - v1.8 - Added prewarm function.
+          18/10/2026 - v1.9 - Delay tables only used with the network version they were compiled from, a segment's
+                              table dropped when its model is trained again.
+          18/10/2026 - v1.10 - Segments brought up to date by the trainers, the fit functions only read them.
 
 """
 import sqlite3
@@ -19,6 +27,7 @@ import os.path
 import pandas as pd
 import numpy as np
 from data import services
+from model import training_data, delay_tables
 from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.linear_model import BayesianRidge
@@ -30,6 +39,15 @@ __maintainer__ = "Martin Siddons"
 __email__      = "m.siddons@uea.ac.uk"
 __status__     = "Prototype"  # "Development" "Prototype" "Production"
 
+# the dataset split by pair of stations, set to None to always read the dataset table
+segments = training_data.SegmentStore(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "segments"),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "dataset.sqlite"))
+
+# predictions of each segment's model over every input, set to None to always run the models
+tables = delay_tables.DelayTables(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data",
+                                               "delay_tables"))
+
 
 def knn_model_trainer(station_from, station_to, network):
     """ Build a KNN model for delay prediction between the given stations and save to the provided Network object,
@@ -39,15 +57,21 @@ def knn_model_trainer(station_from, station_to, network):
     :param str station_to:   TPL code of the station the train is next calling at
     :param services.Network network: Network to save the model to
     """
-    # get the relevant data from the db
-    conn = __connect_to_dataset()
-    df = pd.read_sql_query(""" SELECT * FROM dataset WHERE tpl_from="{}" AND tpl_to="{}" AND delay_change<=5 
-                               AND delay_change>=-5 """.format(station_from, station_to), conn)  # data_model
-    conn.close()
+    __refresh_segments()
+    __save_model(station_from, station_to, knn_model_fit(station_from, station_to), network)
+
 
-    # preprocessing - splitting attributes (x) and labels (y)
-    x = df.iloc[:, 2:-1].values
-    y = df.iloc[:, 7].values
+def knn_model_fit(station_from, station_to):
+    """ Build a KNN model for delay prediction between the given stations.
+
+    :param str station_from: TPL code of the station the train is leaving from
+    :param str station_to:   TPL code of the station the train is next calling at
+
+    :rtype: list[KNeighborsClassifier, StandardScaler]
+    :return: The model and the scaler its attributes are scaled with
+    """
+    # get the relevant data, split into attributes (x) and labels (y)
+    x, y = __training_data(station_from, station_to, 5)
 
     # feature scaling
     scaler = StandardScaler()
@@ -58,14 +82,7 @@ def knn_model_trainer(station_from, station_to, network):
     model = KNeighborsClassifier(n_neighbors=30)
     model.fit(x, y)
     print("built model from", station_from, "to", station_to)
-
-    # save model to network object and update network on db
-    conn = __connect_to_db()
-    stn_to = network.get_station(station_to)
-    model_scaler = [model, scaler]
-    network.get_station(station_from).add_model(stn_to, model_scaler)
-    services.store_network(network, conn)
-    conn.close()
+    return [model, scaler]
 
 
 def bayes_model_trainer(station_from, station_to, network):
@@ -75,32 +92,28 @@ def bayes_model_trainer(station_from, station_to, network):
     :param station_from: TPL code of the station the train is leaving from
     :param station_to:   TPL code of the station the train is next calling at
     :param services.Network network: Network to save the model to
-
-    :rtype: BayesianRidge
-    :return: BayesianRidge model to compute the delay between the given stations
     """
-    # get the data
-    conn = __connect_to_dataset()
-    df = pd.read_sql_query(""" SELECT * FROM dataset WHERE tpl_from="{}" AND tpl_to="{}" """.format
-                           (station_from, station_to), conn)  # data_model
-    conn.close()
+    __refresh_segments()
+    __save_model(station_from, station_to, bayes_model_fit(station_from, station_to), network)
+
 
-    # split data into attributes and labels
-    x = df.iloc[:, 2:-1].values
-    y = df.iloc[:, 7].values
+def bayes_model_fit(station_from, station_to):
+    """ Build a Bayesian Ridge Regression Model from the requested journey.
+
+    :param station_from: TPL code of the station the train is leaving from
+    :param station_to:   TPL code of the station the train is next calling at
+
+    :rtype: list[BayesianRidge, None]
+    :return: BayesianRidge model to compute the delay between the given stations, and no scaler
+    """
+    # get the data, split into attributes and labels
+    x, y = __training_data(station_from, station_to)
 
     # build model
     model = BayesianRidge()
     model.fit(x, y)
     # an algorithm is needed to accurately interpret the floating-point value given by the model as a categorical value.
-
-    # save model to network object and update network on db
-    conn = __connect_to_db()
-    stn_to = network.get_station(station_to)
-    model_scaler = [model, None]
-    network.get_station(station_from).add_model(stn_to, model_scaler)
-    services.store_network(network, conn)
-    conn.close()
+    return [model, None]
 
 
 def ann_model_trainer(station_from, station_to, network):
@@ -111,15 +124,21 @@ def ann_model_trainer(station_from, station_to, network):
     :param station_to: TPL code of the station the train is next calling at
     :param services.Network network: Network to save the model to
     """
-    # get the relevant data from the db
-    conn = __connect_to_dataset()
-    df = pd.read_sql_query(""" SELECT * FROM dataset WHERE tpl_from="{}" AND tpl_to="{}" AND delay_change<=5 
-                               AND delay_change>=-5 """.format(station_from, station_to), conn)  # data_model
-    conn.close()
+    __refresh_segments()
+    __save_model(station_from, station_to, ann_model_fit(station_from, station_to), network)
+
 
-    # preprocessing - splitting attributes (x) and labels (y)
-    x = df.iloc[:, 2:-1].values
-    y = df.iloc[:, 7].values
+def ann_model_fit(station_from, station_to):
+    """ Build a Multi-layer Perceptron Artificial Neural Network to predict train delays between the given stations.
+
+    :param station_from: TPL code of the station the train is leaving from
+    :param station_to: TPL code of the station the train is next calling at
+
+    :rtype: list[MLPClassifier, StandardScaler]
+    :return: The model and the scaler its attributes are scaled with
+    """
+    # get the relevant data, split into attributes (x) and labels (y)
+    x, y = __training_data(station_from, station_to, 5)
 
     # feature scaling
     scaler = StandardScaler()
@@ -130,14 +149,7 @@ def ann_model_trainer(station_from, station_to, network):
     model = MLPClassifier(hidden_layer_sizes=5, activation='tanh', max_iter=1000, learning_rate_init=0.003)
     model.fit(x, y)
     print("built model from", station_from, "to", station_to)
-
-    # save model to network object and update network on db
-    conn = __connect_to_db()
-    stn_to = network.get_station(station_to)
-    model_scaler = [model, scaler]
-    network.get_station(station_from).add_model(stn_to, model_scaler)
-    services.store_network(network, conn)
-    conn.close()
+    return [model, scaler]
 
 
 def use_model(entry, delay, network):
@@ -146,24 +158,28 @@ def use_model(entry, delay, network):
     s_from     = entry[0]
     s_to       = entry[1]
 
-    # pull the model and station objects from the Network object
-    stn_from = network.get_station(s_from)
-    stn_to   = network.get_station(s_to)
-    m_s      = stn_from.get_model(stn_to, model_name)  # list containing the model and the scaler
-    model    = m_s[0]
-    scaler   = m_s[1]
+    # look the prediction up if the model has been compiled into a table
+    result = __table_lookup(network, model_name, entry, delay)
 
-    entry.append(delay)
-    data = np.array([entry])
-    df = pd.DataFrame(data=data)
+    if result is None:
+        # pull the model and station objects from the Network object
+        stn_from = network.get_station(s_from)
+        stn_to   = network.get_station(s_to)
+        m_s      = stn_from.get_model(stn_to, model_name)  # list containing the model and the scaler
+        model    = m_s[0]
+        scaler   = m_s[1]
+
+        data = np.array([entry + [delay]])
+        df = pd.DataFrame(data=data)
 
-    # assign attributes, scale and transform
-    x = df.iloc[:, 2:].values
-    if scaler is not None:
-        x = scaler.transform(x)
+        # assign attributes, scale and transform
+        x = df.iloc[:, 2:].values
+        if scaler is not None:
+            x = scaler.transform(x)
 
-    result = model.predict(x)
-    result = result[0]  # change the array returned from the prediction into an integer value
+        result = model.predict(x)
+        result = result[0]  # change the array returned from the prediction into an integer value
+    entry.append(delay)
     while delay + result < -1:
         result += 1  # quick fix for runaway negative time estimations which are not handled well by the models
 
@@ -174,6 +190,233 @@ def use_model(entry, delay, network):
     return result
 
 
+def use_journey_models(entries, delay, network, model_name="KNeighborsClassifier"):
+    """ Predicts the change in delay over each hop of a journey in turn, each hop starting from the delay the hops
+    before it left the train with. Gives the same changes as calling use_model on each entry, without building a
+    DataFrame or checking the input again for every hop. Hops a delay table covers are looked up from it.
+
+    :param list[list] entries:       Entries for each hop as given by process_data.query_to_input(), in journey order
+    :param int delay:                Minutes the train is delayed by before the first hop
+    :param services.Network network: Network holding the models
+    :param str model_name:           Class name of the models to use, "KNeighborsClassifier" or "MLPClassifier"
+
+    :rtype: list
+    :return: Change in delay predicted for each hop
+    """
+    if not entries:
+        return []
+    # every hop's attributes in one array, the delay column is filled in as the journey goes
+    x = np.zeros((len(entries), 5))
+    x[:, :4] = [entry[2:6] for entry in entries]
+
+    # each segment's model is fetched the first time a hop can't be looked up from a table, and the hops using it
+    # are scaled together then, leaving only the delay to scale per hop
+    hops = {}  # (tpl_from, tpl_to): indices of the hops between the two stations
+    for i, entry in enumerate(entries):
+        hops.setdefault((entry[0], entry[1]), []).append(i)
+    x_scaled = np.empty_like(x)
+    segments = {}  # (tpl_from, tpl_to): model, and the mean and scale of the delay
+
+    compiled = tables.get(network.get_name(), model_name, network.get_version()) if tables is not None else None
+    changes = []
+    total_delay = delay
+    for i, entry in enumerate(entries):
+        key = (entry[0], entry[1])
+        result = None
+        if compiled is not None and key in compiled:
+            result = delay_tables.lookup(compiled[key], entry, total_delay)
+        if result is None:
+            if key not in segments:
+                model, scaler = network.get_station(key[0]).get_model(network.get_station(key[1]), model_name)
+                mean, scale = np.zeros(5), np.ones(5)
+                if scaler is not None:
+                    mean = scaler.mean_ if scaler.with_mean else mean
+                    scale = scaler.scale_ if scaler.with_std else scale
+                x_scaled[hops[key]] = (x[hops[key]] - mean) / scale
+                segments[key] = model, mean[4], scale[4]
+            model, mean, scale = segments[key]
+            x_scaled[i, 4] = (total_delay - mean) / scale
+            result = __predict_row(model, x_scaled[i:i + 1])
+        while total_delay + result < -1:
+            result += 1  # quick fix for runaway negative time estimations, as in use_model
+        changes.append(result)
+        total_delay += result
+    return changes
+
+
+# hidden layer activations of an MLPClassifier, by the name given to it
+__HIDDEN_ACTIVATIONS = {"identity": lambda a: a, "tanh": np.tanh, "relu": lambda a: np.maximum(a, 0),
+                        "logistic": lambda a: 1 / (1 + np.exp(-a))}
+
+
+def prewarm(network, model_names=("KNeighborsClassifier",)):
+    """ Loads every segment's models and delay tables ahead of the first query, and runs each model once so anything
+    it only loads when first used is loaded too.
+
+    :param services.Network network: Network holding the models
+    :param model_names:              Class names of the models to load, by default the one use_model uses
+
+    :rtype: int
+    :return: Number of models loaded
+    """
+    loaded = 0
+    for model_name in model_names:
+        if tables is not None:
+            tables.get(network.get_name(), model_name, network.get_version())
+        for stn_from in network:
+            for stn_to in stn_from.get_connections():
+                try:
+                    model, scaler = stn_from.get_model(stn_to, model_name)
+                except KeyError:  # no model of this type for the segment
+                    continue
+                x = np.zeros((1, 5))
+                try:
+                    __predict_row(model, scaler.transform(x) if scaler is not None else x)
+                except ValueError:  # e.g. a KNN model fitted to fewer rows than it has neighbours
+                    pass
+                loaded += 1
+    return loaded
+
+
+def compile_delay_tables(network, model_name):
+    """ Runs each segment's model over every input a delay table covers and keeps its predictions as a table.
+
+    :param services.Network network: Network holding the models
+    :param str model_name:           Class name of the models, "KNeighborsClassifier" or "MLPClassifier"
+
+    :rtype: dict
+    :return: {(tpl_from, tpl_to): np.ndarray of delay_tables.SHAPE} for each segment with a model of this type
+             predicting whole minutes
+    """
+    rows = delay_tables.grid_rows()
+    compiled = {}
+    for stn_from in network:
+        for stn_to in stn_from.get_connections():
+            try:
+                model, scaler = stn_from.get_model(stn_to, model_name)
+            except KeyError:  # no model of this type for the segment
+                continue
+            if not np.issubdtype(np.asarray(model.classes_).dtype, np.integer):
+                continue
+            x = scaler.transform(rows) if scaler is not None else rows
+            try:
+                table = model.predict(x).reshape(delay_tables.SHAPE).astype(np.int16)
+            except ValueError as e:  # e.g. a KNN model fitted to fewer rows than it has neighbours
+                print("could not compile", model_name, "from", stn_from.get_id(), "to", stn_to.get_id() + ":", e)
+                continue
+            compiled[(stn_from.get_id(), stn_to.get_id())] = table
+    return compiled
+
+
+def verify_delay_tables(network, model_name, compiled):
+    """ Checks every entry of each table against the prediction its model gives for that input alone, as
+    use_journey_models would give it without the tables.
+
+    :param services.Network network: Network holding the models
+    :param str model_name:           Class name of the models
+    :param dict compiled:            Tables as returned by compile_delay_tables()
+
+    :rtype: dict
+    :return: {(tpl_from, tpl_to): number of inputs where the table and the model disagree}
+    """
+    rows = delay_tables.grid_rows()
+    disagreements = {}
+    for (s_from, s_to), table in compiled.items():
+        model, scaler = network.get_station(s_from).get_model(network.get_station(s_to), model_name)
+        x = scaler.transform(rows) if scaler is not None else rows
+        predicted = np.array([__predict_row(model, x[i:i + 1]) for i in range(len(x))])
+        disagreements[(s_from, s_to)] = int(np.count_nonzero(predicted != table.ravel()))
+    return disagreements
+
+
+def __table_lookup(network, model_name, entry, delay):
+    """Looks the model's prediction up from the delay tables
+
+    :rtype: int or None
+    :return: Change in delay predicted, or None if there is no table for the segment or it doesn't cover the input
+    """
+    compiled = tables.get(network.get_name(), model_name, network.get_version()) if tables is not None else None
+    if compiled is None or (entry[0], entry[1]) not in compiled:
+        return None
+    return delay_tables.lookup(compiled[(entry[0], entry[1])], entry, delay)
+
+
+def __predict_row(model, row):
+    """Predicts a single row already scaled for the model. KNN and MLP models are worked out here from the fitted
+    model's arrays, the same way their predict() does, since for one row predict() spends most of its time checking
+    the input. Any other model, or one fitted with other settings, is left to its own predict().
+
+    :param model:          Fitted model
+    :param np.ndarray row: Array of shape (1, 5) of float64 attributes
+    :return: Predicted change in delay
+    """
+    name = type(model).__name__
+    if name == "KNeighborsClassifier" and model.weights == "uniform" and not model.outputs_2d_ \
+            and model._fit_method in ("kd_tree", "ball_tree"):
+        # the most common class of the nearest neighbours, the lowest class on a tie as in predict()
+        neighbours = model._tree.query(row, k=model.n_neighbors, return_distance=False)[0]
+        return model.classes_[np.bincount(model._y[neighbours]).argmax()]
+    if name == "MLPClassifier" and model.activation in __HIDDEN_ACTIVATIONS and model.n_outputs_ > 1:
+        # the output layer's softmax doesn't change which class is largest, so it is left out
+        activation = row
+        for i in range(model.n_layers_ - 1):
+            activation = activation @ model.coefs_[i] + model.intercepts_[i]
+            if i != model.n_layers_ - 2:
+                activation = __HIDDEN_ACTIVATIONS[model.activation](activation)
+        return model.classes_[activation[0].argmax()]
+    return model.predict(row)[0]
+
+
+def __save_model(station_from, station_to, model_scaler, network):
+    # save model to network object and update network on db
+    conn = __connect_to_db()
+    stn_to = network.get_station(station_to)
+    network.get_station(station_from).add_model(stn_to, model_scaler)
+    version = network.get_version()
+    services.store_network(network, conn)
+    conn.close()
+    if tables is not None:  # the segment's table was compiled from the model just replaced
+        tables.discard(network.get_name(), type(model_scaler[0]).__name__, (station_from, station_to), version,
+                       network.get_version())
+
+
+def __refresh_segments():
+    # bring the exported segments up to date with the dataset table before training from them. Only done by the
+    # trainers, the fit functions read whatever was last exported so they can be run many times over one export
+    if segments is not None:
+        segments.refresh()
+
+
+def __training_data(station_from, station_to, change_limit=None):
+    """Rows of the dataset between two stations, from the exported segments if there are any, else from the dataset
+    table. The segments are read as last exported, see __refresh_segments().
+
+    :param str station_from: TPL code of the station the train is leaving from
+    :param str station_to:   TPL code of the station the train is next calling at
+    :param int change_limit: Only take rows whose delay_change is within this many minutes, None for every row
+
+    :rtype: tuple[np.ndarray, np.ndarray]
+    :return: Attributes (day_of_week, weekday, off_peak, hour_of_day, delay) and labels (delay_change)
+    """
+    if segments is not None:
+        data = segments.load(station_from, station_to)
+        if data is not None:
+            x, y = data
+            if change_limit is not None:
+                keep = (y <= change_limit) & (y >= -change_limit)
+                x, y = x[keep], y[keep]
+            return x, y
+
+    # get the relevant data from the db
+    conn = __connect_to_dataset()
+    query = """ SELECT * FROM dataset WHERE tpl_from="{}" AND tpl_to="{}" """.format(station_from, station_to)
+    if change_limit is not None:
+        query += """ AND delay_change<={0} AND delay_change>=-{0} """.format(change_limit)
+    df = pd.read_sql_query(query, conn)  # data_model
+    conn.close()
+    return df.iloc[:, 2:-1].values, df.iloc[:, 7].values
+
+
 def __connect_to_dataset():
     """Opens and returns a connection to dataset database or exception if the connection failed
 
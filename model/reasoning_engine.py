@@ -16,15 +16,24 @@ History : 01/01/2021 - v1.0 - Created project file
           15/01/2021 - v2.5 - Removed duplicate code when querying user for departure/arrival location
           16/01/2021 - v2.6 - End user can adjust their ticket information if input was incorrect
           17/01/2021 - v2.7 - Using a temporary dictionary to process query information to prepare integration with NLP
+          18/10/2026 - v2.8 - Station lookups go through the shared station directory instead of sqlite
+          18/10/2026 - v2.9 - Each user gets their own conversation, engines are pooled between them
+          18/10/2026 - v3.0 - Only facts that changed since the last message are retracted and declared
+          18/10/2026 - v3.1 - The experta engine can be swapped for the table driven dialogue_flow.FlowChatbot
+          18/10/2026 - v3.2 - Fares are looked up in the background and pushed to the user once found
+          18/10/2026 - v3.3 - A booking can be confirmed again when its fare lookup in the background fails
 
 """
-import sqlite3
 import datetime
+import functools
 from experta import *
 import random
-from chatbot.presenter import send_message, send_list
+from chatbot.presenter import send_message, send_list, push_message
 from model.scraper import single_fare, return_fare
 from data.process_data import user_to_query
+from data.stations import get_directory
+from model.sessions import SessionManager, EnginePool
+from model.fare_worker import FareWorker
 
 __author__ = "Steven Diep"
 __credits__ = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
@@ -184,6 +193,10 @@ bot_feedback = {
     'no_ticket_found': [
         "Sorry we could not find your ticket"
     ],
+    'searching_ticket': [
+        "Searching for the cheapest ticket, this may take a moment...",
+        "Let me find the cheapest ticket for you, one moment..."
+    ],
     'show_gratitude': [
         "Thank you for using my service! If you need anything else, you can enter another query just like before.",
         "Thank you, please use my service again.",
@@ -204,11 +217,57 @@ bot_feedback = {
 }
 
 
+def find_fare(return_or_not, departCRS, arriveCRS, departure_date, leaving_time, return_date, return_time):
+    """Looks up the cheapest ticket for a confirmed booking.
+
+    :rtype: str
+    :return: Message describing the ticket that was found
+    :raises ValueError: if validation of date or time, or of page output fails
+    :raises NotImplementedError: if the fare could not be read from the page
+    """
+    if return_or_not:  # is a return ticket
+        cost, time_out, time_ret, url = return_fare(departCRS, arriveCRS,
+                                                    str(departure_date).replace('-', '/'),
+                                                    leaving_time.strftime("%H:%M"),
+                                                    str(return_date).replace('-', '/'),
+                                                    return_time.strftime("%H:%M"))
+        return random.choice(bot_feedback['found_return_ticket']) \
+            + "<br>Total cost: " + str(cost) \
+            + "<br>Time outward: " + str(time_out) \
+            + "<br>Time return: " + str(time_ret) \
+            + "<br>URL: " + "<a href=" + str(url) \
+            + ' target="_blank" rel ="noopener noreferrer" >Link to ticket</a>'
+    else:
+        cost, time, url = single_fare(departCRS, arriveCRS,
+                                      str(departure_date).replace('-', '/'),
+                                      leaving_time.strftime("%H:%M"))
+        return random.choice(bot_feedback['found_single_ticket']) \
+            + "<br>Total cost: " + str(cost) \
+            + "<br>Time: " + str(time) \
+            + "<br>URL: " + "<a href=" + str(url) \
+            + ' target="_blank" rel ="noopener noreferrer" >Link to ticket</a>'
+
+
 class Chatbot(KnowledgeEngine):
+    sid = None  # Socket.IO sid of the user whose message is being processed, None outside of the web app
+
+    def refresh_knowledge(self):
+        """Forgets everything the user has told the bot in this conversation."""
+        self.reset()
+        for key in all_current_info:
+            if key in self.currentInfo:
+                del self.currentInfo[key]
+            elif self.currentInfo == {}:
+                break
+
     @DefFacts()
     def initial_action(self):
         yield Fact(action="begin")
         # when the bot receives a new input the re will check the current info it already has
+        yield from self.current_facts()
+
+    def current_facts(self):
+        """Facts representing what the user has given so far in currentInfo, in the order they are declared."""
         if 'intent' in self.currentInfo:
             yield Fact(queryType=self.currentInfo.get('intent'))
 
@@ -238,6 +297,41 @@ class Chatbot(KnowledgeEngine):
         if 'correct_booking' in self.currentInfo:
             yield Fact(correct_booking=self.currentInfo.get('correct_booking'))
 
+    def step(self):
+        """Processes one message without a full reset(). Facts which no longer match currentInfo are retracted and
+        missing ones declared, so the Rete network keeps the matches it already made for facts that did not change.
+        The begin fact every rule depends on is declared afresh, which puts every rule that still matches back on the
+        agenda exactly as a reset() would have.
+        """
+        if not self.facts:  # nothing declared yet, so there is nothing to keep
+            self.reset()
+            self.run()
+            return
+        # a rule calling reset() stops the run before the facts it re-declared reach the Rete network, pass them on now
+        # so they are not retracted before they were ever added
+        added, removed = self.get_activations()
+        self.strategy.update_agenda(self.agenda, added, removed)
+
+        wanted = {}  # slot (the fact's keys): facts that should be declared for it
+        for fact in self.current_facts():
+            wanted.setdefault(frozenset(fact.as_dict()), []).append(fact.as_dict())
+
+        for fact in list(self.facts.values()):
+            content = fact.as_dict()
+            if not content:  # InitialFact
+                continue
+            slot = frozenset(content)
+            if content.get('action') != 'begin' and content in wanted.get(slot, []):
+                wanted[slot].remove(content)  # unchanged, leave it be
+            else:
+                self.retract(fact)
+
+        for slot_facts in wanted.values():
+            for content in slot_facts:
+                self.declare(Fact(**content))
+        self.declare(Fact(action="begin"))
+        self.run()
+
     @Rule(Fact(action='begin'),
           NOT(Fact(queryType=W())),
           salience=52)
@@ -254,7 +348,8 @@ class Chatbot(KnowledgeEngine):
                 else:
                     send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(queryType=L('help') | L('cancel') | L('change')),
+    @Rule(Fact(action='begin'),
+          Fact(queryType=L('help') | L('cancel') | L('change')),
           salience=50)
     def ask_help_type(self):
         if 'intent' in self.dictionary and self.dictionary.get('intent') in ['ticket', 'cancel', 'change']:
@@ -277,7 +372,7 @@ class Chatbot(KnowledgeEngine):
                              "<a href=https://www.greateranglia.co.uk/contact-us/faqs/tickets>Link</a>")
         elif self.dictionary.get('reset'):
             send_message(random.choice(bot_feedback['reset']))
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -290,7 +385,8 @@ class Chatbot(KnowledgeEngine):
             else:
                 send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(queryType=L('ticket') | L('delay')),
+    @Rule(Fact(action='begin'),
+          Fact(queryType=L('ticket') | L('delay')),
           NOT(Fact(departure_location=W())),
           salience=48)
     def ask_departure_station(self):
@@ -301,26 +397,18 @@ class Chatbot(KnowledgeEngine):
                               departCRS=self.dictionary.get('from_crs')))
         elif 'from_station' not in self.currentInfo and self.dictionary.get('no_category') and \
                 isinstance(self.dictionary.get('no_category')[0], str):  # checks if the from and to stations are
-            conn = sqlite3.connect(r'..\data\db.sqlite')  # present in the dictionary given through the NLP
-            c = conn.cursor()
-            c.execute("SELECT crs FROM stations WHERE name=:location",
-                      {'location': self.dictionary.get('no_category')[0]})
-            crs = c.fetchone()
-            if crs is not None:
+            crs = get_directory().get_crs(self.dictionary.get('no_category')[0])  # present in the dictionary given
+            if crs is not None:                                                  # through the NLP
                 self.currentInfo['from_station'] = self.dictionary.get('no_category')[0]
-                self.currentInfo['from_crs'] = crs[0]
-                self.declare(Fact(departure_location=self.dictionary.get('no_category')[0], departCRS=crs[0]))
+                self.currentInfo['from_crs'] = crs
+                self.declare(Fact(departure_location=self.dictionary.get('no_category')[0], departCRS=crs))
             else:
                 send_message(random.choice(bot_feedback['show_wrong_station']))
         elif self.dictionary.get('confirmation'):  # confirmation if the suggest station is correct
-            conn = sqlite3.connect(r'..\data\db.sqlite')
-            c = conn.cursor()
-            c.execute("SELECT crs FROM stations WHERE name=:location",
-                      {'location': self.currentInfo.get('possible_from_station')})
-            crs = c.fetchone()
+            crs = get_directory().get_crs(self.currentInfo.get('possible_from_station'))
             if crs is not None:
                 self.currentInfo['to_station'] = self.currentInfo.get('possible_from_station')
-                self.declare(Fact(departure_location=self.currentInfo.get('possible_from_station'), departCRS=crs[0]))
+                self.declare(Fact(departure_location=self.currentInfo.get('possible_from_station'), departCRS=crs))
                 self.dictionary['confirmation'] = ''
             else:
                 send_message(random.choice(bot_feedback['show_wrong_station']))
@@ -339,11 +427,8 @@ class Chatbot(KnowledgeEngine):
                         self.dictionary['suggestion'][station_or_location]['station']
                     break
                 elif 'location' in self.dictionary.get('suggestion')[station_or_location]:
-                    conn = sqlite3.connect(r'..\data\db.sqlite')
-                    c = conn.cursor()
-                    c.execute("SELECT name FROM stations WHERE county=:location ORDER BY served_2019 DESC",
-                              {'location': self.dictionary['suggestion'][station_or_location]['location']})
-                    top_5_stations = c.fetchmany(5)
+                    top_5_stations = get_directory().get_county_stations(
+                        self.dictionary['suggestion'][station_or_location]['location'], 5)
                     send_list("Here is a list of possible stations in " +
                               self.dictionary['suggestion'][station_or_location]['location'] +
                               " you may be referring to: ", top_5_stations)
@@ -355,7 +440,7 @@ class Chatbot(KnowledgeEngine):
                     send_message(random.choice(bot_feedback['ask_from_location']))
         elif self.dictionary.get('reset'):
             send_message(random.choice(bot_feedback['reset']))
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -371,7 +456,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(queryType=L('ticket') | L('delay')),
+    @Rule(Fact(action='begin'),
+          Fact(queryType=L('ticket') | L('delay')),
           NOT(Fact(arrival_location=W())),
           salience=46)
     def set_arrival_or_time(self):  # sets arrival before arrival gets deleted
@@ -379,7 +465,8 @@ class Chatbot(KnowledgeEngine):
             self.currentInfo['to_station'] = self.dictionary.get('to_station')
             self.currentInfo['to_crs'] = self.dictionary.get('to_crs')
 
-    @Rule(Fact(queryType=L('ticket') | L('delay')),
+    @Rule(Fact(action='begin'),
+          Fact(queryType=L('ticket') | L('delay')),
           Fact(departure_location=W()),
           NOT(Fact(arrival_location=W())),
           salience=44)
@@ -392,26 +479,18 @@ class Chatbot(KnowledgeEngine):
         elif 'to_station' not in self.currentInfo and self.dictionary.get('no_category') and \
                 self.dictionary.get('no_category')[0] != self.currentInfo.get('from_station') and \
                 isinstance(self.dictionary.get('no_category')[0], str):
-            conn = sqlite3.connect(r'..\data\db.sqlite')
-            c = conn.cursor()
-            c.execute("SELECT crs FROM stations WHERE name=:location",
-                      {'location': self.dictionary.get('no_category')[0]})
-            crs = c.fetchone()
+            crs = get_directory().get_crs(self.dictionary.get('no_category')[0])
             if crs is not None:
                 self.currentInfo['to_station'] = self.dictionary.get('no_category')[0]
-                self.currentInfo['to_crs'] = crs[0]
-                self.declare(Fact(arrival_location=self.dictionary.get('no_category')[0], arriveCRS=crs[0]))
+                self.currentInfo['to_crs'] = crs
+                self.declare(Fact(arrival_location=self.dictionary.get('no_category')[0], arriveCRS=crs))
             else:
                 send_message(random.choice(bot_feedback['show_wrong_station']))
         elif self.dictionary.get('confirmation'):
-            conn = sqlite3.connect(r'..\data\db.sqlite')
-            c = conn.cursor()
-            c.execute("SELECT crs FROM stations WHERE name=:location",
-                      {'location': self.currentInfo.get('possible_to_station')})
-            crs = c.fetchone()
+            crs = get_directory().get_crs(self.currentInfo.get('possible_to_station'))
             if crs is not None:
                 self.currentInfo['to_station'] = self.currentInfo.get('possible_to_station')
-                self.declare(Fact(arrival_location=self.currentInfo.get('possible_to_station'), arriveCRS=crs[0]))
+                self.declare(Fact(arrival_location=self.currentInfo.get('possible_to_station'), arriveCRS=crs))
             else:
                 send_message(random.choice(bot_feedback['show_wrong_station']))
         elif self.dictionary.get('suggestion') and (not self.dictionary.get('no_category') or
@@ -429,11 +508,8 @@ class Chatbot(KnowledgeEngine):
                         self.dictionary['suggestion'][station_or_location]['station']
                     break
                 elif 'location' in self.dictionary.get('suggestion')[station_or_location]:
-                    conn = sqlite3.connect(r'..\data\db.sqlite')
-                    c = conn.cursor()
-                    c.execute("SELECT name FROM stations WHERE county=:location ORDER BY served_2019 DESC",
-                              {'location': self.dictionary['suggestion'][station_or_location]['location']})
-                    top_5_stations = c.fetchmany(5)
+                    top_5_stations = get_directory().get_county_stations(
+                        self.dictionary['suggestion'][station_or_location]['location'], 5)
                     send_list("Here is a list of possible stations in " +
                               self.dictionary['suggestion'][station_or_location]['location'] +
                               " you may be referring to: ", top_5_stations)
@@ -442,7 +518,7 @@ class Chatbot(KnowledgeEngine):
                     send_message(random.choice(bot_feedback['ask_to_location']))
         elif self.dictionary.get('reset'):
             send_message(random.choice(bot_feedback['reset']))
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -457,7 +533,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(departure_location=MATCH.departure_location),
+    @Rule(Fact(action='begin'),
+          Fact(departure_location=MATCH.departure_location),
           Fact(arrival_location=MATCH.arrival_location),
           Fact(queryType='delay'),
           salience=42)
@@ -466,12 +543,8 @@ class Chatbot(KnowledgeEngine):
                 not self.dictionary.get('no_category'):
             stations = [departure_location, arrival_location]
             tpl_stations = []
-            conn = sqlite3.connect(r'..\data\db.sqlite')
-            c = conn.cursor()
             for find_tpl in stations:
-                c.execute("SELECT tpl FROM stations WHERE name=:location", {'location': find_tpl})
-                tpl = c.fetchone()
-                tpl_stations.append(tpl[0])
+                tpl_stations.append(get_directory().get_tpl(find_tpl))
             delay_time = self.dictionary.get('raw_message').split()
             for minutes in delay_time:
                 if minutes.isdigit():
@@ -484,10 +557,10 @@ class Chatbot(KnowledgeEngine):
                     except ValueError:
                         send_message("Sorry, at least one of those stations were not found on the line between "
                                      "Norwich and London Liverpool Street.")
-            refresh_user_knowledge()
+            self.refresh_knowledge()
         elif self.dictionary.get('reset'):
             send_message(random.choice(bot_feedback['reset']))
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -501,7 +574,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(arrival_location=W()),
+    @Rule(Fact(action='begin'),
+          Fact(arrival_location=W()),
           Fact(queryType=L('ticket')),
           NOT(Fact(departure_date=W())),
           salience=40)
@@ -530,7 +604,7 @@ class Chatbot(KnowledgeEngine):
                 send_message(random.choice(bot_feedback['past_date']))
         elif self.dictionary.get('reset'):
             send_message(random.choice(bot_feedback['reset']))
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -547,7 +621,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(departure_date=MATCH.departure_date),
+    @Rule(Fact(action='begin'),
+          Fact(departure_date=MATCH.departure_date),
           NOT(Fact(leaving_time=W())),
           salience=38)
     def ask_depart_time(self, departure_date):
@@ -566,7 +641,7 @@ class Chatbot(KnowledgeEngine):
                 self.declare(Fact(leaving_time=self.dictionary.get('no_category')[0]))
         elif self.dictionary.get('reset'):
             send_message(random.choice(bot_feedback['reset']))
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -580,7 +655,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['invalid_time']))
 
-    @Rule(Fact(leaving_time=W()),
+    @Rule(Fact(action='begin'),
+          Fact(leaving_time=W()),
           NOT(Fact(return_or_not=W())),
           salience=36)
     def ask_return(self):
@@ -600,7 +676,7 @@ class Chatbot(KnowledgeEngine):
             self.declare(Fact(return_or_not=True))
         elif self.dictionary.get('reset'):
             send_message(random.choice(bot_feedback['reset']))
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -614,7 +690,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(return_or_not=True),
+    @Rule(Fact(action='begin'),
+          Fact(return_or_not=True),
           Fact(departure_date=MATCH.departure_date),
           NOT(Fact(return_date=W())),
           salience=34)
@@ -641,7 +718,7 @@ class Chatbot(KnowledgeEngine):
                 send_message(random.choice(bot_feedback['past_departure_date']))
         elif self.dictionary.get('reset'):
             send_message("Okay I will forget everything you have entered.")
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -655,7 +732,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['invalid_date']))
 
-    @Rule(Fact(return_date=MATCH.return_date),
+    @Rule(Fact(action='begin'),
+          Fact(return_date=MATCH.return_date),
           Fact(departure_date=MATCH.departure_date),
           Fact(leaving_time=MATCH.leaving_time),
           NOT(Fact(return_time=W())),
@@ -676,7 +754,7 @@ class Chatbot(KnowledgeEngine):
                 self.declare(Fact(return_time=self.dictionary.get('no_category')[0]))
         elif self.dictionary.get('reset'):
             send_message("Okay I will forget everything you have entered.")
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -690,7 +768,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['invalid_time']))
 
-    @Rule(Fact(return_or_not=MATCH.return_or_not),
+    @Rule(Fact(action='begin'),
+          Fact(return_or_not=MATCH.return_or_not),
           Fact(departure_location=MATCH.departure_location, departCRS=MATCH.departCRS),
           Fact(arrival_location=MATCH.arrival_location, arriveCRS=MATCH.arriveCRS),
           Fact(departure_date=MATCH.departure_date),
@@ -705,39 +784,28 @@ class Chatbot(KnowledgeEngine):
         if 'confirmation' in self.dictionary and self.dictionary.get('confirmation') != '':
             self.currentInfo['correct_booking'] = self.dictionary.get('confirmation')
             if self.dictionary.get('confirmation'):  # if confirmation is correct
-                try:  # look for errors coming back
-                    if return_or_not:  # is a return ticket
-                        cost, time_out, time_ret, url = return_fare(departCRS, arriveCRS,
-                                                                    str(departure_date).replace('-', '/'),
-                                                                    leaving_time.strftime("%H:%M"),
-                                                                    str(return_date).replace('-', '/'),
-                                                                    return_time.strftime("%H:%M"))
-                        send_message(random.choice(bot_feedback['found_return_ticket'])
-                                     + "<br>Total cost: " + str(cost)
-                                     + "<br>Time outward: " + str(time_out)
-                                     + "<br>Time return: " + str(time_ret)
-                                     + "<br>URL: " + "<a href=" + str(url)
-                                     + ' target="_blank" rel ="noopener noreferrer" >Link to ticket</a>')
-                    else:
-                        cost, time, url = single_fare(departCRS, arriveCRS,
-                                                      str(departure_date).replace('-', '/'),
-                                                      leaving_time.strftime("%H:%M"))
-                        send_message(random.choice(bot_feedback['found_single_ticket'])
-                                     + "<br>Total cost: " + str(cost)
-                                     + "<br>Time: " + str(time)
-                                     + "<br>URL: " + "<a href=" + str(url)
-                                     + ' target="_blank" rel ="noopener noreferrer" >Link to ticket</a>')
+                lookup = functools.partial(find_fare, return_or_not, departCRS, arriveCRS, departure_date,
+                                           leaving_time, return_date, return_time)
+                if self.sid is not None and fare_lookups is not None and \
+                        fare_lookups.submit(self.sid, lookup, push_message,
+                                            random.choice(bot_feedback['no_ticket_found']), _fare_lookup_failed):
+                    send_message(random.choice(bot_feedback['searching_ticket']))  # result is pushed once found
                     self.declare(Fact(correct_booking=self.dictionary.get('confirmation')))  # go to next query
                     self.dictionary['confirmation'] = ''
-                except ValueError as e:
-                    send_message(str(e))
-                except NotImplementedError as e:
-                    send_message(str(e))
+                else:
+                    try:  # look for errors coming back
+                        send_message(lookup())
+                        self.declare(Fact(correct_booking=self.dictionary.get('confirmation')))  # go to next query
+                        self.dictionary['confirmation'] = ''
+                    except ValueError as e:
+                        send_message(str(e))
+                    except NotImplementedError as e:
+                        send_message(str(e))
             else:
                 self.declare(Fact(correct_booking=self.dictionary.get('confirmation')))  # go to ask adjustment
         elif self.dictionary.get('reset'):
             send_message("Okay I will forget everything you have entered.")
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -762,7 +830,8 @@ class Chatbot(KnowledgeEngine):
                 self.dictionary.get('raw_message')
                 send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(correct_booking=False),
+    @Rule(Fact(action='begin'),
+          Fact(correct_booking=False),
           Fact(return_or_not=MATCH.return_or_not),
           salience=28)
     def ask_adjustment(self, return_or_not):
@@ -772,12 +841,12 @@ class Chatbot(KnowledgeEngine):
                                                   'Return date', 'Return time']:
             del self.currentInfo['correct_booking']
             if self.dictionary.get('raw_message') == 'Departure location':
-                engine.reset()
+                self.reset()
                 del self.currentInfo['from_station']
                 del self.currentInfo['from_crs']
                 send_message(random.choice(bot_feedback['ask_from_location']))
             elif self.dictionary.get('raw_message') == 'Arrival location':
-                engine.reset()
+                self.reset()
                 del self.currentInfo['to_station']
                 del self.currentInfo['to_crs']
                 send_message(random.choice(bot_feedback['ask_to_location']))
@@ -802,7 +871,7 @@ class Chatbot(KnowledgeEngine):
                 send_message(random.choice(bot_feedback['no_answer']))
         elif self.dictionary.get('reset'):
             send_message("Okay I will forget everything you have entered.")
-            engine.reset()
+            self.reset()
             for key in all_current_info:
                 if key in self.currentInfo:
                     del self.currentInfo[key]
@@ -827,7 +896,8 @@ class Chatbot(KnowledgeEngine):
             else:
                 send_message(random.choice(bot_feedback['no_answer']))
 
-    @Rule(Fact(correct_booking=True),
+    @Rule(Fact(action='begin'),
+          Fact(correct_booking=True),
           salience=26)
     def next_query(self):
         if self.dictionary.get('confirmation'):
@@ -864,23 +934,105 @@ class Chatbot(KnowledgeEngine):
             send_message(random.choice(bot_feedback['no_answer']))
 
 
-engine = Chatbot()
-engine.currentInfo = {}
+sessions = SessionManager()
+engines = EnginePool(Chatbot)
+incremental_facts = True  # use Chatbot.step() rather than reset() and run() on every message
+fare_lookups = FareWorker()  # None to look fares up while the user's message is being processed
 
 
-def process_user_input(info):
-    engine.dictionary = info
-    print(engine.facts)
-    print(engine.dictionary)
-    print(engine.currentInfo)
-    engine.reset()
-    engine.run()
+def configure_sessions(max_sessions=None, idle_timeout=None, max_engines=None, incremental=None, backend=None):
+    """Changes the limits on conversations and engines kept by this process.
+
+    :param int max_sessions: Most conversations to keep at once, the least recently used is dropped past this
+    :param int idle_timeout: Seconds a conversation can go unused before it is dropped
+    :param int max_engines:  Most reasoning engines to build, i.e. how many messages can be processed at once
+    :param bool incremental: True to only update the facts that changed on each message, False to reset the engine
+    :param str backend:      "experta" to run the Chatbot rules through experta, "flow" for dialogue_flow.FlowChatbot
+    :raises ValueError:      if the backend is not one of the above
+    """
+    global incremental_facts, engines
+    if backend is not None:
+        if backend == "experta":
+            factory = Chatbot
+        elif backend == "flow":
+            from model.dialogue_flow import FlowChatbot  # imports this module, so only once it has loaded
+            factory = FlowChatbot
+        else:
+            raise ValueError("Unknown dialogue backend: " + str(backend))
+        if factory is not engines.factory:
+            engines = EnginePool(factory, engines.max_engines)
+    if max_sessions is not None:
+        sessions.max_sessions = max_sessions
+    if idle_timeout is not None:
+        sessions.idle_timeout = idle_timeout
+    if max_engines is not None:
+        engines.max_engines = max_engines
+    if incremental is not None:
+        incremental_facts = incremental
+
+
+def _fare_lookup_failed(sid):
+    """Lets the user confirm their booking again once its fare could not be found in the background, as
+    ask_correct_booking() does when the lookup fails while their message is being processed.
+
+    :param str sid: Socket.IO sid of the user
+    """
+    if sid not in sessions:  # the user has gone
+        return
+    session = sessions.get(sid)
+    with session.lock:
+        session.currentInfo.pop('correct_booking', None)
+
+
+def configure_fare_lookups(max_workers=None, max_pending=None):
+    """Changes how many fare lookups can run in the background. Lookups already queued are left to finish.
+
+    :param int max_workers: Most lookups to run at once, 0 to look fares up while processing the user's message
+    :param int max_pending: Most lookups to hold at once, further lookups are done while processing the message
+    """
+    global fare_lookups
+    old = fare_lookups
+    if max_workers is None:
+        max_workers = old.max_workers if old is not None else 4
+    if max_pending is None:
+        max_pending = old.max_pending if old is not None else 32
+    fare_lookups = FareWorker(max_workers, max_pending) if max_workers > 0 else None
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def process_user_input(info, sid=None):
+    """Runs the reasoning engine over the output of the NLP for one message from the given user.
+
+    :param dict info: Processed user input from nlp.parse_user_input()
+    :param str sid:   Socket.IO sid of the user the message came from
+    """
+    session = sessions.get(sid)
+    with session.lock:  # one message at a time from each user
+        engine = engines.acquire(sid)
+        try:
+            engine.owner = sid
+            engine.sid = sid
+            engine.currentInfo = session.currentInfo
+            engine.dictionary = info
+            print(engine.facts)
+            print(engine.dictionary)
+            print(engine.currentInfo)
+            if incremental_facts:
+                engine.step()  # facts left from another user's conversation are brought in line with currentInfo
+            else:
+                engine.reset()
+                engine.run()
+        finally:
+            engine.currentInfo = {}
+            engine.dictionary = {}
+            engine.sid = None
+            engines.release(engine)
+
 
+def refresh_user_knowledge(sid=None):
+    """Forgets the conversation with the given user, e.g. once they disconnect.
 
-def refresh_user_knowledge():
-    engine.reset()
-    for key in all_current_info:
-        if key in engine.currentInfo:
-            del engine.currentInfo[key]
-        elif engine.currentInfo == {}:
-            break
+    :param str sid: Socket.IO sid of the user
+    """
+    sessions.end(sid)
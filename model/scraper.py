@@ -11,13 +11,25 @@ History : 28/12/2020 - v1.0 - Create project file
           29/12/2020 - v1.1 - Complete single_fare() implementation
           30/12/2020 - v1.2 - Complete return_fare() implementation, split out validation and added to it
           15/01/2020 - v1.3 - Complete historical_trains() implementation including helper functions.
+          18/10/2026 - v1.4 - Cache fares by route, date and time band.
+          18/10/2026 - v1.5 - All requests go through a shared HttpClient with pooled connections and timeouts.
+          18/10/2026 - v1.6 - historical_trains() fetches RIDs concurrently, rate limited and checkpointed to disk.
+          18/10/2026 - v1.7 - historical_trains() streams rows to disk instead of holding a month in memory.
+          18/10/2026 - v1.8 - Fare searches raise ValueError when the site can not be reached.
+          18/10/2026 - v1.9 - A cached fare is only given for a time its train does not leave before.
 """
 import re
-import requests
 import datetime
 import os
 import csv
+import io
+import json
+import calendar
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
 from bs4 import BeautifulSoup
+from model.cache import MemoryCache, SqliteCache
+from model.http_client import HttpClient, RateLimiter
 
 __author__     = "Martin Siddons"
 __credits__    = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
@@ -25,6 +37,60 @@ __maintainer__ = "Martin Siddons"
 __email__      = "m.siddons@uea.ac.uk"
 __status__     = "Production"  # "Development" "Prototype" "Production"
 
+http_client = HttpClient()  # shared by every request made by this module
+hsp_read_timeout = 120  # seconds, the HSP datafeed can take a while to reply
+hsp_rate_limit = 5  # most requests a second sent to HSP by historical_trains(), be polite
+HSP_API_URL = "https://hsp-prod.rockshore.net/api/v1"
+fare_cache = MemoryCache(max_size=512, ttl=900)  # results of single_fare() and return_fare(), None to not cache
+fare_time_band = 30  # minutes, searches for times in the same band of the day share a cached fare
+
+
+def configure_http_client(pool_size=None, connect_timeout=None, read_timeout=None, retries=None):
+    """Replaces the HTTP client used for every request, any argument not given keeps its current value.
+
+    :param int pool_size:         Most connections kept open to one host
+    :param float connect_timeout: Seconds to wait for a connection to be made
+    :param float read_timeout:    Seconds to wait between bytes of a response from National Rail's site
+    :param int retries:           Times a request is retried after a connection error or 5xx response
+    """
+    global http_client
+    old = http_client
+    http_client = HttpClient(pool_size=pool_size if pool_size is not None else old.pool_size,
+                             connect_timeout=connect_timeout if connect_timeout is not None else old.timeout[0],
+                             read_timeout=read_timeout if read_timeout is not None else old.timeout[1],
+                             retries=retries if retries is not None else old.retries)
+    old.close()
+
+
+def configure_fare_cache(backend="memory", ttl=None, max_size=None, path=None, time_band=None):
+    """Replaces the fare cache. Any fares already cached are dropped unless they are in the sqlite file used.
+
+    :param str backend:   "memory" to cache in this process, "sqlite" to cache in a file, or "none" to not cache
+    :param int ttl:       Seconds a fare is cached for, 15 minutes if not given
+    :param int max_size:  Most fares to cache, the least recently used is dropped past this
+    :param str path:      Sqlite file used by the sqlite backend, data/fare_cache.sqlite if not given
+    :param int time_band: Minutes of the day grouped together under one cached fare
+    :raises ValueError:   If the backend is not one of the above
+    """
+    global fare_cache, fare_time_band
+    old = fare_cache
+    ttl = ttl if ttl is not None else 900
+    max_size = max_size if max_size is not None else 512
+    if backend == "memory":
+        fare_cache = MemoryCache(max_size=max_size, ttl=ttl)
+    elif backend == "sqlite":
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "fare_cache.sqlite")
+        fare_cache = SqliteCache(path, max_size=max_size, ttl=ttl, table="fares")
+    elif backend == "none":
+        fare_cache = None
+    else:
+        raise ValueError("Unknown fare cache backend: " + str(backend))
+    if isinstance(old, SqliteCache):
+        old.close()
+    if time_band is not None:
+        fare_time_band = time_band
+
 
 def single_fare(dep, arr, date, time):
     """Takes stations and datetime object and creates a single ticket search term
@@ -40,14 +106,17 @@ def single_fare(dep, arr, date, time):
     :raises ValueError: If validation of date or time, or of page output fails
     """
     val_date, val_time = __validate_datetime(date, time)  # input validation
+    key = ("single", dep, arr, val_date, __time_band(val_time))
+    cached = fare_cache.get(key) if fare_cache is not None else None
+    if cached is not None and __leaves_after(cached[1], val_time):  # else found for an earlier time in the band
+        return cached
 
     # Form a search url and headers
     terms = dep + "/" + arr + "/" + val_date + "/" + val_time + "/" + "dep"
     url = "https://ojp.nationalrail.co.uk/service/timesandfares/" + terms
     headers = {"User-Agent": "Martin Siddons - UEA",
                "From": "m.siddons@uea.ac.uk"}  # good practice to remain contactable with web admins
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = __fetch_results(url, headers)
 
     __validate_result(title=str(soup.find("title")))  # validate if the result is not an error page
     cheap_label = soup.find(class_="cheapest")  # this is the class with the cheapest price
@@ -64,6 +133,8 @@ def single_fare(dep, arr, date, time):
     s = str(cheap_label.parent.find(class_="journey-breakdown").contents[1])
     res_time = re.search("[0-2][0-9]:[0-5][0-9]", s).group()
 
+    if fare_cache is not None:
+        fare_cache.set(key, (fare, res_time, url))
     return fare, res_time, url
 
 
@@ -82,6 +153,10 @@ def return_fare(dep, arr, dep_date, dep_time, ret_date, ret_time):
     """
     val_out_date, val_out_time = __validate_datetime(dep_date, dep_time)  # validate outbound
     val_ret_date, val_ret_time = __validate_datetime(ret_date, ret_time)  # validate return
+    key = ("return", dep, arr, val_out_date, __time_band(val_out_time), val_ret_date, __time_band(val_ret_time))
+    cached = fare_cache.get(key) if fare_cache is not None else None
+    if cached is not None and __leaves_after(cached[1], val_out_time) and __leaves_after(cached[2], val_ret_time):
+        return cached
 
     # Form a search url and headers
     terms = dep + "/" + arr + "/" + val_out_date + "/" + val_out_time + "/" + "dep" + \
@@ -89,8 +164,7 @@ def return_fare(dep, arr, dep_date, dep_time, ret_date, ret_time):
     url = "https://ojp.nationalrail.co.uk/service/timesandfares/" + terms
     headers = {"User-Agent": "Martin Siddons - UEA",
                "From": "m.siddons@uea.ac.uk"}  # good practice to remain contactable with web admins
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = __fetch_results(url, headers)
     __validate_result(title=str(soup.find("title")))  # validate if the result is not an error page
 
     # Pull out the fare from html and isolate its value with regex
@@ -115,55 +189,85 @@ def return_fare(dep, arr, dep_date, dep_time, ret_date, ret_time):
         s = str(mtx[1])
         res_time.append(re.search("[0-2][0-9]:[0-5][0-9]", s).group())
 
+    if fare_cache is not None:
+        fare_cache.set(key, (fare, res_time[0], res_time[1], url))
     return fare, res_time[0], res_time[1], url
 
 
-def historical_trains():
+def historical_trains(loc_from="SRA", loc_to="SMK", days="SUNDAY", year="2019", months=None, out_dir=None,
+                      route_name="LST-NRW", workers=4, rate_limit=None, flush_every=50):
     """Specify which train details to retrieve from the online datafeeds, find the required data, format into the
     required way and save to the data/scraped folder.
 
+    Details of each RID are fetched by up to workers threads at once and streamed to a .part file next to the month's
+    CSV, which is renamed to the CSV once the month is complete. RIDs saved are checkpointed to disk, so running this
+    again after a failure skips months already saved and RIDs already fetched.
+
+    :param str loc_from:    CRS code of the station the journeys run from (e.g. "SMK", "NRW", "SRA")
+    :param str loc_to:      CRS code of the station the journeys run to (e.g. "IPS", "LST")
+    :param str days:        Either 'WEEKDAY', 'SATURDAY' or 'SUNDAY'
+    :param str year:        Year to retrieve, e.g. "2019"
+    :param months:          Months of the year to retrieve as ints, all twelve if not given
+    :param str out_dir:     Folder the CSV files are saved in, data/scraped if not given
+    :param str route_name:  Route the files are named after, e.g. HSP_2019_01_SUNDAYS_LST-NRW.csv
+    :param int workers:     Most detail requests to have in flight at once, 1 to fetch one RID at a time
+    :param rate_limit:      Most requests a second to send to HSP, hsp_rate_limit if not given, 0 for no limit
+    :param int flush_every: RIDs to write to the .part file between each flush and checkpoint
+
     :rtype: bool
     :return: True if scrape was a success else false.
     """
-    loc_from  = "SRA"  # "SMK" "NRW" "SRA"
-    loc_to    = "SMK"  # "IPS" "LST"
     time_from = "0400"
     time_to   = "2359"
-    year      = "2019"
-    days      = "SUNDAY"  # "WEEKDAY" "SATURDAY" "SUNDAY"
-
-    month_days = ["31", "28", "31", "30", "31", "30", "31", "31", "30", "31", "30", "31"]
-    months     = ["01", "02", "03", "04", "05", "06", "07", "08", "09", "10", "11", "12"]
+    if months is None:
+        months = range(1, 13)  # doing a whole year at once
+    if out_dir is None:
+        out_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "scraped")
+    limiter = RateLimiter(rate_limit if rate_limit is not None else hsp_rate_limit)
     halt = False
 
-    for i in range(len(months)):  # doing a whole year at once
-    # for i in range(6, len(months)):
-        date_from = year + "-" + months[i] + "-01"
-        date_to   = year + "-" + months[i] + "-" + month_days[i]
+    for month in months:
+        date_from = "%s-%02d-01" % (year, month)
+        date_to   = "%s-%02d-%02d" % (year, month, calendar.monthrange(int(year), month)[1])
+        filename = "HSP_" + year + "_" + "%02d" % month + "_" + days + "S_" + route_name + ".csv"
+        path = os.path.join(out_dir, filename)
+        if os.path.exists(path):
+            print(filename, "already saved, skipping month", month)
+            continue
+
         print("running scraper for", days, "trains between", date_from, "and", date_to)
+        limiter.wait()
         rids = __hsp_metrics(loc_from, loc_to, time_from, time_to, date_from, date_to, days)
         if len(rids) <= 10:
             halt = True
-            print("halting at month", months[i], "only got", len(rids), "RIDs")
+            print("halting at month", month, "only got", len(rids), "RIDs")
             break
+
+        # rows are streamed to a .part file as they arrive, which only replaces the CSV once the month is complete
+        part = path + ".part"
+        checkpoint = path + ".checkpoint.jsonl"
+        saved, offset = __read_checkpoint(checkpoint)
+        if saved and os.path.exists(part):
+            with open(part, mode="r+b") as part_file:
+                part_file.truncate(offset)  # drop rows written after the last checkpoint, they are fetched again
         else:
-            print("got", len(rids), "rids")
+            saved = set()
+            with open(part, mode="wb") as part_file:
+                part_file.write(__csv_bytes([["rid", "crs", "ptd", "pta", "dep_at", "arr_at"]]))  # header row
+            with open(checkpoint, mode="w"):
+                pass
+        print("got", len(rids), "rids,", len(saved), "of them already saved")
+        try:
+            written = __fetch_details([rid for rid in rids if rid not in saved], part, checkpoint, limiter, workers,
+                                      flush_every)
+        except Exception as e:
+            print("failed fetching details for month", month, "-", e)
+            halt = True
+            break
+        print("got", written, "entries")
 
-        csv_data = [["rid", "crs", "ptd", "pta", "dep_at", "arr_at"]]  # header row
-        for rid in rids:
-            results = __hsp_details(rid)
-            for entry in results:
-                csv_data.append(entry)
-        print("got", len(csv_data), "entries")
-
-        # save the CSV data to disk
-        df        = date_from.split("-")
-        # filename = "HSP_" + df[0] + "_" + df[1] + "_" + days + "S_" + loc_from + "-" + loc_to + ".csv"
-        filename = "HSP_" + df[0] + "_" + df[1] + "_" + days + "S_LST-NRW.csv"
-
-        with open(r'..\data\scraped\{}'.format(filename), mode="w", newline="") as csv_file:
-            writer = csv.writer(csv_file, delimiter=",", quotechar='"')
-            writer.writerows(csv_data)
+        os.replace(part, path)
+        os.remove(checkpoint)
         print("saved to file", filename, "\n")
     if halt:
         print("halted processing.")
@@ -171,6 +275,100 @@ def historical_trains():
     return True
 
 
+def __fetch_details(rids, part, checkpoint, limiter, workers, flush_every):
+    """Fetches the details of each RID, keeping up to workers requests in flight, and appends the rows of each to the
+    part file as they arrive. Every flush_every RIDs the part file is flushed to disk and the RIDs saved are added to
+    the checkpoint file, along with how far into the part file their rows end.
+
+    :param list rids:       RIDs to fetch
+    :param str part:        Path of the part file to append rows to
+    :param str checkpoint:  Path of the checkpoint file
+    :param limiter:         RateLimiter every request waits on
+    :param int workers:     Most requests to have in flight at once
+    :param int flush_every: RIDs to write between flushes
+
+    :rtype: int
+    :return: Number of rows written
+    :raises Exception: Whatever the first failed request raised, once requests in flight have finished
+    """
+    def fetch(rid):
+        limiter.wait()
+        return rid, __hsp_details(rid)
+
+    def flush():
+        part_file.flush()
+        os.fsync(part_file.fileno())
+        offset = part_file.tell()
+        for rid in unflushed:
+            checkpoint_file.write(json.dumps({"rid": rid, "offset": offset}) + "\n")
+        checkpoint_file.flush()
+        del unflushed[:]
+
+    written = 0
+    unflushed = []  # RIDs written since the last flush
+    with open(part, mode="ab") as part_file, open(checkpoint, mode="a") as checkpoint_file, \
+            ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        remaining = iter(rids)
+        pending = set()
+        try:
+            while True:
+                for rid in remaining:  # keep at most workers requests queued behind those in flight
+                    pending.add(pool.submit(fetch, rid))
+                    if len(pending) >= 2 * max(workers, 1):
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        for other in pending:
+                            other.cancel()
+                        raise future.exception()
+                    rid, rows = future.result()
+                    part_file.write(__csv_bytes(rows))
+                    written += len(rows)
+                    unflushed.append(rid)
+                if len(unflushed) >= flush_every:
+                    flush()
+        finally:
+            flush()  # keep whatever was fetched before a failure
+    return written
+
+
+def __read_checkpoint(checkpoint):
+    """
+    :param str checkpoint: Path of a checkpoint file written by __fetch_details()
+
+    :rtype: tuple[set, int]
+    :return: RIDs saved in the part file, and how many bytes of the part file they take up
+    """
+    saved = set()
+    offset = 0
+    if not os.path.exists(checkpoint):
+        return saved, offset
+    with open(checkpoint) as checkpoint_file:
+        for line in checkpoint_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # the last line may be cut short if the scraper was killed while writing it
+                continue
+            saved.add(entry["rid"])
+            offset = max(offset, entry["offset"])
+    return saved, offset
+
+
+def __csv_bytes(rows):
+    """
+    :param list rows: Rows to format as CSV
+
+    :rtype: bytes
+    :return: The rows as they would be written by csv.writer
+    """
+    text = io.StringIO()
+    csv.writer(text, delimiter=",", quotechar='"').writerows(rows)
+    return text.getvalue().encode("utf-8")
+
+
 def __hsp_metrics(loc_from, loc_to, time_from, time_to, date_from, date_to, days):
     """Pull JSON from National Rail's HSP metrics datafeed, find all RID codes and return them. This service seems to
     take a while to reply - be cautious as to how much data you wish to have returned.
@@ -191,7 +389,7 @@ def __hsp_metrics(loc_from, loc_to, time_from, time_to, date_from, date_to, days
     time. The T & Cs should not be an issue, nor the limit on the number of requests an hour - but do be polite and 
     do not swamp the web service with an excessive number of requests.
     """
-    api_url = "https://hsp-prod.rockshore.net/api/v1/serviceMetrics"
+    api_url = HSP_API_URL + "/serviceMetrics"
     headers = {"Content-Type": "application/json"}
     auths = (os.environ.get("HSP_EMAIL"), os.environ.get("HSP_PASSWORD"))  # SET YOUR OWN ENVIRONMENT VARIABLES
     data = {
@@ -204,7 +402,8 @@ def __hsp_metrics(loc_from, loc_to, time_from, time_to, date_from, date_to, days
         "days": days
     }
 
-    r = requests.post(api_url, headers=headers, auth=auths, json=data)
+    r = http_client.post(api_url, headers=headers, auth=auths, json=data,
+                         timeout=(http_client.timeout[0], hsp_read_timeout))
     json_response = r.json()
 
     valid_rids = []
@@ -228,13 +427,14 @@ def __hsp_details(rid):
     :rtype list
     :return: Details to be added to CSV.
     """
-    api_url = "https://hsp-prod.rockshore.net/api/v1/serviceDetails"
+    api_url = HSP_API_URL + "/serviceDetails"
 
     headers = {"Content-Type": "application/json"}
     auths = (os.environ.get("HSP_EMAIL"), os.environ.get("HSP_PASSWORD"))  # SET YOUR OWN ENVIRONMENT VARIABLES
 
     data = {"rid": rid}
-    r = requests.post(api_url, headers=headers, auth=auths, json=data)
+    r = http_client.post(api_url, headers=headers, auth=auths, json=data,
+                         timeout=(http_client.timeout[0], hsp_read_timeout))
 
     json_response = r.json()
     details = json_response["serviceAttributesDetails"]
@@ -270,6 +470,46 @@ def __validate_datetime(date, time):
     return val_date, val_time
 
 
+def __fetch_results(url, headers):
+    """
+    :param str url:      Url of a fare search on nationalrail.co.uk
+    :param dict headers: Headers to send with the request
+
+    :rtype: BeautifulSoup
+    :return: The page of results
+    :raises ValueError: If the site could not be reached, so the user is told rather than the error escaping
+    """
+    try:
+        response = http_client.get(url, headers=headers)
+    except requests.RequestException as e:
+        print(e)
+        raise ValueError("The National Rail website can not be reached at the moment, try again later.")
+    return BeautifulSoup(response.text, "html.parser")
+
+
+def __time_band(val_time):
+    """
+    :param str val_time: Time in the form HHMM
+
+    :return: Start of the fare_time_band minute band the time falls in, in the form HHMM
+    """
+    minutes = int(val_time[:2]) * 60 + int(val_time[2:])
+    band = max(int(fare_time_band), 1)
+    start = minutes // band * band
+    return "%02d%02d" % (start // 60, start % 60)
+
+
+def __leaves_after(res_time, val_time):
+    """
+    :param str res_time: Time of a train found, in the form HH:MM
+    :param str val_time: Time asked for, in the form HHMM
+
+    :return: True if the train is not before the time asked for, so a cached fare found for another time in the same
+             band can be given for this one
+    """
+    return res_time.replace(":", "") >= val_time
+
+
 def __validate_result(title=None):
     """Validation for output html. Will validate based on optional parameters
 
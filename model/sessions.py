@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Keeps track of each user's conversation with the bot, and of the reasoning engines used to process their messages
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : sessions.py
+Date    : Sunday 18 October 2026
+Desc.   : Conversations are keyed on the Socket.IO sid of the user. A conversation only holds the information the
+          bot has been given so far, engines are shared between conversations through a small pool.
+History : 18/10/2026 - v1.0 - Create project file, SessionManager and EnginePool.
+          18/10/2026 - v1.1 - EnginePool hands a user back the engine that last processed their messages.
+"""
+import sys
+import time
+import datetime
+import threading
+from collections import OrderedDict
+
+__author__ = "Steven Diep"
+__credits__ = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Steven Diep"
+__email__ = "steven_diep@hotmail.co.uk"
+__status__ = "Prototype"  # "Development" "Prototype" "Production"
+
+_lock_type = type(threading.Lock())
+
+
+class Session:
+    """State of one conversation between a user and the bot"""
+    def __init__(self, sid):
+        self.sid = sid
+        self.currentInfo = {}  # information given by the user so far, see reasoning_engine.all_current_info
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()  # held while one of this user's messages is being processed
+
+    def size(self):
+        """
+        :rtype: int
+        :return: Approximate number of bytes held by this session
+        """
+        return sys.getsizeof(self) + _deep_getsizeof(self.__dict__, set())
+
+
+class SessionManager:
+    """Holds a Session for each connected user. Sessions which have not been used for idle_timeout seconds are
+    dropped, and once max_sessions are live the least recently used session is dropped to make room for a new one."""
+    def __init__(self, max_sessions=500, idle_timeout=1800):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()  # sid: Session, least recently used first
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, sid):
+        return sid in self._sessions
+
+    def get(self, sid):
+        """Returns the session for the given sid, creating it if needed.
+
+        :param str sid: Socket.IO sid of the user
+        :rtype: Session
+        :return: The user's session
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.__evict_idle(now)
+            session = self._sessions.get(sid)
+            if session is None:
+                while len(self._sessions) >= self.max_sessions > 0:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+                session = Session(sid)
+                self._sessions[sid] = session
+            else:
+                self._sessions.move_to_end(sid)
+            session.last_seen = now
+            return session
+
+    def end(self, sid):
+        """Forgets the session for the given sid, e.g. once the user disconnects.
+
+        :param str sid: Socket.IO sid of the user
+        :rtype: bool
+        :return: True if there was a session to forget, else False
+        """
+        with self._lock:
+            return self._sessions.pop(sid, None) is not None
+
+    def evict_idle(self):
+        """Drops every session that has been idle for longer than idle_timeout.
+
+        :rtype: int
+        :return: Number of sessions dropped
+        """
+        with self._lock:
+            return self.__evict_idle(time.monotonic())
+
+    def memory_usage(self):
+        """
+        :rtype: dict
+        :return: Number of live sessions, their total approximate size in bytes and the average size per session
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+        total = sum(session.size() for session in sessions)
+        average = total // len(sessions) if sessions else 0
+        return {"sessions": len(sessions), "bytes": total, "bytes_per_session": average}
+
+    def __evict_idle(self, now):
+        # sessions are kept in order of last use, so stop at the first one that is still active
+        dropped = 0
+        while self._sessions:
+            sid, session = next(iter(self._sessions.items()))
+            if now - session.last_seen <= self.idle_timeout:
+                break
+            del self._sessions[sid]
+            dropped += 1
+        self.evicted += dropped
+        return dropped
+
+
+class EnginePool:
+    """A bounded pool of reasoning engines. Engines are only built when every existing engine is busy, and no more
+    than max_engines are ever built; callers wait for a free engine beyond that."""
+    def __init__(self, factory, max_engines=8):
+        self.factory = factory
+        self.max_engines = max_engines
+        self._idle = []
+        self._built = 0
+        self._available = threading.Condition()
+
+    def acquire(self, owner=None):
+        """
+        :param owner: If given, an idle engine whose owner attribute matches this is handed out in preference to others
+        :return: An engine for the caller's sole use until it is handed back with release()
+        """
+        with self._available:
+            while not self._idle and self._built >= self.max_engines:
+                self._available.wait()
+            if self._idle:
+                for i in range(len(self._idle) - 1, -1, -1):
+                    if owner is not None and getattr(self._idle[i], "owner", None) == owner:
+                        return self._idle.pop(i)
+                return self._idle.pop(0)  # least recently used, so its owner is the least likely to be back soon
+            self._built += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self._available:
+                self._built -= 1
+                self._available.notify()
+            raise
+
+    def release(self, engine):
+        """
+        :param engine: An engine returned by acquire()
+        """
+        with self._available:
+            self._idle.append(engine)
+            self._available.notify()
+
+
+def _deep_getsizeof(obj, seen):
+    # rough size of obj and everything it refers to, counting shared objects once
+    if id(obj) in seen or isinstance(obj, (type, _lock_type)):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_getsizeof(k, seen) + _deep_getsizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_getsizeof(item, seen) for item in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool, datetime.date, datetime.time)) \
+            and hasattr(obj, "__dict__"):
+        size += _deep_getsizeof(obj.__dict__, seen)
+    return size
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Copy of the training dataset split by pair of stations into numpy files, for the prediction model trainers
+
+Module  : CMP6040-A - Artificial Intelligence, Assignment 2
+File    : training_data.py
+Date    : Sunday 18 October 2026
+Desc.   : Each pair of stations in the dataset table gets a .npy file holding the day_of_week, weekday, off_peak,
+          hour_of_day, delay and delay_change of its rows, in the order they were written to the table. A trainer
+          then reads its pair's file instead of searching the table. The files are brought up to date by appending
+          only the rows added to the table since they were last written, or written again into a new folder when
+          the table has changed in any other way. A lock file lets one process write them at a time. Run with
+          python -m model.training_data from the project root to export the dataset.
+History : 18/10/2026 - v1.0 - Create project file, SegmentStore.
+          18/10/2026 - v1.1 - Rows deleted part way through the table, or the table made again, are noticed.
+          18/10/2026 - v1.2 - Exports locked across processes, a full export written into a new folder.
+"""
+import os
+import json
+import glob
+import shutil
+import sqlite3
+import tempfile
+import threading
+import contextlib
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+import numpy as np
+
+__author__     = "Martin Siddons"
+__credits__    = ["Martin Siddons", "Steven Diep", "Sam Humphreys"]
+__maintainer__ = "Martin Siddons"
+__email__      = "m.siddons@uea.ac.uk"
+__status__     = "Prototype"  # "Development" "Prototype" "Production"
+
+
+class SegmentStore:
+    """Folder holding a manifest.json and a folder of .npy files, one for each (tpl_from, tpl_to) pair in a dataset
+    table. The manifest records the last rowid of the table the files hold and which folder they are in. A lock file
+    in the folder keeps other processes from reading the files while they are being written."""
+    def __init__(self, folder, db_path, table="dataset", fetch_rows=100000):
+        """
+        :param str folder:     Folder to keep the files in, created on the first export
+        :param str db_path:    Path of the sqlite file holding the dataset table
+        :param str table:      Table of rows as written by process_data.raw()
+        :param int fetch_rows: Rows read from the table at a time while exporting
+        """
+        self.folder = folder
+        self.db_path = db_path
+        self.table = table
+        self.fetch_rows = fetch_rows
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Brings the files up to date with the table. Rows added since the last export are appended to the files of
+        their pairs. Every file is written again, into a new folder which then replaces the old one, if the table no
+        longer holds exactly the rows last exported plus the rows after them, i.e. if any row has been taken away,
+        the table has been dropped and made again, or an export was stopped part way. Only one process exports at a
+        time, one finding the files already brought up to date by another exports nothing.
+
+        :rtype: int or None
+        :return: Number of rows exported, or None if the table could not be read
+        """
+        if not os.path.exists(self.db_path):
+            return None
+        with self._lock, _folder_lock(self.folder):
+            try:
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    state = self.__table_state(conn)
+                    manifest = self.__read_manifest()
+                    if manifest is not None and all(manifest.get(key) == state[key] for key in state):
+                        return 0
+                    if not self.__appendable(conn, manifest, state):
+                        return self.__rewrite(conn, state)
+                    return self.__append(conn, manifest, state)
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(e)
+                return None
+
+    def load(self, tpl_from, tpl_to):
+        """
+        :param str tpl_from: TIPLOC code of the station the train is leaving from
+        :param str tpl_to:   TIPLOC code of the station the train is next calling at
+        :rtype: tuple[np.ndarray, np.ndarray] or None
+        :return: Attributes (day_of_week, weekday, off_peak, hour_of_day, delay) and labels (delay_change) of the
+                 pair's rows, as the trainers take them from the table. None if nothing has been exported
+        """
+        if not os.path.exists(os.path.join(self.folder, "manifest.json")):
+            return None
+        with _folder_lock(self.folder, shared=True):
+            manifest = self.__read_manifest()
+            if manifest is None:
+                return None
+            path = self.__segment_path(manifest["data"], tpl_from, tpl_to)
+            if not os.path.exists(path):
+                return np.zeros((0, 5), dtype=np.int64), np.zeros(0, dtype=np.int64)
+            segment = np.load(path, mmap_mode="r")
+            return segment[:, :5].astype(np.int64), segment[:, 5].astype(np.int64)
+
+    def pairs(self):
+        """
+        :rtype: list[tuple[str, str]]
+        :return: (tpl_from, tpl_to) of every pair with a file
+        """
+        if not os.path.exists(os.path.join(self.folder, "manifest.json")):
+            return []
+        with _folder_lock(self.folder, shared=True):
+            manifest = self.__read_manifest()
+            if manifest is None:
+                return []
+            paths = glob.glob(os.path.join(self.folder, manifest["data"], "*.npy"))
+        names = [os.path.basename(path)[:-len(".npy")] for path in paths]
+        return sorted(tuple(name.split("-", 1)) for name in names)
+
+    def __table_state(self, conn):
+        """
+        :param sqlite3.Connection conn: Connection to the dataset
+        :rtype: dict
+        :return: The table's last rowid and number of rows, its first row, and the files process_data.raw() has
+                 recorded as written to it if it keeps an ingest_manifest table. A table dropped and made again gets
+                 a different first row or set of files even once it has as many rows as before
+        """
+        last_rowid, rows = conn.execute(""" SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM {} """
+                                        .format(self.table)).fetchone()
+        first = conn.execute(""" SELECT rowid, * FROM {} ORDER BY rowid LIMIT 1 """.format(self.table)).fetchone()
+        ingested = None
+        if conn.execute(""" SELECT 1 FROM sqlite_master WHERE type='table' AND name='ingest_manifest' """).fetchone():
+            ingested = sorted(row[0] for row in conn.execute(
+                """ SELECT hash FROM ingest_manifest WHERE table_name=? AND status='committed' """, (self.table,)))
+        return {"last_rowid": last_rowid, "rows": rows, "first": list(first) if first is not None else None,
+                "ingested": ingested}
+
+    def __appendable(self, conn, manifest, state):
+        """
+        :rtype: bool
+        :return: True if the table holds the rows of the last export unchanged, followed only by new rows
+        """
+        if manifest is None or not os.path.isdir(os.path.join(self.folder, manifest["data"])) \
+                or manifest.get("first") != state["first"] or manifest["last_rowid"] > state["last_rowid"]:
+            return False
+        if manifest.get("ingested") is not None and not set(manifest["ingested"]) <= set(state["ingested"] or []):
+            return False  # a file exported before is no longer recorded against the table
+        added = conn.execute(""" SELECT COUNT(*) FROM {} WHERE rowid > ? """.format(self.table),
+                             (manifest["last_rowid"],)).fetchone()[0]
+        return state["rows"] == manifest["rows"] + added  # else rows have gone from before the last rowid
+
+    def __append(self, conn, manifest, state):
+        # add the rows after the manifest's last rowid to the files of the last export. The manifest is marked
+        # incomplete while the files are written, so an export stopped part way is written again in full next time
+        self.__write_manifest(dict(manifest, complete=False))
+        exported = self.__export(conn, os.path.join(self.folder, manifest["data"]), manifest["last_rowid"],
+                                 state["last_rowid"])
+        self.__write_manifest(dict(state, complete=True, data=manifest["data"]))
+        return exported
+
+    def __rewrite(self, conn, state):
+        # export every row into a new folder, which the manifest is pointed at once it is finished. The files of the
+        # last export are left as they are until then, and removed after
+        os.makedirs(self.folder, exist_ok=True)
+        data_dir = tempfile.mkdtemp(prefix="rows-", dir=self.folder)
+        try:
+            exported = self.__export(conn, data_dir, 0, state["last_rowid"])
+        except BaseException:
+            shutil.rmtree(data_dir, ignore_errors=True)
+            raise
+        self.__write_manifest(dict(state, complete=True, data=os.path.basename(data_dir)))
+        for entry in os.listdir(self.folder):
+            path = os.path.join(self.folder, entry)
+            if os.path.isdir(path) and path != data_dir:
+                shutil.rmtree(path, ignore_errors=True)
+            elif entry.endswith(".npy"):  # exported before the files were kept in a folder of their own
+                os.remove(path)
+        return exported
+
+    def __export(self, conn, data_dir, after_rowid, last_rowid):
+        # append the rows after after_rowid, up to last_rowid, to the files of their pairs in data_dir
+        cur = conn.execute(""" SELECT rowid, * FROM {} WHERE rowid > ? AND rowid <= ? ORDER BY rowid """
+                           .format(self.table), (after_rowid, last_rowid))
+        added = {}  # (tpl_from, tpl_to): list of arrays of new rows
+        exported = 0
+        while True:
+            rows = cur.fetchmany(self.fetch_rows)
+            if not rows:
+                break
+            pairs = np.array([(row[1], row[2]) for row in rows], dtype=str)
+            values = np.array([row[3:9] for row in rows], dtype=np.int64)
+            values = values.astype(_column_type(values))  # held until every row has been read, so keep it small
+            keys, index = np.unique(np.char.add(np.char.add(pairs[:, 0], "-"), pairs[:, 1]), return_inverse=True)
+            for k, key in enumerate(keys):
+                added.setdefault(key, []).append(values[index == k])
+            exported += len(rows)
+
+        for key, parts in added.items():
+            path = os.path.join(data_dir, key + ".npy")
+            if os.path.exists(path):
+                parts.insert(0, np.load(path))
+            _save_atomic(path, np.concatenate(parts))
+        return exported
+
+    def __segment_path(self, data, tpl_from, tpl_to):
+        return os.path.join(self.folder, data, tpl_from + "-" + tpl_to + ".npy")
+
+    def __read_manifest(self):
+        # manifest of a finished export, or None if there is none
+        try:
+            with open(os.path.join(self.folder, "manifest.json")) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+        if not manifest.get("complete") or manifest.get("table") != self.table or "data" not in manifest:
+            return None  # still being written, of another table, or from before the files had a folder
+        return manifest
+
+    def __write_manifest(self, manifest):
+        os.makedirs(self.folder, exist_ok=True)
+        manifest["table"] = self.table
+        path = os.path.join(self.folder, "manifest.json")
+        with open(path + ".tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(path + ".tmp", path)
+
+
+@contextlib.contextmanager
+def _folder_lock(folder, shared=False):
+    """Holds a lock on the folder's lock file, which other processes wait on too. On Windows every lock is exclusive.
+
+    :param str folder:  Folder of a SegmentStore, created if needed
+    :param bool shared: True to only keep writers out, for reading the files
+    """
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "lock"), "a+b") as lock_file:
+        if os.name == "nt":
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # still held after LK_LOCK's ten tries, keep waiting
+                    pass
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _column_type(segment):
+    # smallest integer type holding every value, the values are small so this is nearly always int16
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if segment.size == 0 or (segment.min() >= info.min and segment.max() <= info.max):
+            return dtype
+    return np.int64
+
+
+def _save_atomic(path, segment):
+    # write beside the file then rename over it, so a reader never sees half a file
+    with open(path + ".tmp", "wb") as segment_file:
+        np.save(segment_file, segment)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.path.join(base_dir, "..", "data", "dataset.sqlite"),
+                        help="sqlite file holding the dataset")
+    parser.add_argument("--table", default="dataset", help="table of the dataset")
+    parser.add_argument("--folder", default=os.path.join(base_dir, "..", "data", "segments"),
+                        help="folder to export the dataset to")
+    args = parser.parse_args()
+    store = SegmentStore(args.folder, args.db, args.table)
+    exported = store.refresh()
+    if exported is None:
+        print("could not read", args.table, "from", args.db)
+    else:
+        print("exported", exported, "rows,", len(store.pairs()), "pairs of stations in", args.folder)
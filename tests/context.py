@@ -10,7 +10,16 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 import model.scraper as scraper
 import model.prediction_model as model
 import chatbot.presenter as presenter
+import chatbot.prewarm as prewarm
 import data.process_data as process
 import data.services as services
+import data.stations as stations
 import model.reasoning_engine as re
+import model.sessions as sessions
+import model.dialogue_flow as dialogue_flow
+import model.fare_worker as fare_worker
+import model.cache as cache
+import model.http_client as http_client
+import model.training_data as training_data
+import model.delay_tables as delay_tables
 from data.services import Network
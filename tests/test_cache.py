@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from context import cache
+
+
+class TestCache(unittest.TestCase):
+    def check_cache(self, store):
+        self.assertIsNone(store.get(("NRW", "LST")))
+        store.set(("NRW", "LST"), ("£10.00", "17:04"))
+        self.assertEqual(("£10.00", "17:04"), store.get(("NRW", "LST")))
+        self.assertEqual({"size": 1, "hits": 1, "misses": 1, "evictions": 0}, store.stats())
+
+    def check_lru(self, store):
+        store.set("a", 1)
+        store.set("b", 2)
+        store.get("a")  # b is now the least recently used
+        store.set("c", 3)
+        self.assertEqual(2, len(store))
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(1, store.get("a"))
+        self.assertEqual(1, store.evictions)
+
+    def check_ttl(self, store):
+        store.set("a", 1)
+        self.assertEqual("gone", store.get("a", "gone"))
+        self.assertEqual(0, len(store))
+
+    def test_memory(self):
+        self.check_cache(cache.MemoryCache())
+        self.check_lru(cache.MemoryCache(max_size=2))
+        self.check_ttl(cache.MemoryCache(ttl=-1))
+
+    def test_sqlite(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "cache.sqlite")
+            store = cache.SqliteCache(path)
+            self.check_cache(store)
+            store.close()
+            reopened = cache.SqliteCache(path)  # entries outlive the connection
+            self.assertEqual(("£10.00", "17:04"), reopened.get(("NRW", "LST")))
+            reopened.close()
+            store = cache.SqliteCache(path, max_size=2, table="lru")
+            self.check_lru(store)
+            store.close()
+            store = cache.SqliteCache(path, ttl=-1, table="ttl")
+            self.check_ttl(store)
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
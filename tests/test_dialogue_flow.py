@@ -0,0 +1,50 @@
+import unittest
+from experta import KnowledgeEngine, Rule, Fact, P
+from context import re, dialogue_flow
+
+
+class TestDialogueFlow(unittest.TestCase):
+    def test_flow_covers_every_rule(self):
+        rules = {rule.__name__: rule.salience for rule in re.Chatbot().get_rules()}
+        compiled = {name: salience for name, salience, body, needs, empty in dialogue_flow.compile_flow()}
+        self.assertEqual(rules, compiled)
+
+    def test_flow_read_from_rules(self):
+        flow = {name: (needs, empty) for name, needs, empty in dialogue_flow.FLOW}
+        self.assertEqual(([{"queryType": ("help", "cancel", "change")}], []), flow["ask_help_type"])
+        self.assertEqual(([{"queryType": ("ticket", "delay")}, {"departure_location": dialogue_flow.ANY}],
+                          ["arrival_location"]), flow["ask_arrival_station"])
+        self.assertEqual(([{"correct_booking": (False,)}, {"return_or_not": dialogue_flow.BIND}], []),
+                         flow["ask_adjustment"])
+
+    def test_condition_flow_cannot_test(self):
+        class Engine(KnowledgeEngine):
+            @Rule(Fact(action='begin'), Fact(delay=P(lambda delay: delay > 5)))
+            def long_delay(self):
+                pass
+
+        with self.assertRaises(ValueError):
+            dialogue_flow.flow_from_rules(Engine)
+
+    def test_unknown_rule(self):
+        with self.assertRaises(ValueError):
+            dialogue_flow.compile_flow([("ask_nothing", [], [])])
+
+    def test_slots_filled_in_order(self):
+        bot = dialogue_flow.FlowChatbot()
+        bot.currentInfo = {'intent': 'ticket', 'from_station': 'Norwich', 'from_crs': 'NRW',
+                           'to_station': 'Forest Gate', 'to_crs': 'FOG'}
+        bot.dictionary = {'outward_date': '', 'no_category': [], 'reset': False, 'raw_message': 'hello'}
+        sent = []
+        send_message = re.send_message
+        re.send_message = sent.append
+        try:
+            bot.step()
+        finally:
+            re.send_message = send_message
+        self.assertEqual(1, len(sent))
+        self.assertIn(sent[0], re.bot_feedback['ask_date'])
+
+
+if __name__ == '__main__':
+    unittest.main()
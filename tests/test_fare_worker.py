@@ -0,0 +1,45 @@
+import threading
+import unittest
+from context import fare_worker
+
+
+class TestFareWorker(unittest.TestCase):
+    def test_result_pushed_to_user(self):
+        worker = fare_worker.FareWorker(max_workers=1)
+        pushed = []
+        self.assertTrue(worker.submit("a", lambda: "£10.00", lambda sid, message: pushed.append((sid, message)),
+                                      "error"))
+        worker.shutdown()
+        self.assertEqual([("a", "£10.00")], pushed)
+
+    def test_error_message_pushed(self):
+        def lookup():
+            raise ValueError("page not found")
+        worker = fare_worker.FareWorker(max_workers=1)
+        pushed = []
+        failed = []
+        worker.submit("a", lookup, lambda sid, message: pushed.append((sid, message)), "error", failed.append)
+        worker.submit("b", lambda: 1 / 0, lambda sid, message: pushed.append((sid, message)), "error")
+        worker.shutdown()
+        self.assertEqual([("a", "page not found"), ("b", "error")], pushed)  # only errors meant for the user passed on
+        self.assertEqual(["a"], failed)
+        self.assertEqual(2, worker.failed)
+
+    def test_pending_lookups_bounded(self):
+        release = threading.Event()
+        worker = fare_worker.FareWorker(max_workers=1, max_pending=2)
+        pushed = []
+
+        def push(sid, message):
+            pushed.append(sid)
+        self.assertTrue(worker.submit("a", release.wait, push, "error"))
+        self.assertTrue(worker.submit("b", release.wait, push, "error"))
+        self.assertFalse(worker.submit("c", release.wait, push, "error"))
+        release.set()
+        worker.shutdown()
+        self.assertEqual(["a", "b"], pushed)
+        self.assertEqual(1, worker.rejected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import time
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from context import http_client
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive between requests
+    failures = {}  # path: number of 503s still to send
+
+    def do_GET(self):
+        if self.path == "/slow":
+            threading.Event().wait(1)
+        if Handler.failures.get(self.path, 0) > 0:
+            Handler.failures[self.path] -= 1
+            self.reply(503, b"busy")
+        else:
+            self.reply(200, b"ok")
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.url = "http://127.0.0.1:%d" % cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_connection_reused(self):
+        client = http_client.HttpClient()
+        for i in range(5):
+            self.assertEqual("ok", client.get(self.url + "/").text)
+        metrics = client.metrics()
+        self.assertEqual(5, metrics["requests"])
+        self.assertEqual(1, metrics["pools"]["http://127.0.0.1"]["connections"])
+        self.assertIn("latency_p95", metrics)
+        client.close()
+
+    def test_retry_on_server_error(self):
+        Handler.failures["/flaky"] = 2
+        client = http_client.HttpClient(backoff=0)
+        self.assertEqual(200, client.get(self.url + "/flaky").status_code)
+        self.assertEqual(2, client.metrics()["retried"])
+        client.close()
+
+    def test_read_timeout(self):
+        client = http_client.HttpClient(read_timeout=0.1, retries=0)
+        self.assertRaises(requests.RequestException, client.get, self.url + "/slow")
+        self.assertEqual(1, client.metrics()["errors"])
+        client.close()
+
+    def test_rate_limiter(self):
+        limiter = http_client.RateLimiter(50)
+        start = time.monotonic()
+        for i in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 import datetime
 from datetime import  timedelta
-from chatbot.nlp import parse_user_input,check_spellings,remove_punctuation,sanitize_input
+from chatbot.nlp import parse_user_input,check_spellings,remove_punctuation,sanitize_input,get_context,reload
 
 class MyTestCase(unittest.TestCase):
     date_today = datetime.date.today()
@@ -644,6 +644,17 @@ class MyTestCase(unittest.TestCase):
         expected_result = "I want to travel to london"
         self.assertEqual(expected_result,remove_punctuation(text_example))
 
+    def test_context_shared(self):
+        self.assertIs(get_context(), get_context())
+        self.assertIs(get_context().nlp, get_context().nlp)
+
+    def test_context_reload(self):
+        before = parse_user_input("nrw to FOG")
+        old_lexicon = get_context().lexicon
+        reload()
+        self.assertIsNot(old_lexicon, get_context().lexicon)
+        self.assertDictEqual(before, parse_user_input("nrw to FOG"))
+
     def test_sanitize(self):
         text_example = "^$£%^&''I want! to <b>tra!vEl</b> to (lodn&on)"
         expected_result = "i want to travel to london"
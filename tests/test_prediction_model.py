@@ -10,11 +10,22 @@ Desc.   : Testing methods in prediction_model.py
 History : 28/12/2020 - v1.0 - Create project file
           08/01/2020 - v1.1 - Add tests
           06/02/2020 - v1.2 - Fixed tests due to change in how networks work.
+          18/10/2026 - v1.3 - Added test for use_journey_models.
+          18/10/2026 - v1.4 - Added test for delay tables.
+          18/10/2026 - v1.5 - Added test for delay table versions.
+          18/10/2026 - v1.6 - Added test that the fit functions don't bring the segments up to date.
 
 """
+import os
+import sqlite3
 import unittest
+import tempfile
+import numpy as np
 from datetime import datetime
-from context import model, process, services
+from sklearn.preprocessing import StandardScaler
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neural_network import MLPClassifier
+from context import model, process, services, delay_tables, training_data
 
 network = services.get_network("ga_intercity")
 
@@ -109,6 +120,135 @@ class MyTestCase(unittest.TestCase):
         self.assertGreaterEqual(10, total_delay)
         self.assertLessEqual(-5, total_delay)
 
+    def test_use_journey_models_matches_use_model(self):
+        n, entries = build_test_network()
+
+        for model_name in ["KNeighborsClassifier", "MLPClassifier"]:
+            for delay in [0, 3, 12]:
+                expected = []
+                total_delay = delay
+                for entry in entries:
+                    stn_model, scaler = n.get_station(entry[0]).get_model(n.get_station(entry[1]), model_name)
+                    change = stn_model.predict(scaler.transform([entry[2:] + [total_delay]]))[0]
+                    while total_delay + change < -1:
+                        change += 1
+                    expected.append(change)
+                    total_delay += change
+                self.assertEqual(expected, model.use_journey_models(entries, delay, n, model_name))
+
+    def test_delay_tables_match_models(self):
+        n, entries = build_test_network()
+        compiled = model.compile_delay_tables(n, "KNeighborsClassifier")
+        self.assertEqual(4, len(compiled))
+        self.assertEqual({segment: 0 for segment in compiled},
+                         model.verify_delay_tables(n, "KNeighborsClassifier", compiled))
+
+        saved = model.tables
+        with tempfile.TemporaryDirectory() as folder:
+            try:
+                model.tables = None
+                expected = [model.use_journey_models(entries, delay, n) for delay in [-5, 0, 3, 40]]
+                model.tables = delay_tables.DelayTables(folder)
+                n._version = 1
+                model.tables.save("test", "KNeighborsClassifier", compiled, 1)
+                self.assertEqual(expected, [model.use_journey_models(entries, delay, n) for delay in [-5, 0, 3, 40]])
+            finally:
+                model.tables = saved
+
+    def test_delay_tables_versioned(self):
+        n, entries = build_test_network()
+        late = {(entry[0], entry[1]): np.full(delay_tables.SHAPE, 9, dtype=np.int16) for entry in entries}
+        with tempfile.TemporaryDirectory() as folder:
+            tables = delay_tables.DelayTables(folder)
+            tables.save("test", "KNeighborsClassifier", late, 2)
+            self.assertIsNone(tables.get("test", "KNeighborsClassifier", 1))  # compiled from another version
+            self.assertIsNone(tables.get("test", "KNeighborsClassifier", None))
+            self.assertEqual(set(late), set(tables.get("test", "KNeighborsClassifier", 2)))
+
+            segment = (entries[0][0], entries[0][1])
+            tables.discard("test", "KNeighborsClassifier", segment, 2, 3)  # the segment's model stored again
+            self.assertIsNone(tables.get("test", "KNeighborsClassifier", 2))
+            self.assertEqual(set(late) - {segment}, set(tables.get("test", "KNeighborsClassifier", 3)))
+            tables.discard("test", "KNeighborsClassifier", (entries[1][0], entries[1][1]), 2, 4)  # out of date
+            self.assertIsNone(tables.get("test", "KNeighborsClassifier", 4))
+
+            saved = model.tables
+            try:
+                model.tables = tables
+                n._version = 3
+                changes = model.use_journey_models(entries, 0, n)
+                self.assertNotEqual(9, changes[0])  # from the model, its table was dropped
+                self.assertEqual([9] * (len(entries) - 1), changes[1:])
+                n._version = 4
+                from_tables = model.use_journey_models(entries, 0, n)
+                model.tables = None
+                self.assertEqual(model.use_journey_models(entries, 0, n), from_tables)  # no tables of version 4
+            finally:
+                model.tables = saved
+
+    def test_fit_reads_export_only(self):
+        class CountingStore(training_data.SegmentStore):
+            refreshed = 0
+
+            def refresh(self):
+                CountingStore.refreshed += 1
+                return super().refresh()
+
+        rng = np.random.default_rng(0)
+        rows = np.column_stack([rng.integers(1, 8, 40), rng.integers(0, 2, 40), rng.integers(0, 2, 40),
+                                rng.integers(0, 24, 40), rng.integers(-2, 10, 40), rng.integers(-3, 4, 40)])
+        saved = model.segments
+        with tempfile.TemporaryDirectory() as folder:
+            conn = sqlite3.connect(os.path.join(folder, "dataset.sqlite"))
+            conn.execute(""" CREATE TABLE dataset (tpl_from text, tpl_to text, day_of_week integer, weekday integer,
+            off_peak integer, hour_of_day integer, delay integer, delay_change integer) """)
+            conn.executemany(""" INSERT INTO dataset VALUES ("A","B",?,?,?,?,?,?) """, rows.tolist())
+            conn.commit()
+            conn.close()
+            try:
+                model.segments = CountingStore(os.path.join(folder, "segments"), os.path.join(folder, "dataset.sqlite"))
+                model.segments.refresh()
+                bayes, scaler = model.bayes_model_fit("A", "B")
+                self.assertEqual(1, CountingStore.refreshed)  # the fit only read what was exported
+                self.assertEqual(5, bayes.coef_.shape[0])
+            finally:
+                model.segments = saved
+
+    def test_delay_table_lookup(self):
+        table = np.arange(np.prod(delay_tables.SHAPE)).reshape(delay_tables.SHAPE)
+        rows = delay_tables.grid_rows()
+        self.assertEqual([3, 1, 1, 8, -30], rows[table[2, 1, 8, 0]].tolist())  # rows are in the order of the table
+        self.assertEqual(table[2, 1, 8, 35], delay_tables.lookup(table, ["A", "B", 3, 1, 1, 8], 5))
+        self.assertIsNone(delay_tables.lookup(table, ["A", "B", 3, 1, 1, 8], 31))  # delay past the table
+        self.assertIsNone(delay_tables.lookup(table, ["A", "B", 3, 1, 1, 8], 2.5))
+        self.assertIsNone(delay_tables.lookup(table, ["A", "B", 6, 1, 1, 8], 0))  # saturday is not a weekday
+
+
+def build_test_network():
+    """
+    :rtype: tuple[services.Network, list]
+    :return: Network of four stations with a KNN and an MLP model on each rail fitted to random data, and the entries
+             of a journey along it
+    """
+    rng = np.random.default_rng(0)
+    stations = ["A", "B", "C", "D"]
+    n = services.Network("test")
+    n.append_rails(stations, [["0700"] * 4], [["0900"] * 4])
+    for i in range(len(stations)):
+        x = np.column_stack([rng.integers(1, 8, 300), rng.integers(0, 2, 300), rng.integers(0, 2, 300),
+                             rng.integers(0, 24, 300), rng.integers(-2, 10, 300)])
+        y = rng.integers(-3, 4, 300)
+        scaler = StandardScaler().fit(x)
+        stn_from = n.get_station(stations[i])
+        stn_to = n.get_station(stations[min(i + 1, len(stations) - 1)])  # the last station's rail to itself
+        stn_from.add_model(stn_to, [KNeighborsClassifier(n_neighbors=30).fit(scaler.transform(x), y), scaler])
+        stn_from.add_model(stn_to, [MLPClassifier(hidden_layer_sizes=5, max_iter=50).fit(scaler.transform(x), y),
+                                    scaler])
+    path = n.find_path("A", "D")
+    path.append(path[-1])
+    entries = [process.query_to_input(path[i], path[i + 1], datetime(2026, 10, 12, 8)) for i in range(len(path) - 1)]
+    return n, entries
+
 
 if __name__ == '__main__':
     unittest.main()
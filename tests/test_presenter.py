@@ -1,6 +1,6 @@
 import unittest
 from io import BytesIO
-from context import presenter
+from context import presenter, prewarm
 
 
 class MyTestCase(unittest.TestCase):
@@ -27,6 +27,20 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(200, response.status_code)
         self.assertEqual("this is a test of the voice recogniser", response.get_json().get("message"))
 
+    def test_ready(self):
+        saved = presenter.prewarmer
+        try:
+            presenter.prewarmer = None
+            self.assertEqual(503, self.app.get("/ready").status_code)  # not started
+            presenter.prewarmer = prewarm.Prewarmer([("step", lambda: None)])
+            self.assertEqual(503, self.app.get("/ready").status_code)
+            presenter.prewarmer.run()
+            response = self.app.get("/ready")
+            self.assertEqual(200, response.status_code)
+            self.assertEqual("ready", response.get_json().get("state"))
+        finally:
+            presenter.prewarmer = saved
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,46 @@
+import threading
+import unittest
+from context import prewarm
+
+
+class TestPrewarmer(unittest.TestCase):
+    def test_steps_run_in_order(self):
+        ran = []
+        warm = prewarm.Prewarmer([("first", lambda: ran.append("first")), ("second", lambda: ran.append("second"))])
+        self.assertEqual("waiting", warm.status()["state"])
+        warm.start()
+        self.assertTrue(warm.wait(5))
+        self.assertEqual(["first", "second"], ran)
+        status = warm.status()
+        self.assertEqual("ready", status["state"])
+        self.assertEqual([True, True], [step["done"] for step in status["steps"]])
+        warm.run()  # steps are only run once
+        self.assertEqual(["first", "second"], ran)
+
+    def test_status_while_loading(self):
+        release = threading.Event()
+        warm = prewarm.Prewarmer([("slow", release.wait), ("after", lambda: None)])
+        warm.start()
+        self.assertFalse(warm.wait(0.1))
+        status = warm.status()
+        self.assertEqual("loading", status["state"])
+        self.assertEqual("slow", status["current"])
+        self.assertFalse(warm.is_ready())
+        release.set()
+        self.assertTrue(warm.wait(5))
+
+    def test_failed_step(self):
+        ran = []
+
+        def fail():
+            raise OSError("no db")
+        warm = prewarm.Prewarmer([("db", fail), ("after", lambda: ran.append("after"))])
+        warm.run()
+        self.assertFalse(warm.is_ready())
+        self.assertEqual("failed", warm.status()["state"])
+        self.assertEqual("db: no db", warm.status()["error"])
+        self.assertEqual([], ran)
+
+
+if __name__ == '__main__':
+    unittest.main()
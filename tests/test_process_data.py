@@ -1,5 +1,8 @@
+import os
+import sqlite3
+import tempfile
 import unittest
-from context import process, services
+from context import process, services, model, delay_tables
 
 
 class MyTestCase(unittest.TestCase):
@@ -79,6 +82,107 @@ class MyTestCase(unittest.TestCase):
         print(delay)
         self.assertGreaterEqual(3, delay)
 
+    def test_user_to_query_cached(self):
+        process.configure_delay_cache(max_size=16)
+        first = process.user_to_query("IPSWICH", "STFD", 7)
+        self.assertEqual(first, process.user_to_query("IPSWICH", "STFD", 7))
+        stats = process.delay_cache_stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(0.5, stats["hit_rate"])
+
+        setattr(process, "__delay_cache_source", None)  # as if the network had been stored since
+        self.assertEqual(first, process.user_to_query("IPSWICH", "STFD", 7))
+        self.assertEqual(1, process.delay_cache_stats()["hits"])  # worked out again
+
+        saved = model.tables
+        with tempfile.TemporaryDirectory() as folder:
+            try:
+                model.tables = delay_tables.DelayTables(folder)
+                self.assertEqual(first, process.user_to_query("IPSWICH", "STFD", 7))
+                hits = process.delay_cache_stats()["hits"]
+                self.assertEqual(first, process.user_to_query("IPSWICH", "STFD", 7))
+                self.assertEqual(hits + 1, process.delay_cache_stats()["hits"])
+                model.tables.save("ga_intercity", "KNeighborsClassifier", {}, None)  # tables written while cached
+                self.assertEqual(first, process.user_to_query("IPSWICH", "STFD", 7))
+                self.assertEqual(hits + 1, process.delay_cache_stats()["hits"])  # cleared and worked out again
+            finally:
+                model.tables = saved
+
+        process.configure_delay_cache(max_size=0)
+        self.assertIsNone(process.delay_cache_stats())
+        self.assertEqual(first, process.user_to_query("IPSWICH", "STFD", 7))
+        process.configure_delay_cache()
+
+    def test_read_hsp_unknown_crs(self):
+        read_hsp = getattr(process, "__read_hsp_runs")
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "HSP_2019_01_SUNDAYS_LST-NRW.csv")
+            with open(path, "w") as csv_file:
+                csv_file.write("rid,crs,ptd,pta,dep_at,arr_at\n"
+                               "201901067101240,NRW,0600,,0601,\n"
+                               "201901067101240,XYZ,0620,0619,0621,0620\n"
+                               "201901067101240,XYZ,0630,0629,0631,0630\n"
+                               "201901067101240,LST,,0750,,0752\n")
+            runs = list(read_hsp(path, ["NRCH", "LIVST"], {"NRW": "NRCH", "LST": "LIVST"}))
+        self.assertEqual(1, len(runs))
+        self.assertEqual(2, len(runs[0]))  # one run of two stations
+        self.assertEqual(["201901067101240", "NRCH", "", "", "06:00", "", "", "", "", "", "06:01"], runs[0][0])
+        self.assertEqual("LIVST", runs[0][1][1])
+
+    def test_chunk_runs(self):
+        chunk_runs = getattr(process, "__chunk_runs")
+        runs = [[["a", "NRCH"], ["a", "DISS"]], [["b", "NRCH"]], [["c", "NRCH"], ["c", "DISS"], ["c", "IPSWICH"]]]
+        chunks = list(chunk_runs(iter(runs), 3))
+        self.assertEqual([[["a", "NRCH"], ["a", "DISS"], ["b", "NRCH"], [None, None]],
+                          [["c", "NRCH"], ["c", "DISS"], ["c", "IPSWICH"], [None, None]]], chunks)
+
+    def test_transform_columns_matches_rows(self):
+        network = services.Network("test")
+        network.append_rails(["NRCH", "DISS", "STWMRKT"], [["0400", "0500", "0600"], ["1600", "1630", "1700"]],
+                             [["0815", "0830", "0845"], ["1830", "1845", "1900"]])
+        network.append_rails(["STWMRKT", "DISS", "NRCH"], [["0400", "0400", "0400"]], [["0900", "0900", "0900"]])
+        csv_data = [["201701267101240", "NRCH", "", "", "06:00", "", "", "", "", "", "06:01"],
+                    ["201701267101240", "DISS", "06:15:30", "", "", "06:20", "", "", "", "", ""],  # estimate only
+                    ["201701267101240", "STWMRKT", "06:30", "", "", "", "", "", "", "", ""],  # cancelled
+                    ["201701287101240", "NRCH", "", "", "23:58", "", "", "", "", "", "00:03"],  # saturday
+                    ["201701287101240", "DISS", "", "00:10", "", "", "", "", "", "23:59", ""],
+                    ["201810097681184", "STWMRKT", "", "", "17:00", "", "", "", "", "", "18:15"],
+                    ["201810097681184", "NRCH", "17:40", "", "", "", "", "", "17:20", "", ""],
+                    [None, None]]
+        rows = process.transform_rows(csv_data, network)
+        self.assertEqual(rows, process.transform_columns(csv_data, network))
+        self.assertEqual(["NRCH", "DISS", 4, 1, 0, 6, 1, 1], rows[0])
+        self.assertEqual([5, -11, 30, -20], [row[6] for row in rows[3:7]])  # across midnight, capped at 30
+        self.assertEqual([], process.transform_columns([[None, None]], network))
+
+    def test_write_to_db_once_per_file(self):
+        write_to_db = getattr(process, "__write_to_db")
+        data = [["NRCH", "DISS", 4, 1, 0, 6, 1, 1], ["DISS", "STWMRKT", 4, 1, 0, 6, 2, 1]]
+        with tempfile.TemporaryDirectory() as folder:
+            connect = use_temporary_db(folder)
+            try:
+                self.assertEqual(2, write_to_db("test_manifest", [data[:1], data[1:]], ("0123abcd", "test.csv")))
+                self.assertEqual(-1, write_to_db("test_manifest", [data], ("0123abcd", "copy of test.csv")))
+                self.assertIn("0123abcd", process.ingested_hashes("test_manifest"))
+                self.assertNotIn("0123abcd", process.ingested_hashes("test_other_table"))
+                self.assertTrue(process.drop_table("test_manifest"))
+                self.assertEqual(set(), process.ingested_hashes("test_manifest"))
+            finally:
+                setattr(process, "__connect_to_db", connect)
+
+    def test_create_index(self):
+        write_to_db = getattr(process, "__write_to_db")
+        with tempfile.TemporaryDirectory() as folder:
+            connect = use_temporary_db(folder)
+            try:
+                self.assertFalse(process.create_index("test_index"))  # no table yet
+                write_to_db("test_index", [[["NRCH", "DISS", 4, 1, 0, 6, 1, 1]]])
+                self.assertTrue(process.create_index("test_index"))
+                self.assertFalse(process.create_index("test_index"))  # already built
+                self.assertTrue(process.drop_table("test_index"))
+            finally:
+                setattr(process, "__connect_to_db", connect)
+
     # dropping the rest of these tests for now since they need to be rewritten as above to work right now,
     # but I'll be making changes to process_data.py soon to remove the network requirement from query_to_input
 
@@ -132,5 +236,17 @@ class MyTestCase(unittest.TestCase):
     #     dropped = prep.drop_table("new_table")
     #     self.assertEqual(True, dropped)
 
+def use_temporary_db(folder):
+    """Points process_data at a new db in the given folder, rather than data/db.sqlite
+
+    :param str folder: Folder to make the db in
+    :return: The function process_data connected with before, to be put back once the test is done
+    """
+    connect = getattr(process, "__connect_to_db")
+    path = os.path.join(folder, "db.sqlite")
+    setattr(process, "__connect_to_db", lambda bulk=False: sqlite3.connect(path))
+    return connect
+
+
 if __name__ == "__main__":
     unittest.main()
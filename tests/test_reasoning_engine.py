@@ -25,6 +25,17 @@ class TestReasoningEngine(unittest.TestCase):
 
         self.assertEqual(True, re.process_user_input(processed_nlp_output))
 
+    def test_fare_lookup_failed(self):
+        # a booking whose fare could not be found in the background is asked to be confirmed again
+        session = re.sessions.get("fare_failed")
+        session.currentInfo.update({'from_crs': 'NRW', 'to_crs': 'LST', 'correct_booking': True})
+        re._fare_lookup_failed("fare_failed")
+        self.assertEqual({'from_crs': 'NRW', 'to_crs': 'LST'}, session.currentInfo)
+        re.sessions.end("fare_failed")
+
+        re._fare_lookup_failed("fare_failed")  # the user has gone since
+        self.assertNotIn("fare_failed", re.sessions)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -10,8 +10,22 @@ Desc.   : Testing methods in scraper.py
 History : 28/12/2020 - v1.0 - Create project file
           29/12/2020 - v1.1 - Completed tests for single fare
           30/20/2020 - v1.2 - Completed tests for return fare
+          18/10/2026 - v1.3 - Added tests for the fare cache
+          18/10/2026 - v1.4 - Added offline tests for historical_trains() against a stub HSP server
+          18/10/2026 - v1.5 - Resume test checkpoints byte offsets into the .part file
+          18/10/2026 - v1.6 - Added test for an unreachable fare site
+          18/10/2026 - v1.7 - Added tests for cached fares of an earlier train and closing the sqlite fare cache
 """
+import os
+import csv
+import json
+import sqlite3
+import datetime
+import tempfile
+import threading
 import unittest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from context import scraper
 
 
@@ -105,6 +119,154 @@ class TestStringMethods(unittest.TestCase):
         # test that the if return date is too far forward and error is generated
         self.assertRaises(ValueError, scraper.return_fare, "NRW", "LST", "2021/01/29", "16:30", "2021/05/28", "18:00")
 
+    def test_single_cached_by_time_band(self):
+        # a fare found for a time is given again for any time in the same band, without going to the site
+        day = datetime.date.today() + datetime.timedelta(days=7)
+        cached = ("£10.00", "17:04", "https://ojp.nationalrail.co.uk/service/timesandfares/NRW/LST/x/1630/dep")
+        old_cache = scraper.fare_cache
+        scraper.configure_fare_cache("memory", time_band=30)
+        try:
+            scraper.fare_cache.set(("single", "NRW", "LST", day.strftime("%d%m%y"), "1630"), cached)
+            self.assertEqual(cached, scraper.single_fare("NRW", "LST", day.strftime("%Y/%m/%d"), "16:45"))
+            self.assertEqual(1, scraper.fare_cache.hits)
+        finally:
+            scraper.fare_cache = old_cache
+
+    def test_single_cached_train_too_early(self):
+        # a fare whose train leaves before the time asked for is looked up again, even in the same band
+        class Unreachable:
+            def get(self, url, **kwargs):
+                raise requests.ConnectionError("connection refused")
+
+        day = datetime.date.today() + datetime.timedelta(days=7)
+        cached = ("£10.00", "16:40", "https://ojp.nationalrail.co.uk/service/timesandfares/NRW/LST/x/1630/dep")
+        old_client, old_cache = scraper.http_client, scraper.fare_cache
+        scraper.configure_fare_cache("memory", time_band=30)
+        scraper.http_client = Unreachable()
+        try:
+            scraper.fare_cache.set(("single", "NRW", "LST", day.strftime("%d%m%y"), "1630"), cached)
+            self.assertEqual(cached, scraper.single_fare("NRW", "LST", day.strftime("%Y/%m/%d"), "16:40"))
+            self.assertRaises(ValueError, scraper.single_fare, "NRW", "LST", day.strftime("%Y/%m/%d"), "16:45")
+        finally:
+            scraper.http_client, scraper.fare_cache = old_client, old_cache
+
+    def test_sqlite_fare_cache_closed(self):
+        old_cache = scraper.fare_cache
+        with tempfile.TemporaryDirectory() as folder:
+            try:
+                scraper.configure_fare_cache("sqlite", path=os.path.join(folder, "fares.sqlite"))
+                sqlite_cache = scraper.fare_cache
+                scraper.configure_fare_cache("memory")
+                self.assertRaises(sqlite3.ProgrammingError, len, sqlite_cache)  # its connection was closed when it was replaced
+            finally:
+                scraper.fare_cache = old_cache
+
+    def test_errors_not_cached(self):
+        old_cache = scraper.fare_cache
+        scraper.configure_fare_cache("memory")
+        try:
+            self.assertRaises(ValueError, scraper.single_fare, "NRW", "LST", "2020/12/01", "16:30")
+            self.assertEqual(0, len(scraper.fare_cache))
+        finally:
+            scraper.fare_cache = old_cache
+
+
+    def test_unreachable_site(self):
+        # a timeout or dropped connection is reported like any other fare the user can't be given
+        class Unreachable:
+            def get(self, url, **kwargs):
+                raise requests.ConnectionError("connection refused")
+
+        day = (datetime.date.today() + datetime.timedelta(days=7)).strftime("%Y/%m/%d")
+        old_client, old_cache = scraper.http_client, scraper.fare_cache
+        scraper.http_client, scraper.fare_cache = Unreachable(), None
+        try:
+            self.assertRaises(ValueError, scraper.single_fare, "NRW", "LST", day, "16:30")
+            self.assertRaises(ValueError, scraper.return_fare, "NRW", "LST", day, "16:30", day, "18:00")
+        finally:
+            scraper.http_client, scraper.fare_cache = old_client, old_cache
+
+
+class StubHsp(BaseHTTPRequestHandler):
+    """Answers serviceMetrics with rids rid00-rid11 and serviceDetails with two stops for any rid"""
+    rids = ["rid%02d" % i for i in range(12)]
+    detail_requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/serviceMetrics"):
+            reply = {"Services": [{"serviceAttributesMetrics": {"rids": StubHsp.rids[:6]}},
+                                  {"serviceAttributesMetrics": {"rids": StubHsp.rids[6:]}}]}
+        else:
+            StubHsp.detail_requests.append(body["rid"])
+            reply = {"serviceAttributesDetails": {"locations": [
+                {"location": "NRW", "gbtt_ptd": "0900", "gbtt_pta": "", "actual_td": "0901", "actual_ta": ""},
+                {"location": "LST", "gbtt_ptd": "", "gbtt_pta": "1050", "actual_td": "", "actual_ta": "1055"}]}}
+        data = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHistoricalTrains(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHsp)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.old_url = scraper.HSP_API_URL
+        scraper.HSP_API_URL = "http://127.0.0.1:%d/api/v1" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        scraper.HSP_API_URL = cls.old_url
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubHsp.detail_requests = []
+
+    def test_concurrent_fetch(self):
+        with tempfile.TemporaryDirectory() as folder:
+            self.assertTrue(scraper.historical_trains(months=[1], out_dir=folder, workers=4, rate_limit=0))
+            with open(os.path.join(folder, "HSP_2019_01_SUNDAYS_LST-NRW.csv")) as csv_file:
+                rows = list(csv.reader(csv_file))
+            self.assertEqual(["rid", "crs", "ptd", "pta", "dep_at", "arr_at"], rows[0])
+            self.assertEqual(25, len(rows))
+            rids = [row[0] for row in rows[1:]]
+            self.assertEqual(sorted(StubHsp.rids), sorted(set(rids)))
+            self.assertTrue(all(rids[i] == rids[i + 1] for i in range(0, len(rids), 2)))  # a rid's rows stay together
+            self.assertEqual(["HSP_2019_01_SUNDAYS_LST-NRW.csv"], os.listdir(folder))
+
+    def test_resume_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "HSP_2019_02_SUNDAYS_LST-NRW.csv")
+            with open(path + ".part", "wb") as part_file, open(path + ".checkpoint.jsonl", "w") as checkpoint_file:
+                part_file.write(b"rid,crs,ptd,pta,dep_at,arr_at\r\n")
+                for rid in StubHsp.rids[:5]:
+                    part_file.write(rid.encode() + b",NRW,,,,\r\n")
+                    checkpoint_file.write(json.dumps({"rid": rid, "offset": part_file.tell()}) + "\n")
+                part_file.write(b"rid05,NRW,09")  # written after the last checkpoint
+                checkpoint_file.write('{"rid": "rid05", "off')  # cut short by a crash
+            self.assertTrue(scraper.historical_trains(months=[2], out_dir=folder, workers=2, rate_limit=0,
+                                                      flush_every=3))
+            self.assertEqual(sorted(StubHsp.rids[5:]), sorted(StubHsp.detail_requests))
+            with open(path) as csv_file:
+                rows = list(csv.reader(csv_file))
+            self.assertEqual(1 + 5 + 7 * 2, len(rows))
+            self.assertTrue(all(len(row) == 6 for row in rows))
+            self.assertEqual(["HSP_2019_02_SUNDAYS_LST-NRW.csv"], os.listdir(folder))
+
+    def test_saved_months_skipped(self):
+        with tempfile.TemporaryDirectory() as folder:
+            open(os.path.join(folder, "HSP_2019_03_SUNDAYS_LST-NRW.csv"), "w").close()
+            self.assertTrue(scraper.historical_trains(months=[3], out_dir=folder, rate_limit=0))
+            self.assertEqual([], StubHsp.detail_requests)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,4 +1,7 @@
+import pickle
+import sqlite3
 import unittest
+import functools
 from context import services
 
 
@@ -44,5 +47,81 @@ class MyTestCase(unittest.TestCase):
         self.assertRaises(ValueError, n.find_path, "NRCH", "k")
 
 
+    def test_find_path_fewest_stops(self):
+        n = services.Network("test")
+        n.append_rails(["A", "B", "C", "D"], [["0700", "0700", "0700", "0700"]], [["0900", "0900", "0900", "0900"]])
+        n.add_rail("A", "C", [[]])
+        self.assertEqual(["A", "C", "D"], [station.get_id() for station in n.find_path("A", "D")])
+        self.assertEqual(["D"], [station.get_id() for station in n.find_path("D", "D")])
+        self.assertIsNone(n.find_path("D", "A"))  # rails only run one way
+
+    def test_find_path_after_add_rail(self):
+        n = services.Network("test")
+        n.append_rails(["A", "B", "C"], [["0700", "0700", "0700"]], [["0900", "0900", "0900"]])
+        self.assertIsNone(n.find_path("C", "A"))
+        n.add_rail("C", "A", [[]])
+        self.assertEqual(["C", "A"], [station.get_id() for station in n.find_path("C", "A")])
+        n.append_rails(["C", "E"], [["0700", "0700"]], [["0900", "0900"]])
+        self.assertEqual(["A", "B", "C", "E"], [station.get_id() for station in n.find_path("A", "E")])
+
+    def test_find_path_after_pickle(self):
+        n = services.Network("test")
+        n.append_rails(["A", "B", "C"], [["0700", "0700", "0700"]], [["0900", "0900", "0900"]])
+        n.find_path("A", "C")
+        loaded = pickle.loads(pickle.dumps(n))
+        self.assertIsNone(loaded._parents)  # tables are not stored with the network
+        path = loaded.find_path("A", "C")
+        self.assertEqual(["A", "B", "C"], [station.get_id() for station in path])
+        self.assertIs(loaded.get_station("B"), path[1])
+
+    def test_models_stored_apart(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute(""" CREATE TABLE networks (name text, object blob) """)
+        n = services.Network("test")
+        n.append_rails(["A", "B"], [["0700", "0700"]], [["0900", "0900"]])
+        n.get_station("A").add_model(n.get_station("B"), [{"weights": [1, 2]}, None])
+        services.store_network(n, conn, appending=False)
+
+        blob = conn.execute(""" SELECT object FROM networks WHERE name="test" """).fetchone()[0]
+        loaded = pickle.loads(blob)
+        self.assertEqual(["peak"], list(loaded.get_station("A").connected[loaded.get_station("B")].keys()))
+        loaded.set_model_loader(functools.partial(services.load_model, "test", conn=conn))
+        model, scaler = loaded.get_station("A").get_model(loaded.get_station("B"), "dict")  # fetched on first use
+        self.assertEqual({"weights": [1, 2]}, model)
+        self.assertIsNone(scaler)
+
+        loaded.get_station("A").add_model(loaded.get_station("B"), [{"weights": [3]}, None])
+        services.store_network(loaded, conn)
+        self.assertEqual({"weights": [3]}, services.load_model("test", "A", "B", "dict", conn=conn)[0])
+        self.assertEqual({"weights": [1, 2]}, services.load_model("test", "A", "B", "dict", 1, conn=conn)[0])
+        self.assertIsNone(services.load_model("test", "B", "A", "dict", conn=conn))
+        conn.close()
+
+    def test_models_moved_from_old_blob(self):
+        n = services.Network("test")
+        n.append_rails(["A", "B"], [["0700", "0700"]], [["0900", "0900"]])
+        n.get_station("A").add_model(n.get_station("B"), [{"weights": [1]}, None])
+        state = n.get_station("A").__dict__.copy()
+        del state["_new_models"]  # as pickled before models were stored apart
+        station = services.Station.__new__(services.Station)
+        station.__setstate__(state)
+        self.assertEqual({(n.get_station("B"), "dict")}, station._new_models)
+
+    def test_get_network_loaded_once(self):
+        n = services.get_network("ga_intercity")
+        self.assertIs(n, services.get_network("ga_intercity"))
+        refreshed = services.refresh_network("ga_intercity")
+        self.assertIsNot(n, refreshed)
+        self.assertIs(n, services.get_network("ga_intercity"))  # a refreshed network is not handed out to others
+
+        networks = getattr(services, "__networks")
+        networks["ga_intercity"] = (-1, n)  # as if the network had been stored since
+        reloaded = services.get_network("ga_intercity")
+        self.assertIsNot(n, reloaded)
+        self.assertIs(reloaded, services.get_network("ga_intercity"))
+        services.clear_networks()
+        self.assertIsNot(reloaded, services.get_network("ga_intercity"))
+
+
 if __name__ == '__main__':
     unittest.main()
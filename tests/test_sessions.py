@@ -0,0 +1,75 @@
+import unittest
+import datetime
+from context import sessions
+
+
+class MyTestCase(unittest.TestCase):
+    def test_sessions_are_separate(self):
+        manager = sessions.SessionManager()
+        manager.get("a").currentInfo['intent'] = 'ticket'
+        self.assertEqual({}, manager.get("b").currentInfo)
+        self.assertEqual({'intent': 'ticket'}, manager.get("a").currentInfo)
+
+    def test_end_only_forgets_one_user(self):
+        manager = sessions.SessionManager()
+        manager.get("a").currentInfo['intent'] = 'ticket'
+        manager.get("b").currentInfo['intent'] = 'delay'
+        self.assertTrue(manager.end("a"))
+        self.assertFalse(manager.end("a"))
+        self.assertNotIn("a", manager)
+        self.assertEqual({'intent': 'delay'}, manager.get("b").currentInfo)
+
+    def test_cap_drops_least_recently_used(self):
+        manager = sessions.SessionManager(max_sessions=2)
+        manager.get("a")
+        manager.get("b")
+        manager.get("a")  # b is now the least recently used
+        manager.get("c")
+        self.assertEqual(2, len(manager))
+        self.assertIn("a", manager)
+        self.assertNotIn("b", manager)
+        self.assertEqual(1, manager.evicted)
+
+    def test_idle_timeout(self):
+        manager = sessions.SessionManager(idle_timeout=60)
+        manager.get("a").last_seen -= 120
+        manager.get("b")
+        self.assertEqual(0, manager.evict_idle())
+        self.assertNotIn("a", manager)
+        self.assertIn("b", manager)
+
+    def test_memory_usage(self):
+        manager = sessions.SessionManager()
+        self.assertEqual(0, manager.memory_usage()["bytes"])
+        session = manager.get("a")
+        empty = manager.memory_usage()["bytes_per_session"]
+        session.currentInfo.update({'intent': 'ticket', 'from_station': 'Norwich', 'from_crs': 'NRW',
+                                    'outward_date': datetime.date(2021, 2, 26)})
+        usage = manager.memory_usage()
+        self.assertEqual(1, usage["sessions"])
+        self.assertGreater(usage["bytes_per_session"], empty)
+
+    def test_engine_pool_reuses_engines(self):
+        pool = sessions.EnginePool(object, max_engines=2)
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertIsNot(first, second)
+        pool.release(first)
+        self.assertIs(first, pool.acquire())
+
+    def test_engine_pool_prefers_owner(self):
+        class Engine:
+            owner = None
+        pool = sessions.EnginePool(Engine, max_engines=2)
+        first = pool.acquire("a")
+        first.owner = "a"
+        second = pool.acquire("b")
+        second.owner = "b"
+        pool.release(first)
+        pool.release(second)
+        self.assertIs(second, pool.acquire("b"))
+        self.assertIs(first, pool.acquire("c"))
+
+
+if __name__ == '__main__':
+    unittest.main()
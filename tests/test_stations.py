@@ -0,0 +1,43 @@
+import unittest
+from context import stations
+
+
+class MyTestCase(unittest.TestCase):
+    rows = [("Norwich", "NRW", "NRCH", "Norfolk", 4000000),
+            ("Diss", "DIS", "DISS", "Norfolk", 700000),
+            ("Thetford", "TTF", "THTFORD", "Norfolk", 400000),
+            ("Norwich Trowse", "none", "TROWSEJ", "Norfolk", None),
+            ("Great Yarmouth", "GYM", "YARMTH", "Norfolk", 500000),
+            ("Ipswich", "IPS", "IPSWICH", "Suffolk", 3000000)]
+
+    def test_lookups(self):
+        directory = stations.StationDirectory(self.rows)
+        self.assertEqual("NRW", directory.get_crs("Norwich"))
+        self.assertEqual("Norwich", directory.get_name("NRW"))
+        self.assertEqual("NRCH", directory.get_tpl("Norwich"))
+        self.assertEqual("IPSWICH", directory.get_tpl_from_crs("IPS"))
+        self.assertIsNone(directory.get_crs("Nowhere"))
+
+    def test_crs_none_excluded_from_lexicon(self):
+        directory = stations.StationDirectory(self.rows)
+        self.assertNotIn("Norwich Trowse", directory.names)
+        self.assertEqual(["Norfolk", "Suffolk"], directory.counties)
+        self.assertEqual(len(directory.names), len(directory.crs_codes))
+
+    def test_county_ranking(self):
+        directory = stations.StationDirectory(self.rows)
+        self.assertEqual(["Norwich", "Diss", "Great Yarmouth", "Thetford", "Norwich Trowse"],
+                         directory.get_county_stations("Norfolk"))
+        self.assertEqual(["Norwich", "Diss"], directory.get_county_stations("Norfolk", 2))
+        self.assertEqual([], directory.get_county_stations("Essex"))
+
+    def test_directory_from_db(self):
+        directory = stations.get_directory()
+        self.assertIs(directory, stations.get_directory())
+        self.assertEqual("NRW", directory.get_crs("Norwich"))
+        self.assertEqual("NRCH", directory.get_tpl("Norwich"))
+        self.assertIsNot(directory, stations.reload())
+
+
+if __name__ == '__main__':
+    unittest.main()
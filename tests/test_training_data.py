@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from context import training_data
+
+
+class TestSegmentStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.folder.name, "dataset.sqlite")
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(""" CREATE TABLE dataset (tpl_from text, tpl_to text, day_of_week integer, weekday integer,
+        off_peak integer, hour_of_day integer, delay integer, delay_change integer) """)
+        self.store = training_data.SegmentStore(os.path.join(self.folder.name, "segments"), self.db_path,
+                                                fetch_rows=2)
+
+    def tearDown(self):
+        self.conn.close()
+        self.folder.cleanup()
+
+    def add(self, rows):
+        self.conn.executemany(""" INSERT INTO dataset VALUES (?,?,?,?,?,?,?,?) """, rows)
+        self.conn.commit()
+
+    def test_export_and_load(self):
+        self.assertIsNone(self.store.load("NRCH", "DISS"))  # nothing exported yet
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 2, 2], ["DISS", "STWMRKT", 1, 1, 0, 7, 3, 1],
+                  ["NRCH", "DISS", 6, 0, 1, 9, 0, -1]])
+        self.assertEqual(3, self.store.refresh())
+        self.assertEqual(0, self.store.refresh())  # already up to date
+        x, y = self.store.load("NRCH", "DISS")
+        self.assertEqual([[1, 1, 0, 7, 2], [6, 0, 1, 9, 0]], x.tolist())
+        self.assertEqual([2, -1], y.tolist())
+        self.assertEqual("int64", str(x.dtype))
+        self.assertEqual((0, 5), self.store.load("NRCH", "LIVST")[0].shape)
+        self.assertEqual([("DISS", "STWMRKT"), ("NRCH", "DISS")], self.store.pairs())
+
+    def test_incremental_refresh(self):
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 2, 2]])
+        self.store.refresh()
+        self.add([["NRCH", "DISS", 2, 1, 0, 8, 4, 2], ["DISS", "STWMRKT", 2, 1, 0, 8, 5, 1]])
+        self.assertEqual(2, self.store.refresh())  # only the new rows
+        self.assertEqual([2, 2], self.store.load("NRCH", "DISS")[1].tolist())
+        self.assertEqual([1], self.store.load("DISS", "STWMRKT")[1].tolist())
+
+    def test_rows_removed(self):
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 2, 2], ["NRCH", "DISS", 2, 1, 0, 8, 4, 2]])
+        self.store.refresh()
+        self.conn.execute(""" DELETE FROM dataset WHERE rowid = 2 """)
+        self.conn.commit()
+        self.assertEqual(1, self.store.refresh())  # written again from the start
+        self.assertEqual([[1, 1, 0, 7, 2]], self.store.load("NRCH", "DISS")[0].tolist())
+
+    def test_row_removed_from_middle(self):
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 0, 0], ["NRCH", "DISS", 1, 1, 0, 7, 1, 1],
+                  ["NRCH", "DISS", 1, 1, 0, 7, 2, 2]])
+        self.store.refresh()
+        self.conn.execute(""" DELETE FROM dataset WHERE rowid = 1 """)
+        self.conn.commit()
+        self.assertEqual(2, self.store.refresh())  # last rowid unchanged, but the count is not
+        self.assertEqual([1, 2], self.store.load("NRCH", "DISS")[1].tolist())
+
+        self.conn.execute(""" DELETE FROM dataset WHERE rowid = 2 """)
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 3, 3]])  # as many rows as before, one more at the end
+        self.assertEqual(2, self.store.refresh())
+        self.assertEqual([2, 3], self.store.load("NRCH", "DISS")[1].tolist())
+
+    def test_table_dropped_and_made_again(self):
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 0, 0], ["NRCH", "DISS", 1, 1, 0, 7, 1, 1]])
+        self.store.refresh()
+        self.conn.execute(""" DROP TABLE dataset """)
+        self.conn.execute(""" CREATE TABLE dataset (tpl_from text, tpl_to text, day_of_week integer, weekday integer,
+        off_peak integer, hour_of_day integer, delay integer, delay_change integer) """)
+        self.add([["NRCH", "DISS", 2, 1, 0, 9, 5, 5], ["NRCH", "DISS", 2, 1, 0, 9, 6, 6],
+                  ["NRCH", "DISS", 2, 1, 0, 9, 7, 7]])  # past the old table's last rowid
+        self.assertEqual(3, self.store.refresh())  # written again, not appended to the old table's rows
+        self.assertEqual([5, 6, 7], self.store.load("NRCH", "DISS")[1].tolist())
+
+    def test_ingested_file_removed(self):
+        self.conn.execute(""" CREATE TABLE ingest_manifest (hash text, table_name text, file text, rows integer,
+        status text, ingested_at text, PRIMARY KEY (hash, table_name)) """)
+        self.conn.execute(""" INSERT INTO ingest_manifest VALUES ('a', 'dataset', 'a.csv', 1, 'committed', '') """)
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 0, 0]])
+        self.store.refresh()
+        self.conn.execute(""" DELETE FROM ingest_manifest """)
+        self.conn.execute(""" INSERT INTO ingest_manifest VALUES ('b', 'dataset', 'b.csv', 1, 'committed', '') """)
+        self.conn.commit()
+        self.assertEqual(1, self.store.refresh())
+
+
+    def test_rewrite_into_new_folder(self):
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 0, 0], ["NRCH", "DISS", 1, 1, 0, 7, 1, 1]])
+        self.store.refresh()
+        old = [entry for entry in os.listdir(self.store.folder) if entry.startswith("rows-")]
+        self.conn.execute(""" DELETE FROM dataset WHERE rowid = 1 """)
+        self.conn.commit()
+        other = training_data.SegmentStore(self.store.folder, self.db_path)  # as another process would have
+        self.assertEqual(1, other.refresh())
+        self.assertEqual(0, self.store.refresh())  # already written again by the other store
+        self.assertEqual([1], self.store.load("NRCH", "DISS")[1].tolist())  # not added to the old rows
+        new = [entry for entry in os.listdir(self.store.folder) if entry.startswith("rows-")]
+        self.assertEqual(1, len(new))
+        self.assertNotEqual(old, new)
+
+    def test_refresh_waits_for_lock(self):
+        self.add([["NRCH", "DISS", 1, 1, 0, 7, 0, 0]])
+        lock = getattr(training_data, "_folder_lock")
+        with lock(self.store.folder):  # held as another process exporting would
+            refresh = threading.Thread(target=self.store.refresh)
+            refresh.start()
+            refresh.join(0.2)
+            self.assertTrue(refresh.is_alive())
+            self.assertIsNone(self.store.load("NRCH", "DISS"))
+        refresh.join()
+        self.assertEqual([0], self.store.load("NRCH", "DISS")[1].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()